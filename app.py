@@ -7,19 +7,13 @@ import tempfile
 import traceback
 import types
 import unicodedata
+import uuid
 import zipfile
 from pathlib import Path
 
-import folium
-import geopandas as gpd
 import numpy as np
 import streamlit as st
 import streamlit.components.v1 as components
-from netCDF4 import Dataset
-from shapely import wkb as shapely_wkb
-from shapely.geometry import box
-from shapely.prepared import prep
-from streamlit_folium import st_folium
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
 
@@ -29,8 +23,10 @@ if "organized" not in sys.modules:
     sys.modules["organized"] = organized_pkg
 
 from organized.config import settings
-from organized.scripts import clip_inputs, download_data
-from organized.scripts.wb import compute_pet, water_balance
+
+# geopandas, folium, netCDF4, shapely and the pipeline modules are imported inside the
+# functions that use them: every Streamlit rerun re-executes this file, and the landing
+# page should not wait for the GIS stack.
 
 IMAGE_EXT_RE = r"(?:png|jpg|jpeg|gif|svg)"
 TEMP_RESULT_KEYS = ("results_zip_path", "results_dashboard_path")
@@ -89,6 +85,10 @@ def safe_extract_zip(zip_path, extract_to):
 
 
 def load_uploaded_geometry(path):
+    import geopandas as gpd
+    from organized.scripts.wb import gis_env
+
+    gis_env.setup()
     gdf = gpd.read_file(path)
     if gdf.empty:
         raise ValueError("El archivo no contiene geometrías")
@@ -113,22 +113,24 @@ def render_geometry_map(gdf):
 
 
 def render_geometry_map_with_grid(gdf, grid_preview=None):
+    import folium
+    from streamlit_folium import st_folium
+
     gdf_proj = gdf.to_crs(epsg=3857)
     centroid = gdf_proj.geometry.centroid.to_crs(epsg=4326)
     m = folium.Map(location=[centroid.y.mean(), centroid.x.mean()], zoom_start=8)
     folium.GeoJson(gdf.__geo_interface__, name="Área de estudio").add_to(m)
 
-    if grid_preview and grid_preview.get("preview_cells"):
-        grid_layer = folium.FeatureGroup(name="Pixeles NC (preview)", show=True)
-        for y0, x0, y1, x1 in grid_preview["preview_cells"]:
-            folium.Rectangle(
-                bounds=[[y0, x0], [y1, x1]],
-                color="#2563eb",
-                weight=1,
-                fill=False,
-                opacity=0.45,
-            ).add_to(grid_layer)
-        grid_layer.add_to(m)
+    if grid_preview and grid_preview.get("touched_cells") and grid_preview.get("window_bounds"):
+        y0, x0, y1, x1 = grid_preview["window_bounds"]
+        folium.raster_layers.ImageOverlay(
+            image=grid_overlay_image(grid_preview["coverage"]),
+            bounds=[[y0, x0], [y1, x1]],
+            origin="upper",
+            mercator_project=True,
+            pixelated=True,
+            name="Pixeles NC (preview)",
+        ).add_to(m)
         folium.LayerControl(collapsed=True).add_to(m)
 
     minx, miny, maxx, maxy = gdf.total_bounds
@@ -163,6 +165,8 @@ def resolve_grid_nc_path(data_source):
 
 @st.cache_data(show_spinner=False)
 def load_grid_axes(nc_path):
+    from netCDF4 import Dataset
+
     with Dataset(nc_path, "r") as ds:
         if "lat" not in ds.variables or "lon" not in ds.variables:
             raise ValueError(f"Grid file sin ejes lat/lon: {nc_path}")
@@ -192,7 +196,10 @@ def centers_to_edges(axis):
 
 
 @st.cache_data(show_spinner=False)
-def compute_grid_preview(geometry_wkb, data_source, max_preview_cells=900):
+def compute_grid_preview(geometry_wkb, data_source):
+    import shapely
+    from shapely import wkb as shapely_wkb
+
     nc_path = resolve_grid_nc_path(data_source)
     if not nc_path:
         return {"error": f"No se encontró NetCDF de grilla para {data_source}."}
@@ -204,7 +211,7 @@ def compute_grid_preview(geometry_wkb, data_source, max_preview_cells=900):
     dlon = float(np.median(np.abs(np.diff(lon)))) if lon.size > 1 else 0.0
 
     geom = shapely_wkb.loads(geometry_wkb)
-    prepared = prep(geom)
+    shapely.prepare(geom)
     minx, miny, maxx, maxy = geom.bounds
 
     lat_mask = (lat_edges[:-1] <= maxy) & (lat_edges[1:] >= miny)
@@ -213,20 +220,17 @@ def compute_grid_preview(geometry_wkb, data_source, max_preview_cells=900):
     lon_idx = np.where(lon_mask)[0]
 
     bbox_cells = int(lat_idx.size * lon_idx.size)
-    touched_cells = 0
-    preview_cells = []
-
-    for i in lat_idx:
-        y0a, y1a = lat_edges[i], lat_edges[i + 1]
-        y0, y1 = (y0a, y1a) if y0a <= y1a else (y1a, y0a)
-        for j in lon_idx:
-            x0a, x1a = lon_edges[j], lon_edges[j + 1]
-            x0, x1 = (x0a, x1a) if x0a <= x1a else (x1a, x0a)
-            cell = box(x0, y0, x1, y1)
-            if prepared.intersects(cell):
-                touched_cells += 1
-                if len(preview_cells) < max_preview_cells:
-                    preview_cells.append((y0, x0, y1, x1))
+    coverage = np.zeros((lat_idx.size, lon_idx.size), dtype=bool)
+    window = None
+    if bbox_cells:
+        # One vectorised intersects() over every cell of the AOI bbox (axes are sorted ascending).
+        ys0, ys1 = lat_edges[lat_idx], lat_edges[lat_idx + 1]
+        xs0, xs1 = lon_edges[lon_idx], lon_edges[lon_idx + 1]
+        Y0, X0 = np.meshgrid(ys0, xs0, indexing="ij")
+        Y1, X1 = np.meshgrid(ys1, xs1, indexing="ij")
+        cells = shapely.box(X0.ravel(), Y0.ravel(), X1.ravel(), Y1.ravel())
+        coverage = shapely.intersects(geom, cells).reshape(coverage.shape)
+        window = (float(ys0[0]), float(xs0[0]), float(ys1[-1]), float(xs1[-1]))
 
     return {
         "source_nc": nc_path,
@@ -234,14 +238,39 @@ def compute_grid_preview(geometry_wkb, data_source, max_preview_cells=900):
         "grid_total_cells": int(lat.size * lon.size),
         "resolution_deg": (dlat, dlon),
         "bbox_cells": bbox_cells,
-        "touched_cells": touched_cells,
-        "preview_cells": preview_cells,
-        "preview_is_sampled": touched_cells > len(preview_cells),
+        "touched_cells": int(coverage.sum()),
+        "coverage": coverage,
+        "window_bounds": window,
     }
 
 
+def grid_overlay_image(coverage, max_px=2048, color=(37, 99, 235)):
+    """
+    RGBA image of the touched cells (north-up): light fill plus 1 px cell borders. The whole
+    coverage is drawn in one image, so the payload depends on max_px, not on the cell count.
+    """
+    nrow, ncol = coverage.shape
+    px = int(max(1, min(8, max_px // max(nrow, ncol, 1))))
+    cov = np.repeat(np.repeat(coverage[::-1], px, axis=0), px, axis=1)
+    img = np.zeros(cov.shape + (4,), dtype=np.uint8)
+    img[..., :3] = color
+    img[..., 3] = np.where(cov, 40, 0)
+    if px >= 3:
+        border = np.zeros(cov.shape, dtype=bool)
+        border[::px, :] = True
+        border[px - 1::px, :] = True
+        border[:, ::px] = True
+        border[:, px - 1::px] = True
+        img[..., 3] = np.where(cov & border, 115, img[..., 3])
+    return img
+
+
 def infer_data_source(gdf):
     """Infer best source by AOI overlap with known reference regions."""
+    import geopandas as gpd
+    from shapely.geometry import box
+    from organized.scripts.wb import geometry as region_geometry
+
     source_options = ["FODESNA", "FMPLPT"]
     target = geometry_union(gdf.geometry)
     if target.is_empty:
@@ -257,17 +286,9 @@ def infer_data_source(gdf):
     for code in source_options:
         ref_proj = None
         try:
-            shp_path = settings.REGIONS.get(code, {}).get("shapefile")
-            if shp_path and os.path.exists(shp_path):
-                ref = gpd.read_file(shp_path)
-                if not ref.empty and ref.crs is not None:
-                    if ref.crs.to_epsg() != 4326:
-                        ref = ref.to_crs("EPSG:4326")
-                    ref_geom = geometry_union(ref.geometry)
-                    if not ref_geom.is_empty:
-                        if not ref_geom.is_valid:
-                            ref_geom = ref_geom.buffer(0)
-                        ref_proj = gpd.GeoSeries([ref_geom], crs="EPSG:4326").to_crs(epsg=3857).iloc[0]
+            ref_geom = region_geometry.union(settings.current_registry().get(code, {}).get("shapefile"))
+            if ref_geom is not None and not ref_geom.is_empty:
+                ref_proj = gpd.GeoSeries([ref_geom], crs="EPSG:4326").to_crs(epsg=3857).iloc[0]
         except Exception:
             ref_proj = None
 
@@ -433,6 +454,29 @@ def set_temp_result_path(key, path):
     st.session_state[key] = path
 
 
+def session_scope():
+    """
+    Stable key of this user's regions: kept in the URL (?sesion=...), so a reload or a bookmarked
+    link reopens the same scope and, with FFLA_REGION_DB, reloads its regions from SQLite.
+    """
+    params = getattr(st, "query_params", None)
+    key = params.get("sesion") if params is not None else None
+    if not key or not re.fullmatch(r"[0-9a-f]{32}", key):
+        key = uuid.uuid4().hex
+        if params is not None:
+            params["sesion"] = key
+    return f"session-{key}"
+
+
+def session_registry():
+    """Region registry of this browser session, overlaying the configured regions."""
+    if "region_registry" not in st.session_state:
+        st.session_state["region_registry"] = settings.REGISTRY.session(
+            scope=session_scope(), db_path=settings.REGION_DB or None
+        )
+    return st.session_state["region_registry"]
+
+
 def cleanup_session_artifacts():
     for key in TEMP_RESULT_KEYS:
         path = st.session_state.get(key)
@@ -595,6 +639,8 @@ st.sidebar.subheader("📦 Datos Base")
 if st.sidebar.button("Descargar/Actualizar Datos Base"):
     with st.spinner("Descargando datos del repositorio (esto puede tardar)..."):
         try:
+            from organized.scripts import download_data
+
             download_data.run(base_dir=current_dir)
             st.sidebar.success("✅ Datos descargados/verificados.")
         except Exception as exc:
@@ -691,7 +737,6 @@ if mode == "Nueva Área de Interés (Subir SHP/GPKG)":
 
                         st.caption(
                             f"Fuente de grilla: `{grid_preview['source_nc']}`"
-                            + (" | El overlay muestra una muestra de celdas." if grid_preview["preview_is_sampled"] else "")
                         )
                         render_geometry_map_with_grid(gdf, grid_preview=grid_preview)
                     st.write("---")
@@ -719,9 +764,12 @@ if mode == "Nueva Área de Interés (Subir SHP/GPKG)":
                         progress_bar = st.progress(0)
                         status_text = st.empty()
                         region_code = None
-                        existing_region_codes = set(settings.REGIONS.keys())
+                        registry = session_registry()
 
                         try:
+                            from organized.scripts import clip_inputs
+                            from organized.scripts.wb import bias_correction, compute_pet, validation, water_balance
+
                             cleanup_session_artifacts()
                             region_label = region_name_clean or region_folder
                             output_root, output_root_warning = resolve_output_root(custom_out)
@@ -730,6 +778,14 @@ if mode == "Nueva Área de Interés (Subir SHP/GPKG)":
                             region_output_dir = os.path.join(output_root, region_folder)
                             os.makedirs(region_output_dir, exist_ok=True)
 
+                            status_text.text(f"Validando datos de {data_source_opt}...")
+                            report = validation.validate_sources(settings.BASE_DIR, data_source_opt)
+                            if report.warnings:
+                                st.warning("Advertencias en los datos de entrada:\n\n" + report.text("warn"))
+                            if not report.ok:
+                                raise ValueError("Datos de entrada inválidos:\n" + report.text("fail"))
+                            progress_bar.progress(10)
+
                             status_text.text(
                                 f"Recortando datos climáticos de {data_source_opt}... (Esto puede tardar unos minutos)"
                             )
@@ -741,13 +797,13 @@ if mode == "Nueva Área de Interés (Subir SHP/GPKG)":
                             )
                             progress_bar.progress(30)
 
-                            region_code = settings.add_dynamic_region(
+                            region_code = registry.add(
                                 region_label,
                                 region_inputs_dir,
                                 shp_path,
                                 output_path=region_output_dir,
                             )
-                            region_pair = [(region_inputs_dir, region_output_dir)]
+                            region_pair = bias_correction.run([(region_inputs_dir, region_output_dir)])
 
                             status_text.text("Calculando PET...")
                             compute_pet.run(region_pairs=region_pair)
@@ -760,7 +816,7 @@ if mode == "Nueva Área de Interés (Subir SHP/GPKG)":
                             status_text.text("Generando gráficos...")
                             from organized.scripts import generate_dashboard, generate_plots, generate_report
 
-                            generate_plots.run(region_codes=[region_code])
+                            generate_plots.run(region_codes=[region_code], registry=registry)
                             progress_bar.progress(85)
 
                             status_text.text("Generando reporte y dashboard...")
@@ -768,10 +824,12 @@ if mode == "Nueva Área de Interés (Subir SHP/GPKG)":
                                 data_source=data_source_opt,
                                 output_root=output_root,
                                 region_codes=[region_code],
+                                registry=registry,
                             )
                             doc_path = generate_report.create_document(
                                 specific_regions=[region_code],
                                 report_dir=output_root,
+                                registry=registry,
                             )
                             progress_bar.progress(95)
 
@@ -807,8 +865,8 @@ if mode == "Nueva Área de Interés (Subir SHP/GPKG)":
                             st.warning("Los cálculos parciales podrían haberse generado antes del error.")
                             st.code(traceback.format_exc())
                         finally:
-                            if region_code and region_code not in existing_region_codes:
-                                settings.REGIONS.pop(region_code, None)
+                            if region_code:
+                                registry.remove(region_code)
 
     if "results_zip_path" in st.session_state:
         st.write("---")
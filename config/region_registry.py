@@ -0,0 +1,140 @@
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+
+
+class RegionRegistry:
+    """
+    Thread-safe set of regions (code -> {"name", "path", "shapefile"[, "output_path"]}).
+
+    A session registry (see session()) overlays a parent: it sees the parent's regions, but the
+    regions it adds or removes are its own, so concurrent Streamlit sessions never touch each
+    other's entries. With db_path, a registry's own regions are also persisted in SQLite under
+    its scope and reloaded when a registry with the same scope is created again.
+    """
+
+    def __init__(self, regions=None, parent=None, scope="default", db_path=None, outputs_dir=None):
+        self._regions = regions if regions is not None else {}
+        self.parent = parent
+        self.scope = scope
+        self.db_path = db_path
+        self.outputs_dir = outputs_dir or (parent.outputs_dir if parent else None)
+        self._lock = threading.RLock()
+        if db_path:
+            self._load()
+
+    # --- SQLite backing -------------------------------------------------------------------
+    def _connect(self):
+        con = sqlite3.connect(self.db_path, timeout=30)
+        con.execute(
+            "CREATE TABLE IF NOT EXISTS regions (scope TEXT, code TEXT, name TEXT, path TEXT, "
+            "shapefile TEXT, output_path TEXT, PRIMARY KEY (scope, code))"
+        )
+        return con
+
+    def _load(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        with self._lock, self._connect() as con:
+            rows = con.execute(
+                "SELECT code, name, path, shapefile, output_path FROM regions WHERE scope = ?", (self.scope,)
+            ).fetchall()
+        for code, name, path, shp, out in rows:
+            info = {"name": name, "path": path, "shapefile": shp}
+            if out:
+                info["output_path"] = out
+            self._regions.setdefault(code, info)
+
+    def _persist(self, code, info):
+        if not self.db_path:
+            return
+        with self._connect() as con:
+            con.execute(
+                "INSERT OR REPLACE INTO regions VALUES (?, ?, ?, ?, ?, ?)",
+                (self.scope, code, info["name"], info["path"], info.get("shapefile"), info.get("output_path")),
+            )
+
+    def _forget(self, code):
+        if not self.db_path:
+            return
+        with self._connect() as con:
+            con.execute("DELETE FROM regions WHERE scope = ? AND code = ?", (self.scope, code))
+
+    # --- lookups --------------------------------------------------------------------------
+    def snapshot(self):
+        """Merged {code: info} copy (parent first, own regions override)."""
+        merged = self.parent.snapshot() if self.parent else {}
+        with self._lock:
+            merged.update({k: dict(v) for k, v in self._regions.items()})
+        return merged
+
+    def get(self, code, default=None):
+        with self._lock:
+            if code in self._regions:
+                return dict(self._regions[code])
+        return self.parent.get(code, default) if self.parent else default
+
+    def __contains__(self, code):
+        return self.get(code) is not None
+
+    def __getitem__(self, code):
+        info = self.get(code)
+        if info is None:
+            raise KeyError(code)
+        return info
+
+    def keys(self):
+        return list(self.snapshot().keys())
+
+    def iter(self, region_codes=None):
+        regions = self.snapshot()
+        if not region_codes:
+            return list(regions.items())
+        return [(code, regions[code]) for code in region_codes if code in regions]
+
+    def output_dir(self, code):
+        info = self[code]
+        if "output_path" in info:
+            return info["output_path"]
+        return os.path.join(self.outputs_dir, info["name"])
+
+    def input_dir(self, code):
+        return self[code]["path"]
+
+    def pairs(self, region_codes=None):
+        """[(input_dir, output_dir)] for the pipeline stages."""
+        return [(self.input_dir(code), self.output_dir(code)) for code, _ in self.iter(region_codes)]
+
+    # --- mutation -------------------------------------------------------------------------
+    def add(self, name, inputs_path, shapefile_path, output_path=None):
+        """Adds (or reuses) a region and returns its code. Codes are unique across parent and own regions."""
+        normalized_name = unicodedata.normalize("NFKD", (name or "").strip()).encode("ascii", "ignore").decode("ascii")
+        base_code = re.sub(r"[^A-Z0-9]+", "_", normalized_name.upper()).strip("_") or "REGION"
+        with self._lock:
+            region_code = base_code
+            suffix = 2
+            while True:
+                existing = self.get(region_code)
+                if existing is None or (
+                    existing.get("path") == inputs_path and existing.get("shapefile") == shapefile_path
+                ):
+                    break
+                region_code = f"{base_code}_{suffix}"
+                suffix += 1
+            info = {"name": name, "path": inputs_path, "shapefile": shapefile_path}
+            if output_path:
+                info["output_path"] = output_path
+            self._regions[region_code] = info
+            self._persist(region_code, info)
+        return region_code
+
+    def remove(self, code):
+        """Drops one of this registry's own regions (parent regions are never touched)."""
+        with self._lock:
+            if self._regions.pop(code, None) is not None:
+                self._forget(code)
+
+    def session(self, scope, db_path=None):
+        """Child registry for one user session, overlaying this one."""
+        return RegionRegistry(parent=self, scope=scope, db_path=db_path)
@@ -1,6 +1,8 @@
+import contextvars
 import os
-import re
-import unicodedata
+from contextlib import contextmanager
+
+from organized.config.region_registry import RegionRegistry
 
 
 BASE_DIR_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -28,38 +30,37 @@ REGIONS = {
     }
 }
 
+# Regions live in a RegionRegistry. REGISTRY wraps REGIONS (the process-wide defaults, still
+# readable directly); sessions get child registries via REGISTRY.session(...) and activate them
+# with use_registry() so iter_regions/get_region_* resolve against the caller's own regions.
+REGION_DB = os.environ.get("FFLA_REGION_DB", "")
+REGISTRY = RegionRegistry(REGIONS, outputs_dir=OUTPUTS_DIR)
+_active_registry = contextvars.ContextVar("active_region_registry", default=None)
+
+
+def current_registry():
+    return _active_registry.get() or REGISTRY
+
+
+@contextmanager
+def use_registry(registry):
+    """Makes registry the one seen by settings.iter_regions/get_region_* in this thread/context."""
+    registry = registry or current_registry()
+    token = _active_registry.set(registry)
+    try:
+        yield registry
+    finally:
+        _active_registry.reset(token)
+
+
 def add_dynamic_region(name, inputs_path, shapefile_path, output_path=None):
-    """Dynamically adds a new region to the configuration."""
-    normalized_name = unicodedata.normalize("NFKD", (name or "").strip()).encode("ascii", "ignore").decode("ascii")
-    base_code = re.sub(r"[^A-Z0-9]+", "_", normalized_name.upper()).strip("_") or "REGION"
-    region_code = base_code
-    suffix = 2
-    while (
-        region_code in REGIONS
-        and (
-            REGIONS[region_code].get("path") != inputs_path
-            or REGIONS[region_code].get("shapefile") != shapefile_path
-        )
-    ):
-        region_code = f"{base_code}_{suffix}"
-        suffix += 1
-
-    REGIONS[region_code] = {
-        "name": name,
-        "path": inputs_path,
-        "shapefile": shapefile_path
-    }
-    if output_path:
-        REGIONS[region_code]["output_path"] = output_path
-    return region_code
+    """Dynamically adds a new region to the active registry."""
+    return current_registry().add(name, inputs_path, shapefile_path, output_path=output_path)
 
 
 def iter_regions(region_codes=None):
     """Iterates configured regions, optionally filtered by codes."""
-    if not region_codes:
-        return list(REGIONS.items())
-    return [(code, REGIONS[code]) for code in region_codes if code in REGIONS]
-
+    return current_registry().iter(region_codes)
 
 DOMAINS = [
     "historical_ecuador",
@@ -76,6 +77,115 @@ PERIOD_START = 1980
 PERIOD_END = 2100
 BASE_PERIOD = (1981, 2010)
 
+# Analysis windows (start_year, end_year) used for window statistics, bars and maps.
+WINDOWS = {
+    "base": BASE_PERIOD,
+    "cercano": (2021, 2050),
+    "medio": (2041, 2070),
+    "tardio": (2071, 2100),
+}
+# The map deliverables use a shorter near-term window (files *_cercano_2021-2040).
+MAP_WINDOWS = dict(WINDOWS, cercano=(2021, 2040))
+
+
+# Storage of derived products (pet_*, wb_*, wb_agg_*):
+#   "float64" (default, as before), "float32", or "int16" (CF scale_factor/add_offset packing).
+# LEAN_WB drops wb_mmday from wb_<dom>.nc; readers rebuild it as P - PET.
+STORAGE_PROFILE = os.environ.get("FFLA_STORAGE_PROFILE", "float64")
+LEAN_WB = os.environ.get("FFLA_LEAN_WB", "").lower() in ("1", "true", "yes")
+
+# Shared dataset pool used by the plotting stage (scripts/wb/datasets.py).
+DATASET_POOL_MAX_HANDLES = 16
+DATASET_POOL_MAX_MB = 4096
+DATASET_CHUNKS = {"time": 3650}
+
+# Region boundaries (scripts/wb/geometry.py): persisted WKB cache and outline simplification
+# tolerance as a fraction of the grid spacing.
+GEOMETRY_CACHE_DIR = os.path.join(DERIVED_DIR, "geometry_cache")
+GEOMETRY_SIMPLIFY_FRACTION = 0.25
+
+# SPI/SPEI (scripts/wb/drought_indices.py): accumulation scales in months and the
+# index value below which a cell counts as in drought.
+DROUGHT_SCALES = (1, 3, 6, 12)
+DROUGHT_THRESHOLD = -1.0
+
+# PET (scripts/wb/pet_methods.py): hargreaves, oudin, thornthwaite or penman_monteith
+# (the latter needs rsds/sfcWind/hurs inputs). PET_MULTI also stores every available method
+# and their spread in pet_<dom>.nc. Penman-Monteith reads the elevation from orog_<dom>.nc /
+# orog.nc when present; otherwise PET_ELEVATION_M (m) is used for the whole grid.
+PET_METHOD = os.environ.get("FFLA_PET_METHOD", "hargreaves").lower()
+PET_MULTI = os.environ.get("FFLA_PET_MULTI", "").lower() in ("1", "true", "yes")
+PET_BLOCK_DAYS = 3650
+PET_ELEVATION_M = float(os.environ.get("FFLA_PET_ELEVATION_M", "0"))
+
+# Multi-model ensembles: scenario folders may hold one sub-folder per GCM
+# (<dom>/<model>/*.nc). Members are processed in parallel and summarised as quantile bands.
+ENSEMBLE_WORKERS = int(os.environ.get("FFLA_ENSEMBLE_WORKERS", "2"))
+ENSEMBLE_QUANTILES = (0.1, 0.5, 0.9)
+
+# Optional bias correction before PET (scripts/wb/bias_correction.py): "eqm", "qdm" or "" (off).
+# The reference (observations on the region grid) is read from BIAS_REFERENCE_DIR or <inputs>/reference.
+BIAS_CORRECTION = os.environ.get("FFLA_BIAS_CORRECTION", "").lower()
+BIAS_REFERENCE_DIR = os.environ.get("FFLA_BIAS_REFERENCE_DIR", "")
+BIAS_QUANTILES = 100
+BIAS_BLOCK_YEARS = 30
+BIAS_BLOCK_MB = 512
+
+# ETCCDI extremes (scripts/wb/climate_extremes.py): memory budget per latitude band.
+EXTREMES_BLOCK_MB = 512
+
+# Time aggregation kernel (scripts/wb/aggregation.py): memory budget per latitude band.
+AGG_BLOCK_MB = int(os.environ.get("FFLA_AGG_BLOCK_MB", "512"))
+
+# Hot-loop kernels (scripts/wb/kernels.py): "auto" uses numba when installed, else NumPy.
+KERNEL_BACKEND = os.environ.get("FFLA_KERNEL_BACKEND", "auto").lower()
+
+# Background I/O of compute_pet/water_balance (scripts/wb/prefetch.py): items read ahead and
+# outputs queued for writing; 0 runs them inline.
+PREFETCH_DEPTH = int(os.environ.get("FFLA_PREFETCH_DEPTH", "1"))
+WRITE_QUEUE_DEPTH = int(os.environ.get("FFLA_WRITE_QUEUE_DEPTH", "1"))
+
+# Opt-in working cache (scripts/wb/working_cache.py): the WB stage also writes raw float32
+# .npy copies of the daily cubes, which the plot stage memmaps instead of decompressing
+# wb_<dom>.nc. Empty WORKING_CACHE_DIR = system temp dir. Removed when plotting ends.
+WORKING_CACHE = os.environ.get("FFLA_WORKING_CACHE", "").lower() in ("1", "true", "yes")
+WORKING_CACHE_DIR = os.environ.get("FFLA_WORKING_CACHE_DIR", "")
+WORKING_CACHE_MB = int(os.environ.get("FFLA_WORKING_CACHE_MB", "16384"))
+
+# Batch mode (scripts/batch_regions.py): many AOIs from one multi-feature GeoPackage.
+# Inputs are clipped once to the union footprint; plotting fans out over BATCH_WORKERS processes.
+BATCH_WORKERS = int(os.environ.get("FFLA_BATCH_WORKERS", "2"))
+BATCH_UNION_DIR = "_union"
+
+# Zonal tables (scripts/wb/zonal_stats.py): polygon layer (e.g. parishes) and the attribute naming
+# each polygon. Empty layer -> the features of each region's own shapefile.
+ZONAL_POLYGONS = os.environ.get("FFLA_ZONAL_POLYGONS", "")
+ZONAL_ID_FIELD = os.environ.get("FFLA_ZONAL_ID_FIELD", "")
+
+# Period raster export (scripts/wb/export_wb_tifs_periodos.py): Cloud-Optimised GeoTIFF tile size,
+# parallel writers, and whether to add one multi-band stack per variable (band = scenario/period).
+COG_BLOCKSIZE = 512
+COG_WORKERS = int(os.environ.get("FFLA_COG_WORKERS", "4"))
+COG_STACKS = True
+
+# Input validation (scripts/wb/validation.py): time block streamed per read and parallel domains.
+VALIDATION_BLOCK_DAYS = 3650
+VALIDATION_WORKERS = int(os.environ.get("FFLA_VALIDATION_WORKERS", "4"))
+
+# Key numbers (scripts/wb/key_metrics.py): regions computed in parallel processes.
+KEY_METRICS_WORKERS = int(os.environ.get("FFLA_KEY_METRICS_WORKERS", "2"))
+
+# Trends (scripts/wb/trend_analysis.py): significance level, minimum valid years per cell and the
+# memory budget of one block of cells (all year pairs of a block are held at once).
+TREND_ALPHA = float(os.environ.get("FFLA_TREND_ALPHA", "0.05"))
+TREND_MIN_YEARS = 10
+TREND_BLOCK_MB = int(os.environ.get("FFLA_TREND_BLOCK_MB", "256"))
+
+# Time of emergence (scripts/wb/time_of_emergence.py): the smoothed signal must stay beyond
+# TOE_K standard deviations of the base period; TOE_SMOOTH_YEARS is the moving-mean window.
+TOE_K = float(os.environ.get("FFLA_TOE_K", "2.0"))
+TOE_SMOOTH_YEARS = int(os.environ.get("FFLA_TOE_SMOOTH_YEARS", "11"))
+
 
 PALETTE = {
     "historical_ecuador": "k",
@@ -86,14 +196,11 @@ PALETTE = {
 
 def get_region_output_dir(region_code):
     """Returns the output directory for a region (derived data + figures). All writes go here."""
-
-    if "output_path" in REGIONS[region_code]:
-         return REGIONS[region_code]["output_path"]
-    return os.path.join(OUTPUTS_DIR, REGIONS[region_code]["name"])
+    return current_registry().output_dir(region_code)
 
 def get_region_input_dir(region_code):
     """Returns the input directory for a region (read-only: pr, tas, shapefiles)."""
-    return REGIONS[region_code]["path"]
+    return current_registry().input_dir(region_code)
 
 
 OUT_CAT_SERIES_TEMP = "01_Series_Temporales_Temperatura"
@@ -120,6 +227,10 @@ OUT_CAT_MAPAS_DELTA_SSP126 = "21_Mapas_Mensuales_Delta_SSP126"
 OUT_CAT_MAPAS_DELTA_SSP370 = "22_Mapas_Mensuales_Delta_SSP370"
 OUT_CAT_MAPAS_DELTA_SSP585 = "23_Mapas_Mensuales_Delta_SSP585"
 OUT_CAT_RESUMEN = "24_Resumen_Ejecutivo"
+OUT_CAT_INDICES_SEQUIA = "25_Indices_Sequia_SPI_SPEI"
+OUT_CAT_EXTREMOS = "26_Extremos_Climaticos_ETCCDI"
+OUT_CAT_TENDENCIAS = "27_Tendencias_Mann_Kendall"
+OUT_CAT_EMERGENCIA = "28_Tiempo_de_Emergencia"
 
 def fig_path(output_dir, category, filename):
     """Path for a figure: output_dir/category/filename. Creates parent dir if needed."""
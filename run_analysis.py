@@ -16,11 +16,11 @@ if parent_dir not in sys.path:
     sys.path.insert(0, parent_dir)
 
 from organized.config import settings
-from organized.scripts import generate_report, perform_analysis, generate_plots, generate_dashboard
 
 def run_calculations():
     """Run data processing and calculations."""
     print("\nStarting calculations...")
+    from organized.scripts import perform_analysis
     try:
         perform_analysis.run()
     except Exception as e:
@@ -30,6 +30,7 @@ def run_calculations():
 def run_plotting():
     """Generate figures from computed data."""
     print("\nStarting figure generation...")
+    from organized.scripts import generate_plots
     try:
         generate_plots.run()
     except Exception as e:
@@ -39,6 +40,7 @@ def run_plotting():
 def run_organize():
     """Generate dashboard (figures already in outputs/ by default)."""
     print("\nGenerating dashboard...")
+    from organized.scripts import generate_dashboard
     try:
         generate_dashboard.run()
     except Exception as e:
@@ -48,6 +50,7 @@ def run_organize():
 def run_report():
     """Generate Word document report from figures."""
     print("\nStarting report generation...")
+    from organized.scripts import generate_report
     try:
         generate_report.create_document()
     except Exception as e:
@@ -62,6 +65,10 @@ def main():
     parser.add_argument("--organize", action="store_true", help="Generate dashboard (figures are already in outputs/)")
     parser.add_argument("--report", action="store_true", help="Generate Word document report from figures")
     parser.add_argument("--all", action="store_true", help="Run ALL steps: Compute -> Plot -> Organize -> Report")
+    parser.add_argument("--batch", metavar="GPKG", default=None, help="Run clip -> PET -> WB -> plots for every feature of a GeoPackage")
+    parser.add_argument("--name-field", default=None, help="(--batch) attribute holding the AOI name")
+    parser.add_argument("--data-source", default=None, choices=["FODESNA", "FMPLPT"], help="(--batch) national data source")
+    parser.add_argument("--workers", type=int, default=None, help="(--batch) parallel plotting processes")
 
     args = parser.parse_args()
 
@@ -69,6 +76,17 @@ def main():
         parser.print_help()
         return
 
+    if args.batch:
+        print("\nStarting batch run...")
+        from organized.scripts import batch_regions
+        try:
+            batch_regions.run(args.batch, name_field=args.name_field, data_source=args.data_source,
+                              workers=args.workers, dashboard=args.organize or args.all)
+        except Exception as e:
+            print(f"❌ Error during batch run: {e}")
+            raise
+        return
+
     if args.compute or args.all:
         run_calculations()
 
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Batch mode: runs the pipeline for every feature of a multi-feature GeoPackage (one AOI per feature).
+
+Work shared by the AOIs is done once:
+1. Each national file is read once and clipped to the union footprint of all AOIs.
+2. Bias correction, PET and water balance run once on the union grid.
+3. Inputs and WB products are sliced per AOI with a cell mask computed once per AOI.
+4. Plotting fans out over the AOIs in parallel processes.
+"""
+
+import argparse
+import glob
+import os
+import re
+import sys
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import xarray as xr
+import geopandas as gpd
+import rioxarray
+from shapely.geometry import mapping
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
+
+from organized.config import settings
+from organized.scripts import clip_inputs
+from organized.scripts.wb import bias_correction, compute_pet, water_balance, storage
+
+
+def _safe_name(name, default="aoi"):
+    normalized = unicodedata.normalize("NFKD", str(name or "")).encode("ascii", "ignore").decode("ascii")
+    safe = re.sub(r"[^A-Za-z0-9_-]+", "_", normalized).strip("._-")
+    return safe or default
+
+
+def load_aois(gpkg_path, name_field=None, layer=None):
+    """
+    One (name, folder, GeoDataFrame) per feature, in EPSG:4326. Names come from name_field,
+    or the first text column, or the feature index.
+    """
+    gdf = clip_inputs._load_region_gdf(gpkg_path, layer=layer)
+    invalid = ~gdf.geometry.is_valid
+    if invalid.any():
+        gdf = gdf.copy()
+        gdf.loc[invalid, "geometry"] = gdf.geometry[invalid].buffer(0)
+    if name_field is None:
+        text = [c for c in gdf.columns if c != gdf.geometry.name and gdf[c].dtype == object]
+        name_field = text[0] if text else None
+    elif name_field not in gdf.columns:
+        raise ValueError(f"Campo '{name_field}' no existe en {os.path.basename(gpkg_path)}")
+
+    aois, seen = [], set()
+    for i, (idx, row) in enumerate(gdf.iterrows()):
+        name = str(row[name_field]) if name_field and row[name_field] is not None else f"aoi_{i + 1}"
+        folder = base = _safe_name(name, default=f"aoi_{i + 1}")
+        n = 2
+        while folder in seen:
+            folder = f"{base}_{n}"
+            n += 1
+        seen.add(folder)
+        aois.append((name, folder, gdf.loc[[idx], [gdf.geometry.name]]))
+    return aois
+
+
+def clip_union(union_gdf, union_inputs, source_dir=None, data_source=None):
+    """Reads every national file once, clipped to the union footprint of all AOIs."""
+    source_dir = source_dir or settings.BASE_DIR
+    search_dirs = clip_inputs.source_search_dirs(source_dir, data_source)
+    count = 0
+    for dom in settings.DOMAINS:
+        dom_src = clip_inputs.find_domain_source(dom, search_dirs)
+        if not dom_src:
+            print(f"  ⚠️  Source domain dir not found for '{dom}'")
+            continue
+        for f in sorted(glob.glob(os.path.join(dom_src, "*.nc"))):
+            if clip_inputs.clip_nc_file(f, os.path.join(union_inputs, dom), union_gdf):
+                count += 1
+    return count
+
+
+def _grid_of(path):
+    with xr.open_dataset(path) as ds:
+        if "lat" not in ds.dims or "lon" not in ds.dims:
+            return None
+        return ds["lat"].values, ds["lon"].values
+
+
+def aoi_masks(lat, lon, aois):
+    """
+    {folder: (lat values, lon values, bool mask)} on the union grid. Uses the same all_touched
+    rule as clip_inputs, evaluated once per AOI on a 2-D template instead of once per file.
+    """
+    t = xr.DataArray(np.ones((lat.size, lon.size), dtype="float32"),
+                     coords={"lat": lat, "lon": lon}, dims=("lat", "lon"))
+    t = t.rio.write_crs("EPSG:4326")
+    t.rio.set_spatial_dims("lon", "lat", inplace=True)
+    out = {}
+    for name, folder, g in aois:
+        try:
+            c = t.rio.clip(g.geometry.apply(mapping), g.crs, drop=True, all_touched=True)
+        except Exception as e:
+            print(f"  ⚠️ {name}: sin celdas en la malla ({e})")
+            continue
+        out[folder] = (c["lat"].values, c["lon"].values, np.isfinite(c.values))
+    return out
+
+
+def slice_file(src, dst, sel, outputs=False):
+    """Writes the AOI window of src (cells outside the AOI set to NaN) to dst."""
+    lat, lon, mask = sel
+    with xr.open_dataset(src) as ds:
+        sub = ds.sel(lat=lat, lon=lon)
+        m = xr.DataArray(mask, coords={"lat": lat, "lon": lon}, dims=("lat", "lon"))
+        for v in list(sub.data_vars):
+            if {"lat", "lon"} <= set(sub[v].dims):
+                sub[v] = sub[v].where(m).assign_attrs(sub[v].attrs)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        if outputs:
+            storage.to_netcdf(sub, dst)
+        else:
+            sub.to_netcdf(dst, encoding={v: {"zlib": True, "complevel": 4} for v in sub.data_vars})
+
+
+def _nc_files(root):
+    """Relative paths of the per-domain NetCDF files under root (members included)."""
+    out = []
+    for dom in settings.DOMAINS:
+        for d, _, files in os.walk(os.path.join(root, dom)):
+            out += [os.path.relpath(os.path.join(d, f), root) for f in sorted(files) if f.endswith(".nc")]
+    return out
+
+
+def slice_tree(src_root, aois, dst_roots, outputs=False, grid_masks=None):
+    """Slices every file under src_root for every AOI; masks are computed once per grid and reused."""
+    grid_masks = {} if grid_masks is None else grid_masks
+    for rel in _nc_files(src_root):
+        src = os.path.join(src_root, rel)
+        grid = _grid_of(src)
+        if grid is None:
+            continue
+        key = (grid[0].tobytes(), grid[1].tobytes())
+        if key not in grid_masks:
+            grid_masks[key] = aoi_masks(grid[0], grid[1], aois)
+        for folder, sel in grid_masks[key].items():
+            try:
+                slice_file(src, os.path.join(dst_roots[folder], rel), sel, outputs=outputs)
+            except Exception as e:
+                print(f"  ❌ Error slicing {rel} for {folder}: {e}")
+    return grid_masks
+
+
+def _plot_aoi(name, inputs_dir, shp, output_dir):
+    import matplotlib
+    matplotlib.use("Agg")
+    from organized.scripts import generate_plots
+    code = settings.add_dynamic_region(name, inputs_dir, shp, output_path=output_dir)
+    generate_plots.run(region_codes=[code])
+    return code
+
+
+def run(gpkg_path, name_field=None, layer=None, data_source=None, source_dir=None,
+        output_root=None, workers=None, plots=True, dashboard=False):
+    """
+    Processes every AOI of gpkg_path and registers each one as a dynamic region.
+    Returns the list of region codes.
+    """
+    batch = _safe_name(os.path.splitext(os.path.basename(gpkg_path))[0], default="batch")
+    inputs_root = os.path.join(settings.INPUTS_DIR, batch)
+    output_root = output_root or os.path.join(settings.OUTPUTS_DIR, batch)
+
+    print("\nSTARTING BATCH PIPELINE")
+    print("="*80)
+    aois = load_aois(gpkg_path, name_field=name_field, layer=layer)
+    print(f"  {len(aois)} AOIs in {os.path.basename(gpkg_path)} -> {output_root}")
+    if not aois:
+        return []
+
+    union_in = os.path.join(inputs_root, settings.BATCH_UNION_DIR)
+    union_out = os.path.join(output_root, settings.BATCH_UNION_DIR)
+    shapes = gpd.GeoSeries([g.geometry.iloc[0] for _, _, g in aois], crs="EPSG:4326")
+    union = shapes.union_all() if hasattr(shapes, "union_all") else shapes.unary_union
+    union_gdf = gpd.GeoDataFrame(geometry=[union], crs="EPSG:4326")
+    print(f"\n✂️  Clipping national inputs to the union of {len(aois)} AOIs...")
+    n = clip_union(union_gdf, union_in, source_dir=source_dir, data_source=data_source)
+    print(f"✨ {n} files clipped once for the whole batch.")
+
+    union_pair = bias_correction.run([(union_in, union_out)])
+    compute_pet.run(region_pairs=union_pair)
+    water_balance.run(region_pairs=union_pair)
+
+    print("\n" + "="*60)
+    print("SLICING UNION PRODUCTS PER AOI")
+    print("="*60)
+    in_dirs = {folder: os.path.join(inputs_root, folder) for _, folder, _ in aois}
+    out_dirs = {folder: os.path.join(output_root, folder) for _, folder, _ in aois}
+    grid_masks = slice_tree(union_in, aois, in_dirs)
+    slice_tree(union_out, aois, out_dirs, outputs=True, grid_masks=grid_masks)
+
+    jobs, codes = [], []
+    for name, folder, g in aois:
+        if not os.path.isdir(out_dirs[folder]):
+            continue
+        shp = os.path.join(out_dirs[folder], "aoi.gpkg")
+        g.to_file(shp, driver="GPKG")
+        codes.append(settings.add_dynamic_region(name, in_dirs[folder], shp, output_path=out_dirs[folder]))
+        jobs.append((name, in_dirs[folder], shp, out_dirs[folder]))
+    print(f"  ✅ {len(jobs)} AOIs ready")
+
+    if plots and jobs:
+        workers = max(1, min(workers or settings.BATCH_WORKERS, len(jobs)))
+        print(f"\nPlotting {len(jobs)} AOIs ({workers} workers)")
+        if workers == 1:
+            for job in jobs:
+                _plot_aoi(*job)
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as ex:
+                futures = {ex.submit(_plot_aoi, *job): job[0] for job in jobs}
+                for fut, name in futures.items():
+                    try:
+                        fut.result()
+                    except Exception as e:
+                        print(f"  ❌ Error plotting {name}: {e}")
+
+    if dashboard and codes:
+        from organized.scripts import generate_dashboard
+        generate_dashboard.run(data_source=data_source, output_root=output_root, region_codes=codes)
+
+    print("\n" + "="*80)
+    print("BATCH COMPLETED")
+    print("="*80 + "\n")
+    return codes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch pipeline for a multi-feature GeoPackage (one AOI per feature)")
+    parser.add_argument("gpkg", help="GeoPackage (or any vector file) with one feature per AOI")
+    parser.add_argument("--name-field", default=None, help="Attribute holding the AOI name")
+    parser.add_argument("--layer", default=None, help="Layer to read from the GeoPackage")
+    parser.add_argument("--data-source", default=None, choices=["FODESNA", "FMPLPT"], help="National data source")
+    parser.add_argument("--out", default=None, help="Output root (default outputs/<gpkg name>)")
+    parser.add_argument("--workers", type=int, default=None, help="Parallel plotting processes")
+    parser.add_argument("--no-plots", action="store_true", help="Stop after slicing the WB products")
+    parser.add_argument("--dashboard", action="store_true", help="Build one dashboard covering every AOI")
+    args = parser.parse_args()
+    run(args.gpkg, name_field=args.name_field, layer=args.layer, data_source=args.data_source,
+        output_root=args.out, workers=args.workers, plots=not args.no_plots, dashboard=args.dashboard)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Import-time benchmark for the CLI / app entry points.
+
+Each target is imported in a fresh interpreter with `python -X importtime`. The cumulative time
+of the target module is compared with the stored baseline, and regressions above
+TOLERANCE (and MIN_DELTA_MS) are reported. The exit status is 1 when any target regressed.
+
+    python scripts/bench_imports.py            # compare against the baseline
+    python scripts/bench_imports.py --save     # record a new baseline
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TARGETS = [
+    "organized.config.settings",
+    "organized.run_analysis",
+    "organized.scripts.generate_plots",
+    "organized.scripts.perform_analysis",
+    "organized.scripts.clip_inputs",
+    "organized.scripts.wb.compute_pet",
+    "organized.scripts.wb.plot_wb_maps_windows",
+]
+BASELINE = os.path.join(ROOT, "data", "derived", "import_times.json")
+TOLERANCE = 1.25
+MIN_DELTA_MS = 50.0
+
+# Mirrors app.py: the repository folder is importable as the "organized" package whatever its name.
+_BOOT = (
+    "import sys, types; p = types.ModuleType('organized'); p.__path__ = [{root!r}]; "
+    "sys.modules['organized'] = p; import {target}"
+)
+
+
+def measure(target, repeat=3):
+    """Median cumulative import time of target in ms over `repeat` fresh interpreters, or None."""
+    runs = []
+    for _ in range(repeat):
+        code = _BOOT.format(root=ROOT, target=target)
+        res = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                             capture_output=True, text=True, cwd=ROOT)
+        if res.returncode != 0:
+            print(f"  ❌ {target}: {res.stderr.strip().splitlines()[-1] if res.stderr.strip() else 'import failed'}")
+            return None
+        cumulative = None
+        for line in res.stderr.splitlines():
+            if not line.startswith("import time:"):
+                continue
+            parts = [x.strip() for x in line[len("import time:"):].split("|")]
+            if len(parts) == 3 and parts[2] == target:
+                cumulative = int(parts[1]) / 1000.0
+        if cumulative is not None:
+            runs.append(cumulative)
+    return statistics.median(runs) if runs else None
+
+
+def run(targets=None, save=False, repeat=3, baseline_path=BASELINE):
+    targets = targets or TARGETS
+    print("\n" + "="*60)
+    print("IMPORT-TIME BENCHMARK")
+    print("="*60)
+    baseline = {}
+    if os.path.exists(baseline_path):
+        with open(baseline_path, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    results, regressions = {}, []
+    for t in targets:
+        ms = measure(t, repeat)
+        if ms is None:
+            continue
+        results[t] = round(ms, 1)
+        ref = baseline.get(t)
+        if ref is None:
+            print(f"  {t:<48} {ms:8.1f} ms")
+            continue
+        flag = ""
+        if ms > ref * TOLERANCE and ms - ref > MIN_DELTA_MS:
+            regressions.append(t)
+            flag = "  ⚠️ REGRESSION"
+        print(f"  {t:<48} {ms:8.1f} ms  (baseline {ref:.1f} ms, {ms / ref:4.2f}x){flag}")
+
+    if save:
+        os.makedirs(os.path.dirname(baseline_path), exist_ok=True)
+        with open(baseline_path, "w", encoding="utf-8") as f:
+            json.dump(dict(baseline, **results), f, indent=2, sort_keys=True)
+        print(f"✅ Baseline saved: {baseline_path}")
+    elif regressions:
+        print(f"❌ {len(regressions)} import-time regression(s): {', '.join(regressions)}")
+    else:
+        print("✅ No import-time regressions")
+    return results, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time benchmark for the pipeline entry points")
+    parser.add_argument("targets", nargs="*", help="Modules to measure (default: entry points)")
+    parser.add_argument("--save", action="store_true", help="Store the measurements as the new baseline")
+    parser.add_argument("--repeat", type=int, default=3, help="Fresh interpreters per target (median)")
+    args = parser.parse_args()
+    _, regressions = run(args.targets, save=args.save, repeat=args.repeat)
+    sys.exit(1 if regressions and not args.save else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,9 +5,11 @@ import geopandas as gpd
 import rioxarray
 from shapely.geometry import mapping
 from organized.config import settings
+from organized.scripts.wb import gis_env
 
-def _load_region_gdf(shapefile_path):
-    gdf = gpd.read_file(shapefile_path)
+def _load_region_gdf(shapefile_path, layer=None):
+    gis_env.setup()
+    gdf = gpd.read_file(shapefile_path, layer=layer) if layer else gpd.read_file(shapefile_path)
     if gdf.empty:
         raise ValueError("Shapefile sin geometrías")
     if gdf.crs is None:
@@ -66,6 +68,41 @@ def clip_nc_file(nc_path, out_path_base, gdf, var_name=None):
         print(f"  ❌ Error clipping {os.path.basename(nc_path)}: {e}")
         return False
 
+def source_search_dirs(source_dir, data_source=None):
+    """Candidate folders holding national <dom>/ subfolders for a data source."""
+    if data_source == "FODESNA":
+        return [
+            os.path.join(source_dir, "inputs", "FODESNA"),
+            os.path.join(source_dir, "FODESNA"),
+            os.path.join(source_dir, "inputs"),
+        ]
+    if data_source == "FMPLPT":
+        return [
+            os.path.join(source_dir, "inputs", "FMPLPT"),
+            os.path.join(source_dir, "FMPLPT"),
+            os.path.join(source_dir, "inputs", "FDAT"),
+            os.path.join(source_dir, "FDAT"),
+        ]
+    return [
+        source_dir,
+        os.path.join(source_dir, "inputs"),
+        os.path.join(source_dir, "inputs", "FODESNA"),
+        os.path.join(source_dir, "inputs", "FMPLPT"),
+        os.path.join(source_dir, "inputs", "FDAT"),
+        os.path.join(source_dir, "FODESNA"),
+        os.path.join(source_dir, "FMPLPT"),
+        os.path.join(source_dir, "FDAT"),
+    ]
+
+
+def find_domain_source(dom, search_dirs):
+    for base in search_dirs:
+        p = os.path.join(base, dom)
+        if os.path.exists(p):
+            return p
+    return None
+
+
 def process_region(region_name, shapefile_path, source_dir=None, data_source=None):
     """
     Creates input files for a new region by clipping national data.
@@ -86,51 +123,13 @@ def process_region(region_name, shapefile_path, source_dir=None, data_source=Non
     count = 0
     gdf = _load_region_gdf(shapefile_path)
 
-
-    if "GDAL_DATA" not in os.environ:
-        try:
-            import fiona
-            os.environ["GDAL_DATA"] = fiona.datadir
-        except Exception:
-            pass
-
-
-    if data_source == "FODESNA":
-        search_dirs = [
-            os.path.join(source_dir, "inputs", "FODESNA"),
-            os.path.join(source_dir, "FODESNA"),
-            os.path.join(source_dir, "inputs"),
-        ]
-    elif data_source == "FMPLPT":
-        search_dirs = [
-            os.path.join(source_dir, "inputs", "FMPLPT"),
-            os.path.join(source_dir, "FMPLPT"),
-            os.path.join(source_dir, "inputs", "FDAT"),
-            os.path.join(source_dir, "FDAT"),
-        ]
-    else:
-
-        search_dirs = [
-            source_dir,
-            os.path.join(source_dir, "inputs"),
-            os.path.join(source_dir, "inputs", "FODESNA"),
-            os.path.join(source_dir, "inputs", "FMPLPT"),
-            os.path.join(source_dir, "inputs", "FDAT"),
-            os.path.join(source_dir, "FODESNA"),
-            os.path.join(source_dir, "FMPLPT"),
-            os.path.join(source_dir, "FDAT"),
-        ]
+    search_dirs = source_search_dirs(source_dir, data_source)
 
     for dom in settings.DOMAINS:
         found_domain = False
 
 
-        dom_src = None
-        for base in search_dirs:
-            p = os.path.join(base, dom)
-            if os.path.exists(p):
-                dom_src = p
-                break
+        dom_src = find_domain_source(dom, search_dirs)
 
         if not dom_src:
             print(f"  ⚠️  Source domain dir not found for '{dom}' (checked FDAT/FODESNA/root)")
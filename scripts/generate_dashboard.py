@@ -102,21 +102,13 @@ def fmt_number(value, decimals=1, signed=False, suffix=""):
     return f"{fmt.format(num)}{suffix}"
 
 
-def _annual_sum_spatial_mean(ds, monthly_var):
-    if xr is None or np is None or monthly_var not in ds.data_vars:
+def _annual_series(ds, name):
+    if ds is None or name not in ds.data_vars:
         return [], []
 
-    da = ds[monthly_var]
-    if "time" not in da.dims:
-        return [], []
-
-    for dim in ("lat", "lon"):
-        if dim in da.dims:
-            da = da.mean(dim=dim, skipna=True)
-
-    annual = da.groupby("time.year").sum("time", skipna=True)
-    years = np.asarray(annual["year"].values, dtype=int)
-    values = np.asarray(annual.values, dtype=float)
+    da = ds[name]
+    years = np.asarray(da["time"].dt.year.values, dtype=int)
+    values = np.asarray(da.values, dtype=float)
     mask = np.isfinite(values)
     return years[mask].tolist(), np.round(values[mask], 2).tolist()
 
@@ -125,11 +117,13 @@ def build_region_plotly_timeseries(region_output_dir):
     if xr is None or np is None:
         return {}
 
-    source_files = {
-        "Histórico": os.path.join(region_output_dir, "historical_ecuador", "wb_agg_historical_ecuador.nc"),
-        "SSP1-2.6": os.path.join(region_output_dir, "ssp126_ecuador", "wb_agg_ssp126_ecuador.nc"),
-        "SSP3-7.0": os.path.join(region_output_dir, "ssp370_ecuador", "wb_agg_ssp370_ecuador.nc"),
-        "SSP5-8.5": os.path.join(region_output_dir, "ssp585_ecuador", "wb_agg_ssp585_ecuador.nc"),
+    from organized.scripts.wb import series_store
+
+    source_domains = {
+        "Histórico": "historical_ecuador",
+        "SSP1-2.6": "ssp126_ecuador",
+        "SSP3-7.0": "ssp370_ecuador",
+        "SSP5-8.5": "ssp585_ecuador",
     }
     scenario_colors = {
         "Histórico": "#334155",
@@ -138,56 +132,56 @@ def build_region_plotly_timeseries(region_output_dir):
         "SSP5-8.5": "#dc2626",
     }
     series_defs = {
-        "precip": {"title": "Precipitación Anual", "unit": "mm/año", "var": "p_mon"},
-        "pet": {"title": "Evapotranspiración Potencial Anual", "unit": "mm/año", "var": "pet_mon"},
-        "wb": {"title": "Balance Hídrico Anual", "unit": "mm/año", "var": "wb_mon"},
+        "precip": {"title": "Precipitación Anual", "unit": "mm/año", "var": "P_ann"},
+        "pet": {"title": "Evapotranspiración Potencial Anual", "unit": "mm/año", "var": "PET_ann"},
+        "wb": {"title": "Balance Hídrico Anual", "unit": "mm/año", "var": "WB_ann"},
         "ai": {"title": "Índice de Aridez Anual (P/PET)", "unit": "adimensional", "var": None},
     }
     result = {key: {"title": cfg["title"], "unit": cfg["unit"], "traces": []} for key, cfg in series_defs.items()}
 
-    for scen_label, nc_path in source_files.items():
-        if not os.path.exists(nc_path):
-            continue
+    for scen_label, dom in source_domains.items():
         try:
-            with xr.open_dataset(nc_path) as ds:
-                annual_cache = {}
-                for key, cfg in series_defs.items():
-                    if cfg["var"]:
-                        years, values = _annual_sum_spatial_mean(ds, cfg["var"])
-                        annual_cache[cfg["var"]] = (years, values)
-                        if years:
-                            result[key]["traces"].append(
-                                {
-                                    "name": scen_label,
-                                    "x": years,
-                                    "y": values,
-                                    "color": scenario_colors.get(scen_label, "#2563eb"),
-                                }
-                            )
-                p_years, p_vals = annual_cache.get("p_mon", ([], []))
-                pet_years, pet_vals = annual_cache.get("pet_mon", ([], []))
-                if p_years and pet_years:
-                    p_by_year = {y: v for y, v in zip(p_years, p_vals)}
-                    pet_by_year = {y: v for y, v in zip(pet_years, pet_vals)}
-                    common_years = sorted(set(p_by_year).intersection(pet_by_year))
-                    ai_values = []
-                    ai_years = []
-                    for year in common_years:
-                        pet_value = pet_by_year[year]
-                        if pet_value and np.isfinite(pet_value) and pet_value != 0:
-                            ai_years.append(year)
-                            ai_values.append(round(float(p_by_year[year] / pet_value), 3))
-                    if ai_years:
-                        result["ai"]["traces"].append(
+            ds = series_store.dataset(region_output_dir, dom, ["P_ann", "PET_ann", "WB_ann"])
+            if ds is None:
+                continue
+            annual_cache = {}
+            for key, cfg in series_defs.items():
+                if cfg["var"]:
+                    years, values = _annual_series(ds, cfg["var"])
+                    annual_cache[cfg["var"]] = (years, values)
+                    if years:
+                        result[key]["traces"].append(
                             {
                                 "name": scen_label,
-                                "x": ai_years,
-                                "y": ai_values,
+                                "x": years,
+                                "y": values,
                                 "color": scenario_colors.get(scen_label, "#2563eb"),
                             }
                         )
+            p_years, p_vals = annual_cache.get("P_ann", ([], []))
+            pet_years, pet_vals = annual_cache.get("PET_ann", ([], []))
+            if p_years and pet_years:
+                p_by_year = {y: v for y, v in zip(p_years, p_vals)}
+                pet_by_year = {y: v for y, v in zip(pet_years, pet_vals)}
+                common_years = sorted(set(p_by_year).intersection(pet_by_year))
+                ai_values = []
+                ai_years = []
+                for year in common_years:
+                    pet_value = pet_by_year[year]
+                    if pet_value and np.isfinite(pet_value) and pet_value != 0:
+                        ai_years.append(year)
+                        ai_values.append(round(float(p_by_year[year] / pet_value), 3))
+                if ai_years:
+                    result["ai"]["traces"].append(
+                        {
+                            "name": scen_label,
+                            "x": ai_years,
+                            "y": ai_values,
+                            "color": scenario_colors.get(scen_label, "#2563eb"),
+                        }
+                    )
         except Exception as exc:
-            print(f"⚠️ No se pudo generar serie interactiva desde {nc_path}: {exc}")
+            print(f"⚠️ No se pudo generar serie interactiva de {dom} en {region_output_dir}: {exc}")
             continue
 
     return result
@@ -230,7 +224,7 @@ def prepare_logo_assets(output_root):
 def generate_html_content(data_source=None, output_root=None, region_codes=None, regions=None):
     output_root = output_root or settings.OUTPUTS_DIR
     os.makedirs(output_root, exist_ok=True)
-    active_regions = regions or settings.REGIONS
+    active_regions = regions or settings.current_registry().snapshot()
     if region_codes:
         active_regions = {code: active_regions[code] for code in region_codes if code in active_regions}
 
@@ -1598,7 +1592,7 @@ def export_static_site(output_root=None):
 
     print("🚀 Sitio estático publicado en GitHub.")
 
-def run(deploy_to_github=False, data_source=None, output_root=None, region_codes=None, regions=None):
+def run(deploy_to_github=False, data_source=None, output_root=None, region_codes=None, regions=None, registry=None):
     """
     Generate dashboard HTML and optionally deploy to GitHub repo.
     Args:
@@ -1607,8 +1601,11 @@ def run(deploy_to_github=False, data_source=None, output_root=None, region_codes
         data_source: 'FODESNA' or 'FMPLPT' to filter logos.
         output_root: Base folder where index.html and assets are written.
         region_codes: Optional region-code filter for dashboard content.
-        regions: Optional region dictionary; defaults to settings.REGIONS.
+        regions: Optional region dictionary; defaults to the active region registry.
+        registry: Optional RegionRegistry (e.g. a session's) used when regions is not given.
     """
+    if regions is None and registry is not None:
+        regions = registry.snapshot()
     generate_html_content(
         data_source=data_source,
         output_root=output_root,
@@ -6,55 +6,67 @@ Calls individual plotting scripts refactored in organized/scripts/wb/
 
 import sys
 import os
+import importlib
 import traceback
 
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
 
-from organized.scripts.wb import (
-    plot_timeseries,
-    plot_seasonal_cycle,
-    deliverable_key_numbers,
-    plot_temp_timeseries,
-    plot_warming_stripes,
-    plot_ai_cdd_timeseries,
-    window_bars_p_pet_wb,
-    plot_wb_maps_windows,
-    plot_monthly_wb_maps
-)
-
-from organized.scripts.wb.Deliverables import (
-    deliverable_delta_bars,
-    deliverable_maps_components,
-    deliverable_season_extreme_maps,
-    deliverable_timeseries_climatology
-)
-
-def run(region_codes=None):
+def run(region_codes=None, registry=None):
+    """registry: RegionRegistry the plot modules resolve region_codes against (default: the active one)."""
+    from organized.config import settings
+    from organized.scripts.wb import datasets, run_scope, window_stats, working_cache
+
     print("\nSTARTING PLOTTING PIPELINE")
     if region_codes:
         print(f"Targeting regions: {region_codes}")
     print("="*80)
 
+    # Imported one by one in _run_modules: importing this file stays cheap, and a module
+    # whose import fails is reported and skipped like any other module error.
     modules_to_run = [
-        (plot_timeseries, "Standard Time Series"),
-        (plot_temp_timeseries, "Temperature Time Series"),
-        (plot_seasonal_cycle, "Seasonal Cycles"),
-        (plot_warming_stripes, "Warming Stripes"),
-        (plot_ai_cdd_timeseries, "AI & CDD Timeseries"),
-        (window_bars_p_pet_wb, "Window Bar Plots"),
-        (plot_wb_maps_windows, "Window Maps"),
-        (plot_monthly_wb_maps, "Monthly Maps"),
-        (deliverable_key_numbers, "Key Numbers Report"),
-        (deliverable_delta_bars, "Deliverable: Delta Bars"),
-        (deliverable_maps_components, "Deliverable: Map Components"),
-        (deliverable_season_extreme_maps, "Deliverable: Season Extreme Maps"),
-        (deliverable_timeseries_climatology, "Deliverable: Climatology Timeseries"),
+        ("organized.scripts.wb.series_store", "Series Store"),
+        ("organized.scripts.wb.plot_timeseries", "Standard Time Series"),
+        ("organized.scripts.wb.plot_temp_timeseries", "Temperature Time Series"),
+        ("organized.scripts.wb.plot_seasonal_cycle", "Seasonal Cycles"),
+        ("organized.scripts.wb.plot_warming_stripes", "Warming Stripes"),
+        ("organized.scripts.wb.plot_climate_extremes", "ETCCDI Climate Extremes"),
+        ("organized.scripts.wb.plot_ai_cdd_timeseries", "AI & CDD Timeseries"),
+        ("organized.scripts.wb.plot_drought_indices", "SPI / SPEI Drought Indices"),
+        ("organized.scripts.wb.trend_analysis", "Trend Maps (Mann-Kendall / Sen)"),
+        ("organized.scripts.wb.time_of_emergence", "Time of Emergence"),
+        ("organized.scripts.wb.window_bars_p_pet_wb", "Window Bar Plots"),
+        ("organized.scripts.wb.plot_wb_maps_windows", "Window Maps"),
+        ("organized.scripts.wb.plot_monthly_wb_maps", "Monthly Maps"),
+        ("organized.scripts.wb.key_metrics", "Key Numbers Report"),
+        ("organized.scripts.wb.zonal_stats", "Zonal Statistics Tables"),
+        ("organized.scripts.wb.Deliverables.deliverable_delta_bars", "Deliverable: Delta Bars"),
+        ("organized.scripts.wb.Deliverables.deliverable_maps_components", "Deliverable: Map Components"),
+        ("organized.scripts.wb.Deliverables.deliverable_season_extreme_maps", "Deliverable: Season Extreme Maps"),
+        ("organized.scripts.wb.Deliverables.deliverable_timeseries_climatology", "Deliverable: Climatology Timeseries"),
     ]
 
-    for module, name in modules_to_run:
+    # The pooled handles and caches are process-wide (other Streamlit sessions may be
+    # plotting too); release only what this run used and nobody else still needs.
+    with run_scope.scope() as run_id:
+        try:
+            with settings.use_registry(registry):
+                _run_modules(modules_to_run, region_codes)
+        finally:
+            datasets.release(run_id)
+            window_stats.release(run_id)
+            working_cache.release(run_id)
+            print(f"{len(datasets.POOL)} shared dataset handle(s) still open")
+
+    print("\n" + "="*80)
+    print("PLOTTING COMPLETED")
+    print("="*80 + "\n")
+
+def _run_modules(modules_to_run, region_codes):
+    for module_path, name in modules_to_run:
         try:
             print(f"\nRunning: {name}...")
+            module = importlib.import_module(module_path)
 
 
 
@@ -82,11 +94,5 @@ def run(region_codes=None):
             print(f"❌ Error in {name}: {e}")
             print(traceback.format_exc())
 
-
-
-    print("\n" + "="*80)
-    print("PLOTTING COMPLETED")
-    print("="*80 + "\n")
-
 if __name__ == "__main__":
     run()
@@ -296,17 +296,19 @@ def add_figure(doc, image_path, caption, max_width=6.5):
         return False
 
 
-def create_document(specific_regions=None, report_dir=None, regions=None):
+def create_document(specific_regions=None, report_dir=None, regions=None, registry=None):
     """Crea el documento completo.
 
     Args:
         specific_regions (list): Lista de códigos de región para procesar. Si es None, procesa todas.
         report_dir (str): Carpeta de salida del .docx. Si es None usa settings.REPORTS_DIR.
-        regions (dict): Diccionario de regiones a considerar. Si es None usa settings.REGIONS.
+        regions (dict): Diccionario de regiones a considerar. Si es None usa el registro de regiones.
+        registry (RegionRegistry): Registro de regiones (p. ej. de la sesión). Si es None usa el activo.
     """
     print("Creando documento Word con figuras...")
 
-    active_regions = regions or settings.REGIONS
+    registry = registry or settings.current_registry()
+    active_regions = regions or registry.snapshot()
     output_reports_dir = report_dir or settings.REPORTS_DIR
 
     os.makedirs(output_reports_dir, exist_ok=True)
@@ -336,7 +338,7 @@ def create_document(specific_regions=None, report_dir=None, regions=None):
             continue
 
         region_name = region_info["name"]
-        region_dir = settings.get_region_output_dir(region_code)
+        region_dir = registry.output_dir(region_code)
 
         print(f"\n{'='*60}")
         print(f"🌍 Procesando región: {region_name}")
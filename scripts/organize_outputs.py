@@ -232,7 +232,7 @@ def run():
         f.write("Esta carpeta contiene copias organizadas de todas las figuras\n")
         f.write("generadas en el análisis de cambio climático.\n\n")
         f.write("ESTRUCTURA:\n")
-        for region_code, region_info in settings.REGIONS.items():
+        for region_code, region_info in settings.iter_regions():
             f.write(f"- {region_info['name']}/: Figuras para {region_info['name']}\n")
         f.write("\nCada región tiene categorías organizadas por tipo de análisis.\n\n")
         f.write("Generado automáticamente.\n")
@@ -242,7 +242,7 @@ def run():
     total_files_missing = 0
 
 
-    for region_code, region_info in settings.REGIONS.items():
+    for region_code, region_info in settings.iter_regions():
         region_name = region_info["name"]
 
 
@@ -384,7 +384,7 @@ def create_index_html():
     <p><strong>Período de análisis:</strong> 1980-2100 | <strong>Período base:</strong> 1981-2010</p>
 """
 
-    for region_code, region_info in settings.REGIONS.items():
+    for region_code, region_info in settings.iter_regions():
         region_name = region_info["name"]
         html_content += f"""
     <div class="region">
@@ -13,19 +13,18 @@ import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
 
 from organized.config import settings
-from organized.scripts.wb import merge_daily, compute_pet, water_balance
+from organized.scripts.wb import merge_daily, bias_correction, compute_pet, water_balance
 
 def run():
     print("\nSTARTING CALCULATION PIPELINE")
     print("="*80)
 
-    region_pairs = [
-        (settings.get_region_input_dir(code), settings.get_region_output_dir(code))
-        for code in settings.REGIONS
-    ]
+    region_pairs = settings.current_registry().pairs()
     for inp, out in region_pairs:
         print(f"  Input: {inp}  ->  Output: {out}")
 
+    region_pairs = bias_correction.run(region_pairs)
+
     compute_pet.run(region_pairs=region_pairs)
 
     water_balance.run(region_pairs=region_pairs)
@@ -7,6 +7,7 @@ import matplotlib.pyplot as plt
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
 from organized.config import settings
+from organized.scripts.wb import aggregation, datasets, storage
 
 
 SCENS = [d for d in settings.DOMAINS if "historical" not in d]
@@ -19,16 +20,16 @@ def wlat(lat): return xr.DataArray(np.cos(np.deg2rad(lat)), coords={'lat': lat},
 def wmean(da): return da.weighted(wlat(da['lat'])).mean(('lat','lon'))
 
 def mean_annual(path, t0, t1):
-    if not os.path.exists(path): return None
+    if not path: return None
     try:
-        ds = xr.open_dataset(path).sel(time=slice(f"{t0}-01-01", f"{t1}-12-31"))
+        ds = datasets.open_wb(path).sel(time=slice(f"{t0}-01-01", f"{t1}-12-31"))
         if ds.sizes.get("time",0) == 0: return None
 
         if "wb_mmday" not in ds: return None
 
 
         daily_mean = wmean(ds["wb_mmday"])
-        y = daily_mean.resample(time="YS").sum("time")
+        y = aggregation.resample(daily_mean, "YS")
         return float(y.mean("time"))
     except Exception as e:
 
@@ -46,10 +47,7 @@ def run(region_codes=None):
         output_dir = settings.get_region_output_dir(region_code)
         print(f"Procesando región: {region_info['name']} ({output_dir})")
 
-        base_path = os.path.join(output_dir, "historical_ecuador", "wb_historical_ecuador.nc")
-        if not os.path.exists(base_path):
-            base_path = os.path.join(output_dir, "historical_ecuador", "wb.nc")
-        base = mean_annual(base_path, *BASE)
+        base = mean_annual(storage.wb_path(output_dir, "historical_ecuador"), *BASE)
         if base is None:
             print(f"  ⚠️ Sin datos de línea base para {region_info['name']}")
             continue
@@ -57,10 +55,7 @@ def run(region_codes=None):
         for scen in SCENS:
             vals = []
             for (t0, t1) in WINS:
-                scen_path = os.path.join(output_dir, scen, f"wb_{scen}.nc")
-                if not os.path.exists(scen_path):
-                    scen_path = os.path.join(output_dir, scen, "wb.nc")
-                fut = mean_annual(scen_path, t0, t1)
+                fut = mean_annual(storage.wb_path(output_dir, scen), t0, t1)
                 vals.append(np.nan if fut is None else fut - base)
 
             plt.figure(figsize=(6, 4))
@@ -2,26 +2,12 @@
 import sys
 import os
 import numpy as np
-import xarray as xr
 import matplotlib.pyplot as plt
 
 
-_prefix = os.environ.get("CONDA_PREFIX") or getattr(sys, "prefix", "")
-if _prefix:
-    os.environ.setdefault("PROJ_LIB", os.path.join(_prefix, "share", "proj"))
-    os.environ.setdefault("GDAL_DATA", os.path.join(_prefix, "share", "gdal"))
-try:
-    from pyproj import datadir, CRS
-    if os.environ.get("PROJ_LIB"):
-        datadir.set_data_dir(os.environ["PROJ_LIB"])
-    CRS.from_epsg(4326)
-except Exception:
-    pass
-
-import geopandas as gpd
-
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../../..")))
 from organized.config import settings
+from organized.scripts.wb import aggregation, datasets, geometry, gis_env, storage
 
 SCENS = [d for d in settings.DOMAINS if "historical" not in d]
 BASE = settings.BASE_PERIOD
@@ -33,8 +19,7 @@ def triple_meses_str(start_m):
     return "–".join(MESES[i-1] for i in idx), idx
 
 def trimestral(ds):
-    mon = ds["wb_mmday"].resample(time="MS").sum("time")
-    clim = mon.groupby("time.month").mean("time")
+    clim = aggregation.climatology(ds["wb_mmday"])
     vals=[]
     for start in range(1,13):
         _, idx = triple_meses_str(start)
@@ -49,6 +34,7 @@ def pm(ax, lat, lon, fld, ttl, vmin=None, vmax=None, cmap="bwr_r"):
     return im
 
 def run(region_codes=None):
+    gis_env.setup()
     print("\n" + "="*60)
     print("GENERATING SEASONAL EXTREME MAPS")
     print("="*60)
@@ -58,22 +44,12 @@ def run(region_codes=None):
         print(f"Processing region: {region_info['name']} ({output_dir})")
 
         shp = region_info.get("shapefile")
-        geo = None
-        if shp and os.path.exists(shp):
-            geo = gpd.read_file(shp)
-            try:
-                if geo.crs is None or geo.crs.to_epsg() != 4326:
-                    geo = geo.to_crs("EPSG:4326")
-            except Exception: pass
-
-        pbase = os.path.join(output_dir, "historical_ecuador", "wb_historical_ecuador.nc")
-        if not os.path.exists(pbase):
-            pbase = os.path.join(output_dir, "historical_ecuador", "wb.nc")
-
-        if not os.path.exists(pbase):
+
+        pbase = storage.wb_path(output_dir, "historical_ecuador")
+        if pbase is None:
             print("  ⚠️ Missing baseline data"); continue
 
-        dsb = xr.open_dataset(pbase).sel(time=slice(f"{BASE[0]}-01-01", f"{BASE[1]}-12-31"))
+        dsb = datasets.open_wb(pbase).sel(time=slice(f"{BASE[0]}-01-01", f"{BASE[1]}-12-31"))
         (msec, wb_sec), (mhum, wb_hum) = trimestral(dsb)
         lat, lon = wb_sec["lat"].values, wb_sec["lon"].values
         etiqueta_seco, idx_seco = triple_meses_str(msec)
@@ -87,8 +63,9 @@ def run(region_codes=None):
         fig, axs = plt.subplots(1, 2, figsize=(12, 4), sharex=True, sharey=True)
         im0 = pm(axs[0], lat, lon, wb_sec.values, f"Trimestre más seco ({etiqueta_seco}) | 1981–2010", -vm, vm, "bwr_r")
         im1 = pm(axs[1], lat, lon, wb_hum.values, f"Trimestre más húmedo ({etiqueta_hum}) | 1981–2010", -vm, vm, "bwr_r")
-        if geo is not None:
-             for ax in axs: geo.boundary.plot(ax=ax, edgecolor="k", linewidth=.9)
+        for ax in axs:
+            lc = geometry.outline_collection(shp, lat, lon)
+            if lc is not None: ax.add_collection(lc)
         cax = fig.add_axes([1.02, 0.25, 0.02, 0.5])
         cb = fig.colorbar(im1, cax=cax)
         cb.set_label("Balance hídrico (mm/3 meses)\nAzul = superávit | Rojo = déficit")
@@ -99,13 +76,11 @@ def run(region_codes=None):
         print(f"  Generated: {os.path.basename(out_file)}")
 
         for scen in SCENS:
-            pfut = os.path.join(output_dir, scen, f"wb_{scen}.nc")
-            if not os.path.exists(pfut):
-                pfut = os.path.join(output_dir, scen, "wb.nc")
-            if not os.path.exists(pfut): continue
+            pfut = storage.wb_path(output_dir, scen)
+            if pfut is None: continue
 
-            dsf = xr.open_dataset(pfut).sel(time=slice(f"{FUT_WIN[0]}-01-01", f"{FUT_WIN[1]}-12-31"))
-            mon = dsf["wb_mmday"].resample(time="MS").sum("time").groupby("time.month").mean("time")
+            dsf = datasets.open_wb(pfut).sel(time=slice(f"{FUT_WIN[0]}-01-01", f"{FUT_WIN[1]}-12-31"))
+            mon = aggregation.climatology(dsf["wb_mmday"])
 
             fut_sec = mon.sel(month=idx_seco).sum("month")
             fut_hum = mon.sel(month=idx_hum).sum("month")
@@ -117,8 +92,9 @@ def run(region_codes=None):
             fig, axs = plt.subplots(1, 2, figsize=(12, 4), sharex=True, sharey=True)
             im0 = pm(axs[0], lat, lon, dsec, f"{scen.replace('_ecuador','')} Δ Trimestre seco ({etiqueta_seco}) 2071–2100", -vm2, vm2, "bwr_r")
             im1 = pm(axs[1], lat, lon, dhum, f"{scen.replace('_ecuador','')} Δ Trimestre húmedo ({etiqueta_hum}) 2071–2100", -vm2, vm2, "bwr_r")
-            if geo is not None:
-                 for ax in axs: geo.boundary.plot(ax=ax, edgecolor="k", linewidth=.9)
+            for ax in axs:
+                lc = geometry.outline_collection(shp, lat, lon)
+                if lc is not None: ax.add_collection(lc)
             cax = fig.add_axes([1.02, 0.25, 0.02, 0.5])
             cb = fig.colorbar(im1, cax=cax)
             cb.set_label("Δ Balance hídrico (mm/3 meses)\nAzul = aumento | Rojo = reducción")
@@ -8,6 +8,7 @@ import matplotlib.pyplot as plt
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../../..")))
 from organized.config import settings
+from organized.scripts.wb import aggregation, datasets, storage
 
 DOMS = settings.DOMAINS
 VENTANAS = {
@@ -23,15 +24,14 @@ def wlat(lat): return xr.DataArray(np.cos(np.deg2rad(lat)), coords={'lat': lat},
 def wmean(da): return da.weighted(wlat(da['lat'])).mean(('lat','lon'))
 
 def mean_series(path, var, t0, t1):
-    if not os.path.exists(path): return None
-    ds = xr.open_dataset(path).sel(time=slice(f"{t0}-01-01", f"{t1}-12-31"))
+    if not path: return None
+    ds = datasets.open_wb(path).sel(time=slice(f"{t0}-01-01", f"{t1}-12-31"))
     if ds.sizes.get("time",0)==0: return None
     if var not in ds: return None
 
 
     daily_mean = wmean(ds[var])
-    mon = daily_mean.resample(time="MS").sum("time")
-    s = mon.groupby("time.month").mean("time").to_pandas()
+    s = aggregation.climatology(daily_mean).to_pandas()
     s.index = range(1,13)
     return s
 
@@ -52,10 +52,7 @@ def run(region_codes=None):
             for nombre, (t0, t1) in VENTANAS.items():
                 plt.figure(figsize=(8, 4))
                 for d in DOMS:
-                    path = os.path.join(output_dir, d, f"wb_{d}.nc")
-                    if not os.path.exists(path):
-                        path = os.path.join(output_dir, d, "wb.nc")
-                    s = mean_series(path, var, t0, t1)
+                    s = mean_series(storage.wb_path(output_dir, d), var, t0, t1)
                     if s is None:
                         continue
                     c = COL.get(d, "tab:blue")
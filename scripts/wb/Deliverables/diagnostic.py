@@ -7,6 +7,7 @@ import xarray as xr
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
 from organized.config import settings
+from organized.scripts.wb import aggregation
 
 ROOTS = [info["path"] for info in settings.REGIONS.values()]
 DOMS = settings.DOMAINS
@@ -98,7 +99,7 @@ def diag_one(root, dom, t0, t1):
     tasC, how, (rmin, rmax, rmed, units) = guess_units_and_convert(tas)
 
 
-    tasC_yr = tasC.resample(time="YS").mean("time")
+    tasC_yr = aggregation.resample(tasC, "YS", "mean")
     meanC = float(area_mean(tasC_yr).mean("time"))
 
 
@@ -0,0 +1,238 @@
+"""
+Calendar-aware segment reductions over the time axis.
+
+The year/month of every time step is decoded once per time axis (numpy datetime64 or cftime,
+so noleap/360_day calendars work without conversion) and turned into integer segment starts
+(months, DJF/MAM/JJA/SON seasons, years) and group codes (calendar month, season, window).
+A (time, ...) cube is then reduced with one np.add.reduceat per latitude band instead of
+xarray's resample/groupby machinery.
+
+    aggregation.resample(da, "MS")            # == da.resample(time="MS").sum("time")
+    aggregation.climatology(da)               # == monthly totals grouped by calendar month, mean
+    aggregation.aggregate({"p": P}, ("MS", "YS"))
+
+Unlike xarray's skipna sums, a segment with no valid value is NaN (min_count=1), so cells
+outside the domain stay masked instead of becoming 0.
+"""
+import threading
+import numpy as np
+import xarray as xr
+from organized.config import settings
+
+FREQS = {"MS": "MS", "month": "MS", "QS-DEC": "QS-DEC", "season": "QS-DEC", "YS": "YS", "year": "YS"}
+SEASONS = ("DJF", "MAM", "JJA", "SON")
+
+_index = {}
+_lock = threading.Lock()
+
+
+class TimeIndex:
+    """Integer calendar fields of one time axis plus its (lazily built) segments."""
+
+    def __init__(self, values):
+        values = np.asarray(values)
+        self.values = values
+        self.cftime = not np.issubdtype(values.dtype, np.datetime64)
+        if self.cftime:
+            self.year = np.fromiter((t.year for t in values), int, values.size)
+            self.month = np.fromiter((t.month for t in values), int, values.size)
+        else:
+            months = values.astype("datetime64[M]").astype(np.int64)
+            self.year = months // 12 + 1970
+            self.month = months % 12 + 1
+        self._segments = {}
+
+    def __len__(self):
+        return self.values.size
+
+    def _keys(self, freq):
+        """Monotonic integer key per step: month counter, season-start month counter or year."""
+        k = (self.year - 1970) * 12 + self.month - 1
+        if freq == "MS":
+            return k
+        if freq == "QS-DEC":
+            return k - self.month % 3
+        return self.year
+
+    def _label(self, freq, key):
+        if freq == "YS":
+            y, m = int(key), 1
+        else:
+            y, m = int(key) // 12 + 1970, int(key) % 12 + 1
+        if self.cftime:
+            return self.values[0].replace(year=y, month=m, day=1, hour=0, minute=0, second=0, microsecond=0)
+        return np.datetime64(f"{y:04d}-{m:02d}-01", "ns")
+
+    def segments(self, freq):
+        """(starts, labels): first step of each month/season/year and its period-start timestamp."""
+        freq = FREQS[freq]
+        if freq not in self._segments:
+            keys = self._keys(freq)
+            if keys.size == 0:
+                self._segments[freq] = (np.zeros(0, int), np.zeros(0, self.values.dtype))
+            else:
+                if np.any(np.diff(keys) < 0):
+                    raise ValueError("time axis must be sorted for segment reductions")
+                starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+                labels = np.array([self._label(freq, k) for k in keys[starts]], dtype=self.values.dtype)
+                self._segments[freq] = (starts, labels)
+        return self._segments[freq]
+
+    def groups(self, by, windows=None):
+        """
+        (codes, keys): group code per step (-1 = no group) and the group labels. Windows may
+        overlap (cercano/medio), so for by="window" codes is a (window, step) membership matrix.
+        """
+        if by == "month":
+            return self.month - 1, np.arange(1, 13)
+        if by == "season":
+            return self.month % 12 // 3, np.array(SEASONS)
+        if by == "year":
+            keys = np.unique(self.year)
+            return np.searchsorted(keys, self.year), keys
+        if by == "window":
+            windows = windows if windows is not None else settings.WINDOWS
+            member = np.array([(self.year >= int(t0)) & (self.year <= int(t1)) for t0, t1 in windows.values()],
+                              dtype=bool).reshape(len(windows), self.year.size)
+            return member, np.array(list(windows))
+        raise ValueError(f"unknown grouping: {by}")
+
+
+def time_index(time):
+    """Shared TimeIndex for a time coordinate (DataArray or array), decoded once per axis."""
+    values = np.asarray(getattr(time, "values", time))
+    key = (values.dtype.str, values.size, str(values[0]) if values.size else "", str(values[-1]) if values.size else "")
+    with _lock:
+        idx = _index.get(key)
+        if idx is None:
+            if len(_index) >= 64:
+                _index.clear()
+            idx = _index[key] = TimeIndex(values)
+    return idx
+
+
+def reduce_segments(values, starts, how="sum", min_count=1):
+    """Reduces contiguous runs along axis 0 (run i = values[starts[i]:starts[i+1]]), ignoring NaN."""
+    v = np.asarray(values, dtype=float)
+    if len(starts) == 0:
+        return np.zeros((0,) + v.shape[1:])
+    if how == "max":
+        return np.fmax.reduceat(v, starts, axis=0)
+    if how == "min":
+        return np.fmin.reduceat(v, starts, axis=0)
+    valid = ~np.isnan(v)
+    n = np.add.reduceat(valid.astype(np.int32), starts, axis=0)
+    if how == "count":
+        return n
+    s = np.add.reduceat(np.where(valid, v, 0.0), starts, axis=0)
+    if how == "mean":
+        s = s / np.maximum(n, 1)
+    elif how != "sum":
+        raise ValueError(f"unknown reduction: {how}")
+    return np.where(n >= max(min_count, 1), s, np.nan)
+
+
+def reduce_groups(values, codes, n_groups, how="mean", min_count=1):
+    """Reduces the steps sharing a group code along axis 0 -> (n_groups, ...); code -1 is dropped."""
+    v = np.asarray(values, dtype=float)
+    codes = np.asarray(codes)
+    order = np.argsort(codes, kind="stable")
+    order = order[codes[order] >= 0]
+    out = np.full((n_groups,) + v.shape[1:], np.nan)
+    if order.size == 0:
+        return out
+    sorted_codes = codes[order]
+    present, starts = np.unique(sorted_codes, return_index=True)
+    out[present] = reduce_segments(v[order], starts, how, min_count)
+    return out
+
+
+def _rows_per_block(da):
+    budget = settings.AGG_BLOCK_MB * 2**20
+    per_row = 8 * da.sizes["time"] * max(1, int(np.prod(da.shape[2:])))
+    return int(max(1, budget // max(1, 3 * per_row)))
+
+
+def _blocks(da):
+    """(slice, ndarray) latitude bands of a (time, ...) DataArray within AGG_BLOCK_MB."""
+    if da.ndim == 1:
+        yield slice(None), np.asarray(da.values)
+        return
+    dim, n = da.dims[1], da.shape[1]
+    step = _rows_per_block(da)
+    for i in range(0, n, step):
+        yield slice(i, i + step), np.asarray(da.isel({dim: slice(i, i + step)}).values)
+
+
+def _wrap(template, data, dim, coord, name=None):
+    coords = {k: v for k, v in template.coords.items() if "time" not in v.dims}
+    coords[dim] = coord
+    dims = (dim,) + template.dims[1:]
+    return xr.DataArray(data, dims=dims, coords=coords, name=name or template.name, attrs=dict(template.attrs))
+
+
+def resample(da, freq="MS", how="sum", min_count=1):
+    """da.resample(time=freq).<how>("time") for freq in MS / QS-DEC / YS, labelled at period start."""
+    da = da.transpose("time", ...)
+    starts, labels = time_index(da["time"]).segments(freq)
+    out = None
+    for sl, block in _blocks(da):
+        r = reduce_segments(block, starts, how, min_count)
+        if out is None:
+            out = np.empty((starts.size,) + da.shape[1:], r.dtype)
+        out[:, sl] = r
+    return _wrap(da, out, "time", labels)
+
+
+def groupby(da, by="month", how="mean", windows=None, min_count=1):
+    """da.groupby(f"time.{by}").<how>("time"); by = month / season / year / window (settings.WINDOWS)."""
+    da = da.transpose("time", ...)
+    codes, keys = time_index(da["time"]).groups(by, windows)
+    out = None
+    for sl, block in _blocks(da):
+        if codes.ndim == 2:
+            r = np.stack([reduce_groups(block, np.where(m, 0, -1), 1, how, min_count)[0] for m in codes])
+        else:
+            r = reduce_groups(block, codes, keys.size, how, min_count)
+        if out is None:
+            out = np.empty((keys.size,) + da.shape[1:], r.dtype)
+        out[:, sl] = r
+    return _wrap(da, out, by, keys)
+
+
+def climatology(da, how="sum", by="month"):
+    """Mean annual cycle of monthly <how> (totals by default): (month|season, ...)."""
+    freq = "QS-DEC" if by == "season" else "MS"
+    return groupby(resample(da, freq, how), by, "mean")
+
+
+def aggregate(arrays, freqs=("MS", "YS"), how="sum", min_count=1):
+    """
+    Reduces several (time, ...) arrays sharing one time axis to every frequency in a single pass
+    over latitude bands. Coarser sums are built from the monthly ones. Returns {(name, freq): DataArray}.
+    """
+    first = next(iter(arrays.values())).transpose("time", ...)
+    index = time_index(first["time"])
+    freqs = [FREQS[f] for f in freqs]
+    mon_starts, mon_labels = index.segments("MS")
+    plan = {}
+    for f in freqs:
+        starts, labels = index.segments(f)
+        # Months nest in seasons and years, so those sums can reuse the monthly ones.
+        nested = how == "sum" and f != "MS" and "MS" in freqs
+        plan[f] = (np.searchsorted(mon_starts, starts) if nested else starts, labels, nested)
+
+    result = {}
+    for name, da in arrays.items():
+        da = da.transpose("time", ...)
+        outs = {}
+        for sl, block in _blocks(da):
+            mon = reduce_segments(block, mon_starts, how, min_count) if "MS" in freqs else None
+            for f, (starts, _, nested) in plan.items():
+                r = mon if f == "MS" else reduce_segments(mon if nested else block, starts, how, min_count)
+                if f not in outs:
+                    outs[f] = np.empty((starts.size,) + da.shape[1:], r.dtype)
+                outs[f][:, sl] = r
+        for f, (_, labels, _) in plan.items():
+            result[(name, f)] = _wrap(da, outs[f], "time", labels)
+    return result
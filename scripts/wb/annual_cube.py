@@ -0,0 +1,88 @@
+"""
+Annual (year, lat, lon) cubes of P, PET, WB, AI and tas for one scenario.
+
+P/PET/WB are the yearly totals already in wb_agg_<dom>.nc and AI = P/PET. tas is the annual
+mean (°C) of the daily input, reduced band by band with aggregation.resample. The result is
+cached in output_dir/<dom>/annual_<dom>.nc and rebuilt when wb_agg or the tas input is newer.
+"""
+import os
+import numpy as np
+import xarray as xr
+from organized.scripts.wb import aggregation, datasets, storage
+from organized.scripts.wb.climate_extremes import input_path
+from organized.scripts.wb.compute_pet import as_celsius
+
+VARS = ("P", "PET", "WB", "AI", "tas")
+UNITS = {"P": "mm/año", "PET": "mm/año", "WB": "mm/año", "AI": "-", "tas": "°C"}
+AGG_VARS = {"P": "p_ann", "PET": "pet_ann", "WB": "wb_ann"}
+
+
+def product_path(output_dir, dom):
+    return os.path.join(output_dir, dom, f"annual_{dom}.nc")
+
+
+def _sources(input_dir, output_dir, dom):
+    return (storage.agg_path(output_dir, dom),
+            input_path(input_dir, dom, "tas") if input_dir else None)
+
+
+def _tas_annual(path):
+    with xr.open_dataset(path) as ds:
+        name = next((n for n in ("tas", "tmean") if n in ds), None)
+        if name is None:
+            return None
+        da = as_celsius(ds[name].transpose("time", "lat", "lon"))
+        return aggregation.resample(da, "YS", "mean")
+
+
+def compute(input_dir, output_dir, dom):
+    """xr.Dataset of the annual cubes (year, lat, lon), or None without wb_agg and tas."""
+    p_agg, p_tas = _sources(input_dir, output_dir, dom)
+    parts = {}
+    if p_agg:
+        agg = datasets.open_dataset(p_agg)
+        for name, v in AGG_VARS.items():
+            if v in agg:
+                parts[name] = agg[v].transpose("time", "lat", "lon")
+    if p_tas:
+        tas = _tas_annual(p_tas)
+        ref = next(iter(parts.values()), None)
+        if tas is not None and ref is not None and tas.shape[1:] != ref.shape[1:]:
+            print(f"  ⚠️ {dom}: tas en otra malla que wb_agg (omitido)")
+        elif tas is not None:
+            parts["tas"] = tas
+    if not parts:
+        return None
+
+    ref = next(iter(parts.values()))
+    years = np.unique(np.concatenate([aggregation.time_index(da["time"]).year for da in parts.values()]))
+    shape = (years.size,) + ref.shape[1:]
+    data = {}
+    for name, da in parts.items():
+        cube = np.full(shape, np.nan)
+        cube[np.searchsorted(years, aggregation.time_index(da["time"]).year)] = np.asarray(da.values, dtype=float)
+        data[name] = cube
+    if "P" in data and "PET" in data:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            data["AI"] = np.where(data["PET"] > 0, data["P"] / data["PET"], np.nan)
+    coords = {"year": years, "lat": ref["lat"].values, "lon": ref["lon"].values}
+    return xr.Dataset({k: (("year", "lat", "lon"), data[k], {"units": UNITS[k]}) for k in VARS if k in data},
+                      coords=coords)
+
+
+def load(input_dir, output_dir, dom):
+    """Cached annual cubes of dom; recomputed when missing or older than its sources."""
+    srcs = [p for p in _sources(input_dir, output_dir, dom) if p]
+    if not srcs:
+        return None
+    out = product_path(output_dir, dom)
+    if os.path.exists(out) and os.path.getmtime(out) >= max(os.path.getmtime(p) for p in srcs):
+        with xr.open_dataset(out) as ds:
+            return ds.load()
+    ds = compute(input_dir, output_dir, dom)
+    if ds is None:
+        return None
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    storage.to_netcdf(ds, out)
+    print(f"  ✅ Wrote {out}")
+    return ds
@@ -7,6 +7,7 @@ import xarray as xr
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
 from organized.config import settings
+from organized.scripts.wb import aggregation, pet_methods, storage
 
 ROOTS = [info["path"] for info in settings.REGIONS.values()]
 DOMAINS = settings.DOMAINS
@@ -30,14 +31,6 @@ def wmean(da):
     den = w.sum("lat")
     return (num / den).mean("lon")
 
-def ra_daily_np(lat_deg, doy):
-    phi=np.deg2rad(lat_deg)
-    dr  = 1 + 0.033*np.cos(2*np.pi*doy/365.0)
-    delta = 0.409*np.sin(2*np.pi*doy/365.0 - 1.39)
-    ws  = np.arccos(np.clip(-np.tan(phi)*np.tan(delta), -1, 1))
-    Gsc = 0.0820
-    return (24*60/np.pi)*Gsc*dr*(ws*np.sin(phi)*np.sin(delta)+np.cos(phi)*np.cos(delta)*np.sin(ws))
-
 def as_celsius(da):
     u=str(da.attrs.get('units','')).lower()
     if 'c' in u: return da
@@ -59,24 +52,28 @@ def sanity_recompute_pet(root, dom, npts=3):
 
     tmin=as_celsius(dsmin['tasmin']); tmax=as_celsius(dsmax['tasmax']); tmean=as_celsius(dst['tas'])
     lat = tmin['lat']; lon = tmin['lon']; time=tmin['time']
-    doy = time.dt.dayofyear
-
-    LAT, DOY = xr.broadcast(lat, doy)
-    Ra = xr.apply_ufunc(ra_daily_np, LAT, DOY, dask='allowed')
-    Ra = Ra.transpose('lat','time').expand_dims({'lon': lon}).transpose('time','lat','lon')
-
-    pet_calc = 0.0023*Ra*(tmean+17.8)*((tmax-tmin).clip(min=0))**0.5
     pet_file = dsp['pet']
-
+    method = pet_file.attrs.get('method', 'hargreaves')
+    if method not in pet_methods.METHODS or not set(pet_methods.METHODS[method]['requires']) <= {'tasmin','tasmax','tas'}:
+        method = 'hargreaves'
+    state = pet_methods.prepare([method], tmean.groupby('time.month').mean('time').transpose('month','lat','lon').values
+                                if pet_methods.METHODS[method]['prepare'] else None)
 
     rng=np.random.default_rng(42)
     I = rng.integers(0, lat.size, size=min(npts, lat.size))
     J = rng.integers(0, lon.size, size=min(npts, lon.size))
     rows=[]
     for i,j in zip(I,J):
-        a = float(pet_calc.isel(lat=i, lon=j).mean('time'))
+        v = {k: da.isel(lat=[i], lon=[j]).transpose('time','lat','lon').values.astype(float)
+             for k, da in (('tasmin', tmin), ('tasmax', tmax), ('tas', tmean))}
+        cell_state = {m: {k: a[i:i+1, j:j+1] for k, a in st.items()} for m, st in state.items()}
+        calc = pet_methods.compute(v, lat.values[[i]], time.dt.dayofyear.values, time.dt.month.values, [method], cell_state)[method]
+        a = float(np.nanmean(calc))
         b = float(pet_file.isel(lat=i, lon=j).mean('time'))
-        rows.append({'lat': float(lat[i]), 'lon': float(lon[j]), 'PET_recomputed_mmday': a, 'PET_file_mmday': b, 'diff': b-a})
+        row = {'lat': float(lat[i]), 'lon': float(lon[j]), 'method': method, 'PET_recomputed_mmday': a, 'PET_file_mmday': b, 'diff': b-a}
+        if 'pet_spread' in dsp:
+            row['PET_spread_mmday'] = float(dsp['pet_spread'].isel(lat=i, lon=j).mean('time'))
+        rows.append(row)
     return rows
 
 def summarize_domain(root, dom):
@@ -89,7 +86,7 @@ def summarize_domain(root, dom):
     if not all(os.path.exists(p) for p in [paths['wb'], paths['agg'], paths['pr'], paths['pet']]):
         print("missing inputs for", root.split('/')[-1], dom); return
 
-    ds_wb  = xr.open_dataset(paths['wb']).sel(time=slice(*PERIOD))
+    ds_wb  = storage.open_wb(paths['wb']).sel(time=slice(*PERIOD))
     ds_agg = xr.open_dataset(paths['agg'])
     ds_pr  = xr.open_dataset(paths['pr']).sel(time=slice(*PERIOD))
     ds_pet = xr.open_dataset(paths['pet']).sel(time=slice(*PERIOD))
@@ -104,9 +101,9 @@ def summarize_domain(root, dom):
 
 
     mon = pd.DataFrame({
-        'P':   wmean(P).resample(time='MS').sum('time').groupby('time.month').mean().to_pandas(),
-        'PET': wmean(PET).resample(time='MS').sum('time').groupby('time.month').mean().to_pandas(),
-        'WB':  wmean(WB).resample(time='MS').sum('time').groupby('time.month').mean().to_pandas(),
+        'P':   aggregation.climatology(wmean(P)).to_pandas(),
+        'PET': aggregation.climatology(wmean(PET)).to_pandas(),
+        'WB':  aggregation.climatology(wmean(WB)).to_pandas(),
     })
     out_mon = os.path.join(root, dom, f'WB_monthly_clim_{dom}_{PERIOD[0][:4]}_{PERIOD[1][:4]}.csv')
     mon.to_csv(out_mon)
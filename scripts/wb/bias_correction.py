@@ -0,0 +1,330 @@
+import os
+import shutil
+import numpy as np
+import xarray as xr
+from netCDF4 import Dataset
+from organized.config import settings
+from organized.scripts.wb import ensemble
+from organized.scripts.wb.compute_pet import as_celsius, kelvin_offset
+from organized.scripts.wb.water_balance import pr_to_mmday
+
+METHODS = ("eqm", "qdm")
+ALIASES = {"pr": ("pr", "precip"), "tas": ("tas", "tmean"), "tasmax": ("tasmax", "tmax"), "tasmin": ("tasmin", "tmin")}
+MULTIPLICATIVE = {"pr"}
+UNITS = {"pr": "mm/day", "tas": "degC", "tasmax": "degC", "tasmin": "degC"}
+TABLES_DIR = "bias_correction"
+CORRECTED_DIR = "bias_corrected_inputs"
+PR_FLOOR = 0.05
+
+
+def _var_path(d, dom, var):
+    for p in (os.path.join(d, f"{var}_{dom}.nc"), os.path.join(d, f"{var}.nc")):
+        if os.path.exists(p):
+            return p
+    return None
+
+
+def reference_path(input_dir, var):
+    """Observed reference on the region grid: settings.BIAS_REFERENCE_DIR or <input_dir>/reference."""
+    ref_dir = settings.BIAS_REFERENCE_DIR or os.path.join(input_dir, "reference")
+    for p in (os.path.join(ref_dir, f"{var}_reference.nc"), os.path.join(ref_dir, f"{var}.nc")):
+        if os.path.exists(p):
+            return p
+    return None
+
+
+def _open(path, var):
+    ds = xr.open_dataset(path)
+    name = next((n for n in ALIASES[var] if n in ds), None)
+    if name is None:
+        ds.close()
+        return None, None, None
+    return ds, ds[name].transpose("time", "lat", "lon"), name
+
+
+def _offset(var, da):
+    """Kelvin offset of a whole variable, decided once before it is split into bands."""
+    return 0.0 if var == "pr" else kelvin_offset(da)
+
+
+def _canonical(var, da, offset):
+    return pr_to_mmday(da) if var == "pr" else as_celsius(da, offset)
+
+
+def _rows(ny, nx, ndays, factor=3):
+    budget = settings.BIAS_BLOCK_MB * 2**20
+    return int(max(1, min(ny, budget // max(1, 8 * ndays * nx * factor))))
+
+
+def _stamp(paths):
+    parts = []
+    for p in paths:
+        st = os.stat(p)
+        parts.append(f"{os.path.abspath(p)}:{st.st_size}:{st.st_mtime_ns}")
+    return "|".join(parts)
+
+
+def _monthly_quantiles(vals, months, qs):
+    """(12, nq, cells) empirical quantiles per calendar month; vals is (time, cells)."""
+    out = np.full((12, len(qs), vals.shape[1]), np.nan)
+    for m in range(1, 13):
+        sel = months == m
+        if sel.any():
+            out[m - 1] = np.nanquantile(vals[sel], qs, axis=0)
+    return out
+
+
+def _interp_rows(x, xp, fp):
+    """
+    Vectorised np.interp for many cells at once: x (t, cells), xp/fp (nq, cells) with xp
+    ascending per cell. Values outside the table keep the end-point offset (constant extrapolation
+    of the correction, handled by the caller).
+    """
+    nq = xp.shape[0]
+    k = (x[:, None, :] > xp[None]).sum(1)
+    k = np.clip(k, 1, nq - 1)
+    cols = np.arange(x.shape[1])[None]
+    x0, x1 = xp[k - 1, cols], xp[k, cols]
+    f0, f1 = fp[k - 1, cols], fp[k, cols]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        w = np.where(x1 > x0, (x - x0) / (x1 - x0), 0.5)
+    return f0 + np.clip(w, 0, 1) * (f1 - f0)
+
+
+def _cdf(x, xp, qs):
+    """Non-exceedance probability of x on the per-cell quantile table xp."""
+    return _interp_rows(x, xp, np.broadcast_to(np.asarray(qs)[:, None], xp.shape))
+
+
+def train(var, hist_path, ref_path, cache_path, base=None):
+    """
+    Per-cell, per-month quantile tables of the model historical run and the reference over
+    BASE_PERIOD, computed band by band and cached in cache_path.
+    """
+    base = base or settings.BASE_PERIOD
+    qs = np.linspace(0, 1, settings.BIAS_QUANTILES)
+    stamp = _stamp([hist_path, ref_path])
+    tag = f"{base[0]}-{base[1]}"
+    if os.path.exists(cache_path):
+        with xr.open_dataset(cache_path) as c:
+            if (c.attrs.get("source") == stamp and c.attrs.get("base_period") == tag
+                    and c.attrs.get("units") == UNITS[var] and c.sizes["quantile"] == qs.size):
+                return c.load()
+
+    dsm, m, _ = _open(hist_path, var)
+    dsr, r, _ = _open(ref_path, var)
+    if m is None or r is None:
+        return None
+    with dsm, dsr:
+        tsl = slice(f"{base[0]}-01-01", f"{base[1]}-12-31")
+        m, r = m.sel(time=tsl), r.sel(time=tsl)
+        if r.sizes["lat"] != m.sizes["lat"] or r.sizes["lon"] != m.sizes["lon"]:
+            r = r.interp(lat=m["lat"], lon=m["lon"], method="nearest")
+        ny, nx = m.sizes["lat"], m.sizes["lon"]
+        om, orf = _offset(var, m), _offset(var, r)
+        hq = np.full((12, qs.size, ny, nx), np.nan)
+        rq = np.full((12, qs.size, ny, nx), np.nan)
+        mm, rm = m["time"].dt.month.values, r["time"].dt.month.values
+        rows = _rows(ny, nx, max(m.sizes["time"], r.sizes["time"]))
+        for r0 in range(0, ny, rows):
+            band = slice(r0, r0 + rows)
+            mv = np.asarray(_canonical(var, m.isel(lat=band), om).values, dtype=float)
+            rv = np.asarray(_canonical(var, r.isel(lat=band), orf).values, dtype=float)
+            nr = mv.shape[1]
+            hq[:, :, r0:r0 + nr] = _monthly_quantiles(mv.reshape(mv.shape[0], -1), mm, qs).reshape(12, qs.size, nr, nx)
+            rq[:, :, r0:r0 + nr] = _monthly_quantiles(rv.reshape(rv.shape[0], -1), rm, qs).reshape(12, qs.size, nr, nx)
+        coords = {"month": np.arange(1, 13), "quantile": qs, "lat": m["lat"].values, "lon": m["lon"].values}
+    tables = xr.Dataset({"hist_q": (("month", "quantile", "lat", "lon"), hq),
+                         "ref_q": (("month", "quantile", "lat", "lon"), rq)},
+                        coords=coords, attrs={"source": stamp, "base_period": tag, "variable": var, "units": UNITS[var]})
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tables.to_netcdf(cache_path)
+    return tables
+
+
+def _correct_block(var, x, months, hq, rq, method, qs):
+    """Corrected (time, cells) block. EQM maps model quantiles onto reference quantiles; QDM adds back the model's own change."""
+    mult = var in MULTIPLICATIVE
+    out = np.full(x.shape, np.nan)
+    for m in np.unique(months):
+        sel = months == m
+        xs, h, r = x[sel], hq[m - 1], rq[m - 1]
+        if method == "qdm":
+            fq = np.nanquantile(xs, qs, axis=0)
+            tau = _cdf(xs, fq, qs)
+            h_tau = _interp_rows(tau, np.broadcast_to(qs[:, None], h.shape), h)
+            r_tau = _interp_rows(tau, np.broadcast_to(qs[:, None], r.shape), r)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                if mult:
+                    out[sel] = r_tau * np.where(h_tau > PR_FLOOR, xs / np.maximum(h_tau, PR_FLOOR), 1.0)
+                else:
+                    out[sel] = r_tau + (xs - h_tau)
+        else:
+            mapped = _interp_rows(xs, h, r)
+            lo, hi = xs < h[0][None], xs > h[-1][None]
+            if mult:
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    ratio_hi = np.where(h[-1] > PR_FLOOR, r[-1] / h[-1], 1.0)
+                mapped = np.where(hi, xs * ratio_hi[None], mapped)
+                mapped = np.where(lo, r[0][None], mapped)
+            else:
+                mapped = np.where(hi, xs + (r[-1] - h[-1])[None], mapped)
+                mapped = np.where(lo, xs + (r[0] - h[0])[None], mapped)
+            out[sel] = mapped
+    if mult:
+        out = np.where(out < PR_FLOOR, 0.0, out)
+    return np.where(np.isfinite(x), out, np.nan)
+
+
+def _create_like(src_path, out_path, var_name, var):
+    """Output file with the source dimensions and coordinates copied, and an empty float32 variable."""
+    with Dataset(src_path) as src:
+        dst = Dataset(out_path, "w")
+        for name, dim in src.dimensions.items():
+            dst.createDimension(name, None if dim.isunlimited() else len(dim))
+        for name, v in src.variables.items():
+            if name == var_name:
+                continue
+            nv = dst.createVariable(name, v.datatype, v.dimensions)
+            nv.setncatts({k: v.getncattr(k) for k in v.ncattrs() if k != "_FillValue"})
+            nv[:] = v[:]
+        sv = src.variables[var_name]
+        dims = tuple(sv.dimensions)
+        out = dst.createVariable(var_name, "f4", sv.dimensions, zlib=True, complevel=4, fill_value=np.float32(np.nan))
+        out.setncatts({k: sv.getncattr(k) for k in sv.ncattrs() if k not in ("_FillValue", "scale_factor", "add_offset", "missing_value")})
+        out.units = UNITS[var]
+        dst.setncatts({k: src.getncattr(k) for k in src.ncattrs()})
+        dst.bias_correction = f"{settings.BIAS_CORRECTION} vs reference, base {settings.BASE_PERIOD[0]}-{settings.BASE_PERIOD[1]}"
+    return dst, dims
+
+
+def _method_of(path):
+    """Correction method recorded in a corrected file (None for links and older outputs)."""
+    try:
+        with Dataset(path) as ds:
+            return getattr(ds, "bias_correction_method", None)
+    except OSError:
+        return None
+
+
+def apply(var, src_path, tables, out_path, method):
+    """
+    Streams src_path through the transfer tables one time block x latitude band at a time and writes
+    the corrected variable to out_path incrementally (netCDF4 slab writes), so memory stays bounded.
+    """
+    ds, da, name = _open(src_path, var)
+    if da is None:
+        return False
+    qs = tables["quantile"].values
+    tmp = out_path + ".tmp"
+    with ds:
+        ny, nx = da.sizes["lat"], da.sizes["lon"]
+        years = da["time"].dt.year.values
+        months_all = da["time"].dt.month.values
+        offset = _offset(var, da)
+        dst, dims = _create_like(src_path, tmp, name, var)
+        dst.bias_correction_method = method
+        order = [dims.index(d) for d in ("time", "lat", "lon")]
+        try:
+            block_years = settings.BIAS_BLOCK_YEARS
+            y0 = int(years.min())
+            blocks = (years - y0) // block_years
+            for b in np.unique(blocks):
+                idx = np.nonzero(blocks == b)[0]
+                tsl = slice(idx[0], idx[-1] + 1)
+                rows = _rows(ny, nx, idx.size, factor=3 + qs.size // 12)
+                for r0 in range(0, ny, rows):
+                    band = slice(r0, min(ny, r0 + rows))
+                    x = np.asarray(_canonical(var, da.isel(time=tsl, lat=band), offset).values, dtype=float)
+                    hq = tables["hist_q"].isel(lat=band).values.reshape(12, qs.size, -1)
+                    rq = tables["ref_q"].isel(lat=band).values.reshape(12, qs.size, -1)
+                    y = _correct_block(var, x.reshape(x.shape[0], -1), months_all[tsl], hq, rq, method, qs)
+                    slab = y.reshape(x.shape).astype("f4").transpose(np.argsort(order))
+                    sl = [None, None, None]
+                    sl[order[0]], sl[order[1]], sl[order[2]] = tsl, band, slice(None)
+                    dst.variables[name][tuple(sl)] = slab
+        finally:
+            dst.close()
+    os.replace(tmp, out_path)
+    return True
+
+
+def _link_or_copy(src, dst):
+    if os.path.exists(dst):
+        os.remove(dst)
+    try:
+        os.symlink(os.path.abspath(src), dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def correct_region(input_dir, output_dir, method=None):
+    """
+    Bias-corrects every domain (and ensemble member) of a region into
+    output_dir/bias_corrected_inputs. Every other input (rsds, sfcWind, hurs, orog, ...) is linked
+    alongside, so the directory is a complete input tree. Returns it, or None when no reference exists.
+    """
+    method = (method or settings.BIAS_CORRECTION or "").lower()
+    if method not in METHODS:
+        return None
+    refs = {v: reference_path(input_dir, v) for v in ALIASES}
+    refs = {v: p for v, p in refs.items() if p}
+    if not refs:
+        print(f"  ⚠️ Sin datos de referencia para corrección de sesgo en {input_dir}")
+        return None
+    out_root = os.path.join(output_dir, CORRECTED_DIR)
+    os.makedirs(out_root, exist_ok=True)
+    if os.path.exists(os.path.join(input_dir, "orog.nc")):
+        _link_or_copy(os.path.join(input_dir, "orog.nc"), os.path.join(out_root, "orog.nc"))
+    hist = "historical_ecuador"
+    for dom in settings.DOMAINS:
+        for member in (ensemble.members(input_dir, dom) or [None]):
+            sub = [dom] + ([member] if member else [])
+            src_dir, dst_dir = os.path.join(input_dir, *sub), os.path.join(out_root, *sub)
+            hist_dir = os.path.join(input_dir, hist, *([member] if member else []))
+            if not os.path.isdir(src_dir):
+                continue
+            os.makedirs(dst_dir, exist_ok=True)
+            done = set()
+            for var in ALIASES:
+                src = _var_path(src_dir, dom, var)
+                if src is None:
+                    continue
+                done.add(os.path.basename(src))
+                dst = os.path.join(dst_dir, os.path.basename(src))
+                hist_src = _var_path(hist_dir, hist, var)
+                if var not in refs or hist_src is None:
+                    _link_or_copy(src, dst)
+                    continue
+                var_method = "eqm" if dom == hist else method
+                if os.path.exists(dst) and not os.path.islink(dst) and _method_of(dst) == var_method and \
+                        os.path.getmtime(dst) >= max(os.path.getmtime(p) for p in (src, hist_src, refs[var])):
+                    continue
+                tag = "_".join(sub[1:] + [var]) if member else var
+                tables = train(var, hist_src, refs[var], os.path.join(output_dir, TABLES_DIR, f"tables_{tag}.nc"))
+                if tables is None:
+                    _link_or_copy(src, dst)
+                    continue
+                print(f"    Corrigiendo sesgo ({method.upper()}) {var} {'/'.join(sub)}")
+                apply(var, src, tables, dst, var_method)
+            for fname in sorted(os.listdir(src_dir)):
+                if fname.endswith(".nc") and fname not in done and os.path.isfile(os.path.join(src_dir, fname)):
+                    _link_or_copy(os.path.join(src_dir, fname), os.path.join(dst_dir, fname))
+    return out_root
+
+
+def run(region_pairs):
+    """
+    Optional stage between clipping and PET. Returns region_pairs with input dirs replaced by
+    the bias-corrected copies (unchanged when settings.BIAS_CORRECTION is off or no reference exists).
+    """
+    if (settings.BIAS_CORRECTION or "").lower() not in METHODS:
+        return region_pairs
+    print("\n" + "="*60)
+    print(f"STEP 1b: BIAS CORRECTION ({settings.BIAS_CORRECTION.upper()})")
+    print("="*60)
+    out = []
+    for input_dir, output_dir in region_pairs:
+        corrected = correct_region(input_dir, output_dir)
+        out.append((corrected or input_dir, output_dir))
+    return out
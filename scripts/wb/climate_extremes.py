@@ -0,0 +1,283 @@
+import os
+import numpy as np
+import xarray as xr
+from numpy.lib.stride_tricks import sliding_window_view
+from organized.config import settings
+from organized.scripts.wb.compute_pet import as_celsius, kelvin_offset
+from organized.scripts.wb.water_balance import pr_to_mmday
+from organized.scripts.wb import storage
+
+INDICES = ("txx", "tnn", "tx90p", "tn10p", "su", "tr", "rx1day", "rx5day", "r95p", "sdii", "cwd")
+UNITS = {
+    "txx": "°C", "tnn": "°C", "tx90p": "%", "tn10p": "%", "su": "días", "tr": "días",
+    "rx1day": "mm", "rx5day": "mm", "r95p": "mm", "sdii": "mm/día", "cwd": "días",
+}
+NEEDS = {
+    "tasmax": ("txx", "tx90p", "su"),
+    "tasmin": ("tnn", "tn10p", "tr"),
+    "pr": ("rx1day", "rx5day", "r95p", "sdii", "cwd"),
+}
+ALIASES = {"tasmax": ("tasmax", "tmax"), "tasmin": ("tasmin", "tmin"), "pr": ("pr", "precip")}
+
+WET_MM = 1.0
+SU_C = 25.0
+TR_C = 20.0
+DOY_WINDOW = 5
+THRESHOLDS_FILE = "extremes_thresholds.nc"
+
+
+def input_path(input_dir, dom, var):
+    for p in (os.path.join(input_dir, dom, f"{var}_{dom}.nc"), os.path.join(input_dir, dom, f"{var}.nc")):
+        if os.path.exists(p):
+            return p
+    return None
+
+
+def _open(path, var):
+    """Lazily opened daily variable (no dask: hyperslab reads go straight to the file) in °C or mm/day."""
+    ds = xr.open_dataset(path)
+    name = next((n for n in ALIASES[var] if n in ds), None)
+    if name is None:
+        ds.close()
+        return None, None
+    return ds, ds[name].transpose("time", "lat", "lon")
+
+
+def _offset(var, da):
+    """Kelvin offset of a whole variable, decided once so every band and year gets the same conversion."""
+    return 0.0 if var == "pr" else kelvin_offset(da)
+
+
+def _convert(var, da, offset):
+    return pr_to_mmday(da) if var == "pr" else as_celsius(da, offset)
+
+
+def _rows_per_band(ny, nx, ndays):
+    budget = settings.EXTREMES_BLOCK_MB * 2**20
+    return int(max(1, min(ny, budget // max(1, 8 * ndays * nx * DOY_WINDOW))))
+
+
+def _stamp(paths):
+    parts = []
+    for p in paths:
+        st = os.stat(p)
+        parts.append(f"{os.path.abspath(p)}:{st.st_size}:{st.st_mtime_ns}")
+    return "|".join(parts)
+
+
+_NOLEAP_START = np.cumsum([0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30])
+
+
+def _doy(da):
+    """
+    Day of year on a 365-day calendar, from month/day so 1 Mar is always 60. 29 Feb shares
+    28 Feb's slot (59); _is_feb29 lets the threshold estimation leave it out.
+    """
+    t = da["time"].dt
+    return _NOLEAP_START[t.month.values - 1] + np.minimum(t.day.values, np.where(t.month.values == 2, 28, 31))
+
+
+def _is_feb29(da):
+    t = da["time"].dt
+    return (t.month.values == 2) & (t.day.values == 29)
+
+
+def _doy_percentile(vals, doy, years, q):
+    """
+    Calendar-day percentile (days, cells) with a centred DOY_WINDOW-day window, pooled over
+    all base years. vals is (time, cells).
+    """
+    uy = np.unique(years)
+    cube = np.full((uy.size, 365, vals.shape[1]), np.nan)
+    cube[np.searchsorted(uy, years), doy - 1] = vals
+    h = DOY_WINDOW // 2
+    cube = np.concatenate([cube[:, -h:], cube, cube[:, :h]], axis=1)
+    win = sliding_window_view(cube, DOY_WINDOW, axis=1)          # (years, 365, cells, window)
+    win = np.moveaxis(win, 2, -1).reshape(uy.size, 365, DOY_WINDOW, -1)
+    return np.nanpercentile(win, q, axis=(0, 2))
+
+
+def thresholds(input_dir, output_dir, base=None):
+    """
+    Base-period thresholds (TX90, TN10 per calendar day; wet-day P95 per cell) from the historical
+    run, computed once and cached in output_dir/extremes_thresholds.nc.
+    """
+    base = base or settings.BASE_PERIOD
+    dom = "historical_ecuador"
+    paths = {v: input_path(input_dir, dom, v) for v in NEEDS}
+    paths = {v: p for v, p in paths.items() if p}
+    if not paths:
+        return None
+    stamp = _stamp(sorted(paths.values()))
+    cache = os.path.join(output_dir, THRESHOLDS_FILE)
+    tag = f"{base[0]}-{base[1]}"
+    if os.path.exists(cache):
+        with xr.open_dataset(cache) as c:
+            if (c.attrs.get("source") == stamp and c.attrs.get("base_period") == tag
+                    and c.attrs.get("calendar") == "noleap" and c.attrs.get("units") == "degC"):
+                return c.load()
+
+    print(f"  Calculando umbrales ETCCDI ({tag})")
+    out, coords = {}, None
+    for var, p in paths.items():
+        ds, da = _open(p, var)
+        if da is None:
+            continue
+        with ds:
+            da = da.sel(time=slice(f"{base[0]}-01-01", f"{base[1]}-12-31"))
+            if da.sizes["time"] == 0:
+                continue
+            ny, nx = da.sizes["lat"], da.sizes["lon"]
+            offset = _offset(var, da)
+            coords = {"doy": np.arange(1, 366), "lat": da["lat"].values, "lon": da["lon"].values}
+            keep = ~_is_feb29(da)
+            doy, years = _doy(da)[keep], da["time"].dt.year.values[keep]
+            res = np.full((365, ny, nx), np.nan) if var != "pr" else np.full((ny, nx), np.nan)
+            rows = _rows_per_band(ny, nx, da.sizes["time"])
+            for r0 in range(0, ny, rows):
+                v = np.asarray(_convert(var, da.isel(lat=slice(r0, r0 + rows)), offset).values, dtype=float)
+                nr = v.shape[1]
+                v = v.reshape(v.shape[0], -1)
+                if var != "pr":
+                    v = v[keep]
+                if var == "tasmax":
+                    res[:, r0:r0 + nr] = _doy_percentile(v, doy, years, 90).reshape(365, nr, nx)
+                elif var == "tasmin":
+                    res[:, r0:r0 + nr] = _doy_percentile(v, doy, years, 10).reshape(365, nr, nx)
+                else:
+                    wet = np.where(v >= WET_MM, v, np.nan)
+                    res[r0:r0 + nr] = np.nanpercentile(wet, 95, axis=0).reshape(nr, nx)
+        name = {"tasmax": "tx90", "tasmin": "tn10", "pr": "pr95"}[var]
+        out[name] = (("doy", "lat", "lon"), res) if var != "pr" else (("lat", "lon"), res)
+    if not out:
+        return None
+    thr = xr.Dataset(out, coords=coords, attrs={"source": stamp, "base_period": tag, "calendar": "noleap", "units": "degC"})
+    thr.to_netcdf(cache)
+    return thr
+
+
+def _wet_spell(wet, carry):
+    """Longest wet spell per cell in this block and the run length still open at its end."""
+    idx = np.arange(wet.shape[0])[:, None]
+    last_dry = np.maximum.accumulate(np.where(wet, -1, idx), axis=0)
+    run = np.where(last_dry < 0, idx + 1 + carry[None], idx - last_dry)
+    return run.max(0), run[-1]
+
+
+def _year_indices(var, v, doy, thr, state):
+    """Annual indices of one variable for one year; v is (days, cells). state carries spells/tails across years."""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        valid = np.isfinite(v)
+        nvalid = valid.sum(0)
+        res = {}
+        if var == "tasmax":
+            res["txx"] = np.nanmax(np.where(valid, v, -np.inf), 0)
+            res["su"] = (v > SU_C).sum(0).astype(float)
+            if thr is not None and "tx90" in thr:
+                res["tx90p"] = 100.0 * (v > thr["tx90"][doy - 1]).sum(0) / nvalid
+        elif var == "tasmin":
+            res["tnn"] = np.nanmin(np.where(valid, v, np.inf), 0)
+            res["tr"] = (v > TR_C).sum(0).astype(float)
+            if thr is not None and "tn10" in thr:
+                res["tn10p"] = 100.0 * (v < thr["tn10"][doy - 1]).sum(0) / nvalid
+        else:
+            v0 = np.where(valid, v, 0.0)
+            wet = v0 >= WET_MM
+            res["rx1day"] = np.nanmax(np.where(valid, v, -np.inf), 0)
+            tail = state.get("tail")
+            ext = v0 if tail is None else np.concatenate([tail, v0])
+            c = np.cumsum(np.concatenate([np.zeros((1, ext.shape[1])), ext]), axis=0)
+            res["rx5day"] = (c[5:] - c[:-5]).max(0) if ext.shape[0] >= 5 else np.full(v.shape[1], np.nan)
+            state["tail"] = ext[-4:]
+            if thr is not None and "pr95" in thr:
+                res["r95p"] = np.where(wet & (v0 > thr["pr95"][None]), v0, 0.0).sum(0)
+            nwet = wet.sum(0)
+            res["sdii"] = np.where(nwet > 0, np.where(wet, v0, 0.0).sum(0) / np.maximum(nwet, 1), np.nan)
+            res["cwd"], state["spell"] = _wet_spell(wet, state.get("spell", np.zeros(v.shape[1])))
+        for k, a in res.items():
+            res[k] = np.where((nvalid > 0) & np.isfinite(a), a, np.nan)
+    return res
+
+
+def compute(input_dir, dom, thr):
+    """
+    ETCCDI indices (year, lat, lon) for one scenario, streaming the inputs one year and one
+    latitude band at a time so national grids never need to be resident in memory.
+    """
+    paths = {v: input_path(input_dir, dom, v) for v in NEEDS}
+    out, coords = {}, None
+    for var, p in paths.items():
+        if not p:
+            continue
+        ds, da = _open(p, var)
+        if da is None:
+            continue
+        with ds:
+            years_all = da["time"].dt.year.values
+            years = np.unique(years_all)
+            ny, nx = da.sizes["lat"], da.sizes["lon"]
+            offset = _offset(var, da)
+            coords = coords or {"year": years, "lat": da["lat"].values, "lon": da["lon"].values}
+            rows = _rows_per_band(ny, nx, 366)
+            tv = {}
+            if thr is not None:
+                for k in ("tx90", "tn10", "pr95"):
+                    if k in thr and thr[k].shape[-2:] == (ny, nx):
+                        tv[k] = np.asarray(thr[k].values, dtype=float)
+            bands = [(r0, min(ny, r0 + rows)) for r0 in range(0, ny, rows)]
+            states = [dict() for _ in bands]
+            for name in NEEDS[var]:
+                out.setdefault(name, np.full((len(coords["year"]), ny, nx), np.nan))
+            for y in years:
+                sel = np.nonzero(years_all == y)[0]
+                yi = int(np.searchsorted(coords["year"], y))
+                if yi >= len(coords["year"]) or coords["year"][yi] != y:
+                    continue
+                chunk = da.isel(time=slice(sel[0], sel[-1] + 1))
+                doy = _doy(chunk)
+                for (r0, r1), st in zip(bands, states):
+                    v = np.asarray(_convert(var, chunk.isel(lat=slice(r0, r1)), offset).values, dtype=float)
+                    v = v.reshape(v.shape[0], -1)
+                    band_thr = {k: a[:, r0:r1].reshape(a.shape[0], -1) if a.ndim == 3 else a[r0:r1].ravel()
+                                for k, a in tv.items()}
+                    for name, a in _year_indices(var, v, doy, band_thr, st).items():
+                        out[name][yi, r0:r1] = a.reshape(r1 - r0, nx)
+    if not out:
+        return None
+    w = np.cos(np.deg2rad(coords["lat"]))[:, None] * np.ones(len(coords["lon"]))
+    data = {}
+    for name in INDICES:
+        if name not in out:
+            continue
+        v = out[name]
+        valid = np.isfinite(v)
+        wv = (w[None] * valid).sum((1, 2))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            area = np.where(wv > 0, (np.where(valid, v, 0) * w[None]).sum((1, 2)) / wv, np.nan)
+        data[name] = (("year", "lat", "lon"), v, {"units": UNITS[name]})
+        data[f"{name}_area"] = (("year",), area, {"units": UNITS[name]})
+    return xr.Dataset(data, coords=coords)
+
+
+def product_path(output_dir, dom):
+    return os.path.join(output_dir, dom, f"extremes_{dom}.nc")
+
+
+def for_domain(input_dir, output_dir, dom, thr=None):
+    """Cached ETCCDI product for a domain; recomputed when missing or older than its inputs or thresholds."""
+    srcs = [p for p in (input_path(input_dir, dom, v) for v in NEEDS) if p]
+    if not srcs:
+        return None
+    out = product_path(output_dir, dom)
+    deps = srcs + [p for p in [os.path.join(output_dir, THRESHOLDS_FILE)] if os.path.exists(p)]
+    if os.path.exists(out) and os.path.getmtime(out) >= max(os.path.getmtime(p) for p in deps):
+        with xr.open_dataset(out) as ds:
+            return ds.load()
+    thr = thr if thr is not None else thresholds(input_dir, output_dir)
+    ds = compute(input_dir, dom, thr)
+    if ds is None:
+        return None
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    storage.to_netcdf(ds, out)
+    print(f"  ✅ Wrote {out}")
+    return ds
@@ -1,26 +1,77 @@
 import os
+import sys
+import warnings
+from contextlib import ExitStack
 import xarray as xr
 import numpy as np
 from organized.config import settings
+from organized.scripts.wb import ensemble, pet_methods, prefetch, storage
 
-def ra_daily_np(lat_deg, doy):
-    phi=np.deg2rad(lat_deg)
-    dr=1+0.033*np.cos(2*np.pi*doy/365.0)
-    delta=0.409*np.sin(2*np.pi*doy/365.0-1.39)
-    ws=np.arccos(np.clip(-np.tan(phi)*np.tan(delta), -1, 1))
-    Gsc=0.0820
-    return (24*60/np.pi)*Gsc*dr*(ws*np.sin(phi)*np.sin(delta)+np.cos(phi)*np.cos(delta)*np.sin(ws))
+EXTRA_VARS = {"rsds": ("rsds",), "sfcWind": ("sfcWind", "wind"), "hurs": ("hurs", "rh")}
+OROG_VARS = ("orog", "elevation", "z", "dem")
 
-def as_celsius(da):
+def kelvin_offset(da):
+    """
+    273.15 when da is in Kelvin, else 0. Decided from the units, or from the NaN-aware median of
+    the first days (a clipped grid's centre cell is often NaN). Call it once per file and pass
+    the result to as_celsius for every band, so all bands get the same conversion.
+    """
     u=str(da.attrs.get('units','')).lower()
-    if 'c' in u: return da
-    sample=float(da.isel(time=0, lat=da.lat.size//2, lon=da.lon.size//2))
-    return da-273.15 if sample>200 else da
-
-def process_domain(input_dir, output_dir, dom):
-    """Read tas* from input_dir/dom, write pet to output_dir/dom."""
-    in_path = os.path.join(input_dir, dom)
-    out_path = os.path.join(output_dir, dom)
+    if 'c' in u: return 0.0
+    if u in ('k', 'kelvin', 'degk', 'deg_k'): return 273.15
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        sample=float(np.nanmedian(np.asarray(da.isel(time=slice(0, 31)).values, dtype=float)))
+    return 273.15 if sample>200 else 0.0
+
+def as_celsius(da, offset=None):
+    offset = kelvin_offset(da) if offset is None else offset
+    return da-offset if offset else da
+
+def _extra_paths(in_path, dom):
+    """Optional Penman-Monteith inputs (radiation, wind, humidity) present next to the temperatures."""
+    out = {}
+    for var in EXTRA_VARS:
+        for p in (os.path.join(in_path, f'{var}_{dom}.nc'), os.path.join(in_path, f'{var}.nc')):
+            if os.path.exists(p):
+                out[var] = p
+                break
+    return out
+
+def _elevation(input_dir, in_path, dom, tmean):
+    """
+    Surface elevation (m) on the temperature grid from orog_<dom>.nc / orog.nc (scenario folder,
+    then the inputs root); falls back to PET_ELEVATION_M with a warning.
+    """
+    for p in (os.path.join(in_path, f'orog_{dom}.nc'), os.path.join(in_path, 'orog.nc'), os.path.join(input_dir, 'orog.nc')):
+        if not os.path.exists(p):
+            continue
+        with xr.open_dataset(p) as ds:
+            name = next((n for n in OROG_VARS if n in ds), None)
+            if name is None:
+                continue
+            z = ds[name].squeeze(drop=True)
+            if z.dims != ('lat', 'lon') or z.shape != tmean.shape[1:]:
+                print(f'    ⚠️ {os.path.basename(p)} is not on the {dom} grid (ignored)')
+                continue
+            return np.asarray(z.values, dtype=float)
+    print(f'    ⚠️ No orography for {dom}; Penman-Monteith uses {settings.PET_ELEVATION_M:g} m for the whole grid')
+    return settings.PET_ELEVATION_M
+
+def select_methods(present, method=None, multi=None):
+    """(primary method, methods to evaluate) for the variables present."""
+    method = (method or settings.PET_METHOD).lower()
+    multi = settings.PET_MULTI if multi is None else multi
+    avail = pet_methods.available(present)
+    primary = method if method in avail else "hargreaves"
+    if primary != method:
+        print(f'    ⚠️ PET method {method} not available with {sorted(present)}; using hargreaves')
+    return primary, (avail if multi else [primary])
+
+def process_domain(input_dir, output_dir, dom, member=None, writer=None):
+    """Read tas* from input_dir/dom[/member], write pet to output_dir/dom[/member] (through writer when given)."""
+    in_path = os.path.join(input_dir, dom, *([member] if member else []))
+    out_path = os.path.join(output_dir, dom, *([member] if member else []))
     os.makedirs(out_path, exist_ok=True)
 
     pmin = os.path.join(in_path, f'tasmin_{dom}.nc')
@@ -38,40 +89,147 @@ def process_domain(input_dir, output_dir, dom):
 
     try:
         print(f'    Calculating PET for {dom}...')
-        with xr.open_dataset(pmin) as dsmin, xr.open_dataset(pmax) as dsmax, xr.open_dataset(pavg) as dst:
-            tmin = as_celsius(dsmin['tasmin' if 'tasmin' in dsmin else 'tmin'])
-            tmax = as_celsius(dsmax['tasmax' if 'tasmax' in dsmax else 'tmax'])
-            tmean = as_celsius(dst['tas' if 'tas' in dst else 'tmean'])
+        with ExitStack() as stack:
+            dsmin = stack.enter_context(xr.open_dataset(pmin))
+            dsmax = stack.enter_context(xr.open_dataset(pmax))
+            dst = stack.enter_context(xr.open_dataset(pavg))
+            arrays = {
+                'tasmin': as_celsius(dsmin['tasmin' if 'tasmin' in dsmin else 'tmin']),
+                'tasmax': as_celsius(dsmax['tasmax' if 'tasmax' in dsmax else 'tmax']),
+                'tas': as_celsius(dst['tas' if 'tas' in dst else 'tmean']),
+            }
+            for var, p in _extra_paths(in_path, dom).items():
+                ds = stack.enter_context(xr.open_dataset(p))
+                name = next((n for n in EXTRA_VARS[var] if n in ds), None)
+                if name is not None:
+                    arrays[var] = ds[name]
 
-            lat = tmin['lat']
-            doy = tmin['time'].dt.dayofyear
-            LAT, DOY = xr.broadcast(lat, doy)
-            Ra = xr.apply_ufunc(ra_daily_np, LAT, DOY, dask='allowed')
-            Ra = Ra.transpose('lat', 'time').expand_dims({'lon': tmin['lon']}).transpose('time', 'lat', 'lon')
+            primary, methods = select_methods(arrays)
+            arrays = {k: arrays[k].transpose('time', 'lat', 'lon') for k in pet_methods.required_vars(methods)}
+            tmean = arrays['tas']
+            monthly = None
+            if any(pet_methods.METHODS[m]['prepare'] for m in methods):
+                monthly = tmean.groupby('time.month').mean('time').transpose('month', 'lat', 'lon').values
+            state = pet_methods.prepare(methods, monthly)
 
-            PET = 0.0023 * Ra * (tmean + 17.8) * ((tmax - tmin).clip(min=0)) ** 0.5
-            PET = PET.rename('pet')
-            PET.attrs.update(units='mm/day', long_name='Hargreaves PET')
+            elevation = _elevation(input_dir, in_path, dom, tmean) if 'penman_monteith' in methods else 0.0
+            lat = tmean['lat'].values
+            doy = tmean['time'].dt.dayofyear.values
+            months = tmean['time'].dt.month.values
+            out = {m: np.empty(tmean.shape, dtype='float32') for m in methods}
+            slices = [slice(s, s + settings.PET_BLOCK_DAYS) for s in range(0, tmean.sizes['time'], settings.PET_BLOCK_DAYS)]
+
+            def _read(sl):
+                return {k: np.asarray(da.isel(time=sl).values, dtype=float) for k, da in arrays.items()}
+
+            # The next time block is read and decompressed while this one is computed.
+            for sl, block, err in prefetch.prefetch(slices, _read):
+                if err is not None:
+                    raise err
+                for m, v in pet_methods.compute(block, lat, doy[sl], months[sl], methods, state, elevation).items():
+                    out[m][sl] = v
+
+            coords = {'time': tmean['time'], 'lat': tmean['lat'], 'lon': tmean['lon']}
+            dims = ('time', 'lat', 'lon')
+            label = pet_methods.METHODS[primary]['label']
+            PET = xr.Dataset({'pet': xr.DataArray(out[primary], coords=coords, dims=dims,
+                                                  attrs={'units': 'mm/day', 'long_name': f'{label} PET', 'method': primary})})
+            if len(methods) > 1:
+                for m in methods:
+                    PET[f'pet_{m}'] = xr.DataArray(out[m], coords=coords, dims=dims,
+                                                   attrs={'units': 'mm/day', 'long_name': f"{pet_methods.METHODS[m]['label']} PET"})
+                stack_ = np.stack([out[m] for m in methods])
+                PET['pet_spread'] = xr.DataArray(stack_.max(0) - stack_.min(0), coords=coords, dims=dims,
+                                                 attrs={'units': 'mm/day', 'long_name': 'PET spread across methods (max - min)',
+                                                        'methods': ','.join(methods)})
+                del stack_
 
             out_file = os.path.join(out_path, f'pet_{dom}.nc')
-            PET.to_netcdf(out_file, encoding={'pet': {'zlib': True, 'complevel': 4}})
-        print(f'    ✅ Wrote {out_file}')
+            written = f'{out_file} ({", ".join(methods)})'
+            if writer is not None:
+                writer.submit(storage.to_netcdf, PET, out_file, label=written)
+                return
+            storage.to_netcdf(PET, out_file)
+        print(f'    ✅ Wrote {written}')
     except Exception as e:
         print(f'    ❌ Error calculating PET for {dom}: {e}')
 
-def run(region_pairs=None):
+def self_test():
+    """
+    Synthetic bias-corrected tree: Kelvin temperatures (with a NaN centre cell) are corrected against
+    a reference, and Penman-Monteith must then run on the corrected tree with its radiation, wind,
+    humidity and orography inputs, and respond to the elevation.
+    """
+    import tempfile
+    from organized.scripts.wb import bias_correction
+    dom = "historical_ecuador"
+    time = np.arange(f"{settings.BASE_PERIOD[0]}-01-01", f"{settings.BASE_PERIOD[0] + 2}-01-01", dtype="datetime64[D]").astype("datetime64[ns]")
+    lat, lon = np.array([-2.0, -1.5, -1.0]), np.array([-79.0, -78.5])
+    rng = np.random.default_rng(0)
+    season = 3 * np.sin(2 * np.pi * np.arange(time.size) / 365.0)[:, None, None]
+    shape = (time.size, lat.size, lon.size)
+
+    def field(v, units):
+        return xr.DataArray(v, coords={"time": time, "lat": lat, "lon": lon}, dims=("time", "lat", "lon"), attrs={"units": units})
+
+    ok = True
+    saved = settings.PET_METHOD
+    with tempfile.TemporaryDirectory() as tmp, warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        inp, out = os.path.join(tmp, "in"), os.path.join(tmp, "out")
+        os.makedirs(os.path.join(inp, dom)); os.makedirs(os.path.join(inp, "reference"))
+        tas = 291.0 + season + rng.normal(0, 1, shape)
+        tas[:, 1, 1] = np.nan  # centre cell: units must not be decided from it
+        for var, off in (("tas", 0.0), ("tasmax", 5.0), ("tasmin", -5.0)):
+            xr.Dataset({var: field(tas + off, "")}).to_netcdf(os.path.join(inp, dom, f"{var}_{dom}.nc"))
+            xr.Dataset({var: field(tas + off - 273.15 - 1.0, "degC")}).to_netcdf(os.path.join(inp, "reference", f"{var}.nc"))
+        xr.Dataset({"rsds": field(np.full(shape, 200.0), "W m-2")}).to_netcdf(os.path.join(inp, dom, f"rsds_{dom}.nc"))
+        xr.Dataset({"sfcWind": field(np.full(shape, 2.0), "m s-1")}).to_netcdf(os.path.join(inp, dom, f"sfcWind_{dom}.nc"))
+        xr.Dataset({"hurs": field(np.full(shape, 70.0), "%")}).to_netcdf(os.path.join(inp, dom, f"hurs_{dom}.nc"))
+        orog = np.zeros((lat.size, lon.size)); orog[:, 1] = 3000.0
+        xr.Dataset({"orog": (("lat", "lon"), orog)}, coords={"lat": lat, "lon": lon}).to_netcdf(os.path.join(inp, "orog.nc"))
+        try:
+            settings.PET_METHOD = "penman_monteith"
+            corrected = bias_correction.correct_region(inp, out, "eqm")
+            with xr.open_dataset(os.path.join(corrected, dom, f"tas_{dom}.nc")) as ds:
+                t = ds["tas"].values
+            good = bool(np.nanmax(np.abs(np.nanmean(t, 0) - (np.nanmean(tas, 0) - 274.15))) < 0.5)
+            print(f"  {'✅' if good else '❌'} corrected tas in °C on every band")
+            ok &= good
+            process_domain(corrected, out, dom)
+            with xr.open_dataset(os.path.join(out, dom, f"pet_{dom}.nc")) as ds:
+                pet = ds["pet"]
+                method = pet.attrs.get("method")
+                high, low = float(pet.isel(lon=1).mean()), float(pet.isel(lon=0).mean())
+            good = method == "penman_monteith" and np.isfinite([high, low]).all() and high != low
+            print(f"  {'✅' if good else '❌'} PET method on the corrected tree: {method} (0 m {low:.2f}, 3000 m {high:.2f} mm/day)")
+            ok &= bool(good)
+        finally:
+            settings.PET_METHOD = saved
+    print(f"{'✅' if ok else '❌'} PET self-test")
+    return ok
+
+def run(region_pairs=None, registry=None):
     """
     Run PET calculation. region_pairs: list of (input_dir, output_dir). Reads from input, writes to output.
+    registry: RegionRegistry whose regions are processed when region_pairs is None.
     """
     print("\n" + "="*60)
-    print("STEP 2: COMPUTING PET (Hargreaves)")
+    print(f"STEP 2: COMPUTING PET ({settings.PET_METHOD}{' + all available methods' if settings.PET_MULTI else ''})")
     print("="*60)
+    if region_pairs is None and registry is not None:
+        region_pairs = registry.pairs()
     if region_pairs is None:
         region_pairs = [(settings.DERIVED_DIR, settings.DERIVED_DIR)]
-    for input_dir, output_dir in region_pairs:
-        print(f"\nProcessing: {input_dir} -> {output_dir}")
-        for dom in settings.DOMAINS:
-            process_domain(input_dir, output_dir, dom)
+    # pet files are written in the background while the next domain is computed.
+    with prefetch.AsyncWriter() as writer:
+        for input_dir, output_dir in region_pairs:
+            print(f"\nProcessing: {input_dir} -> {output_dir}")
+            for dom in settings.DOMAINS:
+                if not ensemble.run_members(process_domain, input_dir, output_dir, dom):
+                    process_domain(input_dir, output_dir, dom, writer=writer)
 
 if __name__ == "__main__":
+    if "--self-test" in sys.argv:
+        sys.exit(0 if self_test() else 1)
     run()
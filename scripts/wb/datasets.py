@@ -0,0 +1,135 @@
+import os
+import threading
+from collections import OrderedDict
+import xarray as xr
+from organized.config import settings
+from organized.scripts.wb import run_scope, storage, working_cache
+
+try:
+    import dask
+except ImportError:
+    dask = None
+
+
+class DatasetPool:
+    """
+    Process-wide registry of open NetCDF datasets.
+    Each path is opened once (lazily, dask-chunked when dask is available) and
+    shared by every module; least recently used handles are closed when the pool
+    exceeds max_handles or max_bytes (logical size of the open datasets).
+    Each entry records the run scopes that used it. Eviction skips handles an active
+    run has used, since its callers may still hold lazy views of them; release(run_id)
+    closes those once no other running session needs them.
+    """
+
+    def __init__(self, max_handles=16, max_bytes=None, chunks=None):
+        self.max_handles = max_handles
+        self.max_bytes = max_bytes
+        self.chunks = chunks
+        self._entries = OrderedDict()
+        self._users = {}
+        self._lock = threading.RLock()
+
+    def _open(self, path, opener):
+        kwargs = {"chunks": self.chunks} if (dask is not None and self.chunks) else {}
+        raw = xr.open_dataset(path, **kwargs)
+        view = opener(raw) if opener else raw
+        return raw, view
+
+    def get(self, path, opener=None):
+        """Returns the shared dataset for path. opener(raw_ds) may decorate it (e.g. storage.with_wb)."""
+        key = (os.path.abspath(path), opener)
+        with self._lock:
+            self._users.setdefault(key, set()).add(run_scope.current())
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key][1]
+            raw, view = self._open(path, opener)
+            self._entries[key] = (raw, view)
+            self._evict()
+            return view
+
+    def _nbytes(self):
+        return sum(raw.nbytes for raw, _ in self._entries.values())
+
+    def _over(self):
+        return len(self._entries) > self.max_handles or (self.max_bytes and self._nbytes() > self.max_bytes)
+
+    def _evict(self):
+        for key in list(self._entries)[:-1]:
+            if not self._over():
+                return
+            if run_scope.in_use(self._users.get(key, ()), None, unscoped=False):
+                continue
+            raw, _ = self._entries.pop(key)
+            self._users.pop(key, None)
+            raw.close()
+
+    def release(self, run_id):
+        """Closes the handles used by run_id that no other active run is using."""
+        with self._lock:
+            for key in [k for k, users in self._users.items() if run_id in users]:
+                users = self._users[key]
+                users.discard(run_id)
+                if run_scope.in_use(users, run_id):
+                    continue
+                del self._users[key]
+                entry = self._entries.pop(key, None)
+                if entry is not None:
+                    entry[0].close()
+
+    def close(self, path):
+        path = os.path.abspath(path)
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == path]:
+                raw, _ = self._entries.pop(key)
+                self._users.pop(key, None)
+                raw.close()
+
+    def close_all(self):
+        with self._lock:
+            self._users.clear()
+            while self._entries:
+                _, (raw, _) = self._entries.popitem(last=False)
+                raw.close()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+POOL = DatasetPool(
+    max_handles=settings.DATASET_POOL_MAX_HANDLES,
+    max_bytes=settings.DATASET_POOL_MAX_MB * 1024 ** 2,
+    chunks=settings.DATASET_CHUNKS,
+)
+
+
+def open_dataset(path):
+    """Shared, lazily opened dataset. Callers must not close it."""
+    return POOL.get(path)
+
+
+def open_wb(path):
+    """
+    Shared wb_<dom>.nc dataset, with wb_mmday rebuilt for lean files. Served from the
+    memmapped working cache when that holds a current copy of the file.
+    """
+    cached = working_cache.open_wb(path)
+    if cached is not None:
+        return cached
+    return POOL.get(path, storage.with_wb)
+
+
+def open_wb_domain(data_dir, dom):
+    """Shared WB dataset for data_dir/dom, or None if the file does not exist."""
+    p = storage.wb_path(data_dir, dom)
+    return open_wb(p) if p else None
+
+
+def close_all():
+    POOL.close_all()
+
+
+def release(run_id):
+    """Closes the pooled handles of one run (see run_scope) that no other run still uses."""
+    POOL.release(run_id)
@@ -0,0 +1,202 @@
+import os
+import warnings
+import numpy as np
+import xarray as xr
+from scipy import special
+from organized.config import settings
+from organized.scripts.wb import aggregation, datasets, storage
+
+MIN_SAMPLES = 10
+PROB_CLIP = 1e-6
+PARAMS_FILE = "drought_params.nc"
+
+
+def monthly_inputs(data_dir, dom):
+    """Monthly P and P - PET (mm/month) from wb_agg_<dom>.nc, falling back to resampling wb_<dom>.nc."""
+    p_agg = storage.agg_path(data_dir, dom)
+    if p_agg:
+        ds = datasets.open_dataset(p_agg)
+        if "p_mon" in ds and "wb_mon" in ds:
+            return ds["p_mon"], ds["wb_mon"], p_agg
+    p = storage.wb_path(data_dir, dom)
+    if p is None:
+        return None, None, None
+    ds = datasets.open_wb(p)
+    return aggregation.resample(ds["p_mmday"], "MS"), aggregation.resample(ds["wb_mmday"], "MS"), p
+
+
+def accumulate(vals, scale):
+    """Running sum over `scale` months along axis 0; the first scale-1 steps are NaN."""
+    out = np.full(vals.shape, np.nan)
+    if vals.shape[0] < scale:
+        return out
+    c = np.cumsum(np.concatenate([np.zeros((1,) + vals.shape[1:]), vals]), axis=0)
+    out[scale - 1:] = c[scale:] - c[:-scale]
+    return out
+
+
+def fit_gamma(x):
+    """
+    Two-parameter gamma fit (Thom's MLE approximation) of x (sample, lat, lon) along axis 0,
+    with the probability of zero as a mixed component. Returns (alpha, beta, q).
+    """
+    valid = np.isfinite(x)
+    pos = valid & (x > 0)
+    n, npos = valid.sum(0), pos.sum(0)
+    xp = np.where(pos, x, np.nan)
+    with warnings.catch_warnings(), np.errstate(invalid="ignore", divide="ignore"):
+        warnings.simplefilter("ignore", RuntimeWarning)
+        mean = np.nanmean(xp, 0)
+        A = np.log(mean) - np.nanmean(np.log(xp), 0)
+        alpha = (1 + np.sqrt(1 + 4 * A / 3)) / (4 * A)
+        beta = mean / alpha
+        q = np.where(n > 0, (n - npos) / np.maximum(n, 1), np.nan)
+    bad = (npos < MIN_SAMPLES) | ~np.isfinite(alpha) | ~np.isfinite(beta)
+    return np.where(bad, np.nan, alpha), np.where(bad, np.nan, beta), q
+
+
+def gamma_cdf(x, alpha, beta, q):
+    with np.errstate(invalid="ignore", divide="ignore"):
+        g = special.gammainc(alpha, np.clip(x, 0, None) / beta)
+    return np.where(np.isfinite(x), q + (1 - q) * np.where(x > 0, g, 0.0), np.nan)
+
+
+def fit_loglogistic(x):
+    """
+    Three-parameter log-logistic fit by unbiased probability-weighted moments
+    (Vicente-Serrano et al., 2010) of x (sample, lat, lon) along axis 0. Returns (alpha, beta, gamma).
+    """
+    xs = np.sort(x, axis=0)
+    n = np.isfinite(xs).sum(0)
+    i = np.arange(1, xs.shape[0] + 1, dtype=float)[:, None, None]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        F = (i - 0.35) / n
+        ok = i <= n
+        w0, w1, w2 = [np.where(ok, (1 - F) ** s * xs, 0.0).sum(0) / n for s in (0, 1, 2)]
+        beta = (2 * w1 - w0) / (6 * w1 - w0 - 6 * w2)
+        g = special.gamma(1 + 1 / beta) * special.gamma(1 - 1 / beta)
+        alpha = (w0 - 2 * w1) * beta / g
+        gam = w0 - alpha * g
+    bad = (n < MIN_SAMPLES) | ~np.isfinite(alpha) | ~np.isfinite(gam) | (beta <= 1)
+    return np.where(bad, np.nan, alpha), np.where(bad, np.nan, beta), np.where(bad, np.nan, gam)
+
+
+def loglogistic_cdf(x, alpha, beta, gam):
+    with np.errstate(invalid="ignore", divide="ignore", over="ignore"):
+        f = 1.0 / (1.0 + (alpha / np.clip(x - gam, 1e-12, None)) ** beta)
+    return np.where(np.isfinite(x), f, np.nan)
+
+
+def to_index(prob):
+    """Standard normal quantile of a non-exceedance probability (clipped to avoid +-inf)."""
+    return special.ndtri(np.clip(prob, PROB_CLIP, 1 - PROB_CLIP))
+
+
+def _by_month(da):
+    da = da.transpose("time", "lat", "lon")
+    return np.asarray(da.values, dtype=float), da["time"].dt.month.values, da["time"].dt.year.values
+
+
+def fit(P, D, scales=None, base=None):
+    """Gamma (SPI) and log-logistic (SPEI) parameters per scale and calendar month, fitted on the base period."""
+    scales = list(scales or settings.DROUGHT_SCALES)
+    base = base or settings.BASE_PERIOD
+    p, months, years = _by_month(P)
+    d, _, _ = _by_month(D)
+    in_base = (years >= int(base[0])) & (years <= int(base[1]))
+    ny, nx = p.shape[1:]
+    shape = (len(scales), 12, ny, nx)
+    out = {k: np.full(shape, np.nan) for k in ("spi_alpha", "spi_beta", "spi_q", "spei_alpha", "spei_beta", "spei_gamma")}
+    for si, s in enumerate(scales):
+        pa, da_ = accumulate(p, s), accumulate(d, s)
+        for m in range(1, 13):
+            sel = in_base & (months == m)
+            out["spi_alpha"][si, m - 1], out["spi_beta"][si, m - 1], out["spi_q"][si, m - 1] = fit_gamma(pa[sel])
+            out["spei_alpha"][si, m - 1], out["spei_beta"][si, m - 1], out["spei_gamma"][si, m - 1] = fit_loglogistic(da_[sel])
+    dims = ("scale", "month", "lat", "lon")
+    return xr.Dataset({k: (dims, v) for k, v in out.items()},
+                      coords={"scale": scales, "month": np.arange(1, 13), "lat": P["lat"].values, "lon": P["lon"].values},
+                      attrs={"base_period": f"{base[0]}-{base[1]}"})
+
+
+def _stamp(path):
+    st = os.stat(path)
+    return f"{os.path.abspath(path)}:{st.st_size}:{st.st_mtime_ns}"
+
+
+def load_params(data_dir, scales=None):
+    """
+    Fitted parameters for a region, cached in data_dir/drought_params.nc. The cache is reused
+    while the historical source file, base period and scales are unchanged.
+    """
+    scales = list(scales or settings.DROUGHT_SCALES)
+    P, D, src = monthly_inputs(data_dir, "historical_ecuador")
+    if P is None:
+        return None
+    base = f"{settings.BASE_PERIOD[0]}-{settings.BASE_PERIOD[1]}"
+    path = os.path.join(data_dir, PARAMS_FILE)
+    if os.path.exists(path):
+        with xr.open_dataset(path) as cached:
+            if (cached.attrs.get("source") == _stamp(src) and cached.attrs.get("base_period") == base
+                    and list(cached["scale"].values) == scales):
+                return cached.load()
+    print(f"  Ajustando parámetros SPI/SPEI ({base}, escalas {scales})")
+    params = fit(P, D, scales)
+    params.attrs["source"] = _stamp(src)
+    params.to_netcdf(path)
+    return params
+
+
+def transform(P, D, params):
+    """SPI and SPEI (time, lat, lon) for every fitted scale, plus cos-lat area means and drought area fraction."""
+    p, months, _ = _by_month(P)
+    d, _, _ = _by_month(D)
+    w = np.cos(np.deg2rad(P["lat"].values))[:, None] * np.ones(p.shape[2])
+    coords = {"time": P["time"].values, "lat": P["lat"].values, "lon": P["lon"].values}
+    out = {}
+    for s in params["scale"].values:
+        ps = params.sel(scale=s)
+        pa, da_ = accumulate(p, int(s)), accumulate(d, int(s))
+        spi, spei = np.full(p.shape, np.nan), np.full(p.shape, np.nan)
+        for m in range(1, 13):
+            sel = months == m
+            pm = ps.sel(month=m)
+            spi[sel] = to_index(gamma_cdf(pa[sel], pm["spi_alpha"].values, pm["spi_beta"].values, pm["spi_q"].values))
+            spei[sel] = to_index(loglogistic_cdf(da_[sel], pm["spei_alpha"].values, pm["spei_beta"].values, pm["spei_gamma"].values))
+        for name, v, acc in ((f"spi_{int(s)}", spi, pa), (f"spei_{int(s)}", spei, da_)):
+            v = np.where(np.isfinite(acc), v, np.nan)
+            valid = np.isfinite(v)
+            wv = (w[None] * valid).sum((1, 2))
+            with np.errstate(invalid="ignore", divide="ignore"):
+                area = np.where(wv > 0, (np.where(valid, v, 0) * w[None]).sum((1, 2)) / wv, np.nan)
+                frac = np.where(wv > 0, ((v < settings.DROUGHT_THRESHOLD) * w[None]).sum((1, 2)) / wv, np.nan)
+            out[name] = (("time", "lat", "lon"), v)
+            out[f"{name}_area"] = (("time",), area)
+            out[f"{name}_frac"] = (("time",), frac)
+    return xr.Dataset(out, coords=coords)
+
+
+def product_path(data_dir, dom):
+    return os.path.join(data_dir, dom, f"drought_{dom}.nc")
+
+
+def for_domain(data_dir, dom, params=None):
+    """Drought-index product for a domain; recomputed only when missing or older than its inputs."""
+    P, D, src = monthly_inputs(data_dir, dom)
+    if P is None:
+        return None
+    out = product_path(data_dir, dom)
+    params_file = os.path.join(data_dir, PARAMS_FILE)
+    fresh = os.path.exists(out) and os.path.getmtime(out) >= os.path.getmtime(src)
+    if fresh and os.path.exists(params_file):
+        fresh = os.path.getmtime(out) >= os.path.getmtime(params_file)
+    if fresh:
+        return datasets.open_dataset(out)
+    params = params if params is not None else load_params(data_dir)
+    if params is None:
+        return None
+    ds = transform(P, D, params)
+    datasets.POOL.close(out)
+    storage.to_netcdf(ds, out)
+    print(f"  ✅ Wrote {out}")
+    return datasets.open_dataset(out)
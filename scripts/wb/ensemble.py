@@ -0,0 +1,172 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import xarray as xr
+from organized.config import settings
+from organized.scripts.wb import run_scope
+
+QKEYS = {0.1: "p10", 0.5: "p50", 0.9: "p90"}
+_warned = set()
+_lock = threading.Lock()
+
+
+def members(base_dir, dom):
+    """
+    Model members of a scenario in the multi-model layout base_dir/<dom>/<model>/*.nc.
+    Returns [] for the single-model layout (files directly in base_dir/<dom>).
+    """
+    d = os.path.join(base_dir, dom)
+    if not os.path.isdir(d):
+        return []
+    out = []
+    for m in sorted(os.listdir(d)):
+        md = os.path.join(d, m)
+        if os.path.isdir(md) and any(f.endswith(".nc") for f in os.listdir(md)):
+            out.append(m)
+    return out
+
+
+def warn_members_only(data_dir, dom, name):
+    """
+    Called when a scenario-level product (name) is missing. When dom only exists as ensemble
+    members, says so once per run: the per-scenario maps, bars, climatologies and baselines skip
+    it, and only the time series and key numbers use the member quantiles.
+    """
+    mems = members(data_dir, dom)
+    if not mems:
+        return False
+    key = (os.path.abspath(data_dir), dom, run_scope.current())
+    with _lock:
+        new = key not in _warned
+        _warned.add(key)
+    if new:
+        print(f"  ⚠️ {dom}: solo hay {len(mems)} miembros de ensamble y no {name} del escenario; "
+              f"se omite en mapas, barras, climatologías y líneas base (series y key numbers usan el ensamble)")
+    return True
+
+
+def run_members(fn, input_dir, output_dir, dom, workers=None):
+    """
+    Runs fn(input_dir, output_dir, dom, member) for every member of dom, in parallel processes.
+    Returns False when dom has no members so the caller falls back to the single-model path.
+    """
+    mems = members(input_dir, dom)
+    if not mems:
+        return False
+    workers = max(1, min(workers or settings.ENSEMBLE_WORKERS, len(mems)))
+    print(f"    Ensemble {dom}: {len(mems)} members ({workers} workers)")
+    if workers == 1:
+        for m in mems:
+            fn(input_dir, output_dir, dom, m)
+        return True
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        list(ex.map(fn, *zip(*[(input_dir, output_dir, dom, m) for m in mems])))
+    return True
+
+
+class QuantileAccumulator:
+    """
+    Collects one reduced array per member (series, window mean, ...) and returns
+    ensemble quantiles. Members are added one at a time, so only the reductions of the
+    members seen so far are held, never their daily cubes.
+    """
+
+    def __init__(self):
+        self.names, self._rows = [], []
+
+    def add(self, name, values):
+        self.names.append(name)
+        self._rows.append(np.asarray(values, dtype=float))
+
+    def __len__(self):
+        return len(self._rows)
+
+    def stack(self):
+        return np.stack(self._rows) if self._rows else None
+
+    def quantiles(self, qs=None):
+        qs = qs or settings.ENSEMBLE_QUANTILES
+        arr = self.stack()
+        if arr is None:
+            return None
+        with np.errstate(invalid="ignore"):
+            return {QKEYS.get(q, f"p{int(round(q * 100))}"): np.nanquantile(arr, q, axis=0) for q in qs}
+
+
+def _area_mean(da):
+    """cos(lat)-weighted mean over the valid cells (NaN outside a clipped AOI is skipped)."""
+    w = xr.DataArray(np.cos(np.deg2rad(da["lat"].values)), coords={"lat": da["lat"]}, dims=["lat"])
+    return da.weighted(w).mean(("lat", "lon"))
+
+
+def _annual_row(path, var, years):
+    with xr.open_dataset(path) as ds:
+        if var not in ds:
+            return None
+        s = _area_mean(ds[var])
+        y = s["time"].dt.year.values
+        row = np.full(years.size, np.nan)
+        sel = (y >= years[0]) & (y <= years[-1])
+        row[y[sel] - years[0]] = s.values[sel]
+    return row
+
+
+def member_series(data_dir, dom, var):
+    """
+    Area-mean annual series of var (p_ann, pet_ann, wb_ann) from each member's wb_agg file,
+    aligned on PERIOD_START..PERIOD_END. Returns (years, QuantileAccumulator) or (None, None).
+    """
+    years = np.arange(settings.PERIOD_START, settings.PERIOD_END + 1)
+    acc = QuantileAccumulator()
+    for m in members(data_dir, dom):
+        p = os.path.join(data_dir, dom, m, f"wb_agg_{dom}.nc")
+        row = _annual_row(p, var, years) if os.path.exists(p) else None
+        if row is not None:
+            acc.add(m, row)
+    if not len(acc):
+        return None, None
+    return years, acc
+
+
+def series_bands(data_dir, dom, var, qs=None):
+    """Ensemble quantile series of an annual variable, or None for single-model domains."""
+    years, acc = member_series(data_dir, dom, var)
+    if acc is None:
+        return None
+    return years, acc.quantiles(qs), len(acc)
+
+
+def window_means(years, acc, t0, t1):
+    """Per-member mean over [t0, t1] as {member: value}."""
+    sel = (years >= int(t0)) & (years <= int(t1))
+    arr = acc.stack()[:, sel]
+    with np.errstate(invalid="ignore"):
+        return dict(zip(acc.names, np.nanmean(arr, axis=1)))
+
+
+def delta_quantiles(data_dir, scen, var, t0, t1, base=None, hist="historical_ecuador", qs=None):
+    """
+    Quantiles across members of (future window mean - base window mean). Each member is
+    compared with the historical member of the same name, or with the historical ensemble
+    median when that model has no historical run.
+    """
+    base = base or settings.BASE_PERIOD
+    yf, accf = member_series(data_dir, scen, var)
+    if accf is None:
+        return None
+    fut = window_means(yf, accf, t0, t1)
+    yh, acch = member_series(data_dir, hist, var)
+    if acch is None:
+        # Single-model historical run shared by every member.
+        p = os.path.join(data_dir, hist, f"wb_agg_{hist}.nc")
+        row = _annual_row(p, var, yf) if os.path.exists(p) else None
+        if row is not None:
+            yh, acch = yf, QuantileAccumulator()
+            acch.add(hist, row)
+    hist_m = window_means(yh, acch, *base) if acch is not None else {}
+    fallback = float(np.nanmedian(list(hist_m.values()))) if hist_m else np.nan
+    acc = QuantileAccumulator()
+    for m, v in fut.items():
+        acc.add(m, [v - hist_m.get(m, fallback)])
+    return {k: float(v[0]) for k, v in acc.quantiles(qs).items()}, len(acc)
@@ -1,11 +1,17 @@
 #!/usr/bin/env python3
 """
-Script para exportar Water Balance como archivos TIFF para períodos específicos.
+Script para exportar Water Balance (y P, PET, AI y sus cambios) como Cloud-Optimised GeoTIFF
+para períodos específicos.
 Períodos: 2020-2040, 2040-2060, 2060-2080, 2080-2100
+
+Las medias de todos los períodos se calculan en una sola pasada agrupada sobre los totales
+anuales de wb_agg_<dom>.nc; los COG llevan teselado interno, overviews y compresión.
 """
 
+import functools
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 import xarray as xr
 import numpy as np
 
@@ -13,12 +19,14 @@ import numpy as np
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
 
 from organized.config import settings
+from organized.scripts.wb import run_scope, storage
 
 
 try:
+    import rasterio
     import rioxarray
 except ImportError:
-    rioxarray = None
+    rasterio = rioxarray = None
 
 
 PERIODOS_ESPECIFICOS = {
@@ -28,120 +36,150 @@ PERIODOS_ESPECIFICOS = {
     "2080-2100": ("2080-01-01", "2100-12-31"),
 }
 
-
+HIST = "historical_ecuador"
 SCENARIOS_FUTUROS = [d for d in settings.DOMAINS if "historical" not in d]
 
+# Variables exportadas: nombre -> variable anual en wb_agg (ai se deriva de p/pet).
+VARIABLES = {"wb": "wb_ann", "p": "p_ann", "pet": "pet_ann", "ai": None}
+UNIDADES = {"wb": "mm/año", "p": "mm/año", "pet": "mm/año", "ai": "P/PET"}
+OUT_SUBDIR = "tifs_periodos_especificos"
 
-def export_wb_tif(root_dir, dominio, periodo_nombre, t0, t1):
-    """
-    Exporta Water Balance agregado anual como TIFF para un período específico.
-
-    Args:
-        root_dir: Directorio raíz de la región
-        dominio: Nombre del dominio (ej: ssp126_ecuador)
-        periodo_nombre: Nombre del período (ej: "2020-2040")
-        t0: Fecha inicio (ej: "2020-01-01")
-        t1: Fecha fin (ej: "2040-12-31")
-    """
-    base_path = os.path.join(root_dir, dominio)
-
-
-    wb_file = os.path.join(base_path, f'wb_{dominio}.nc')
-    if not os.path.exists(wb_file):
-        wb_file_alt = os.path.join(base_path, 'wb.nc')
-        if os.path.exists(wb_file_alt):
-            wb_file = wb_file_alt
-        else:
-            print(f'    ⚠️ Archivo WB no encontrado para {dominio} en {base_path}')
-            return False
-
-    try:
-
-        ds = xr.open_dataset(wb_file)
-
-
-        if 'wb_mmday' not in ds:
-            print(f'    ⚠️ Variable wb_mmday no encontrada en {wb_file}')
-            return False
-
-
-        wb = ds['wb_mmday'].sel(time=slice(t0, t1))
-
-        if wb.sizes.get('time', 0) == 0:
-            print(f'    ⚠️ No hay datos en el período {t0} a {t1} para {dominio}')
-            return False
-
-
-
-        wb_anual = wb.resample(time='YS').sum('time')
-
-        wb_promedio = wb_anual.mean('time')
-
-
-
-        if 'lat' not in wb_promedio.coords or 'lon' not in wb_promedio.coords:
-            print(f'    ⚠️ Coordenadas lat/lon no encontradas en {dominio}')
-            return False
 
+def _agg_path(root_dir, dominio):
+    return storage.agg_path(root_dir, dominio)
 
-        output_dir = os.path.join(root_dir, 'tifs_periodos_especificos')
-        os.makedirs(output_dir, exist_ok=True)
 
+def period_means(root_dir, dominio, periodos):
+    """
+    Medias por período de los totales anuales de cada variable, en una sola pasada:
+    una matriz de pertenencia (período x año) reduce el cubo anual con un único tensordot.
+    Devuelve {var: (n_periodos, lat, lon)} y las coordenadas, o (None, None).
+    """
+    path = _agg_path(root_dir, dominio)
+    if path is None:
+        print(f'    ⚠️ Archivo wb_agg no encontrado para {dominio} en {root_dir}')
+        return None, None
+    with xr.open_dataset(path) as ds:
+        if 'p_ann' not in ds or 'pet_ann' not in ds:
+            print(f'    ⚠️ Variables anuales no encontradas en {path}')
+            return None, None
+        years = ds['p_ann']['time'].dt.year.values
+        member = np.array([(years >= int(t0[:4])) & (years <= int(t1[:4])) for t0, t1 in periodos], dtype=float)
+        coords = {'lat': ds['lat'].values, 'lon': ds['lon'].values}
+        cubes = {k: np.asarray(ds[v].transpose('time', 'lat', 'lon').values, dtype=float)
+                 for k, v in VARIABLES.items() if v and v in ds}
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cubes['ai'] = np.where(cubes['pet'] > 0, cubes['p'] / cubes['pet'], np.nan)
+        out = {}
+        for k, cube in cubes.items():
+            valid = np.isfinite(cube)
+            n = np.tensordot(member, valid.astype(float), 1)
+            s = np.tensordot(member, np.where(valid, cube, 0.0), 1)
+            out[k] = np.where(n > 0, s / n, np.nan)
+    return out, coords
+
+
+def _raster(values, coords, names=None):
+    """DataArray (band, y, x) north-up en EPSG:4326, listo para rio.to_raster."""
+    values = np.asarray(values, dtype='float32')
+    if values.ndim == 2:
+        values = values[None]
+    da = xr.DataArray(values, dims=('band', 'y', 'x'),
+                      coords={'band': np.arange(1, values.shape[0] + 1), 'y': coords['lat'], 'x': coords['lon']})
+    da = da.sortby('y', ascending=False).sortby('x')
+    da = da.rio.write_crs("EPSG:4326").rio.write_nodata(np.nan)
+    if names:
+        da.attrs['long_name'] = tuple(names)
+    return da
+
+
+@functools.lru_cache(maxsize=1)
+def has_cog_driver():
+    """True si el GDAL de rasterio trae el driver COG (GDAL >= 3.1)."""
+    with rasterio.Env() as env:
+        return "COG" in env.drivers()
+
+
+def write_cog(da, output_path):
+    """COG con teselado interno, overviews y compresión; GTiff teselado si el driver COG no existe."""
+    if has_cog_driver():
+        da.rio.to_raster(output_path, driver='COG', compress='DEFLATE', predictor=3,
+                         blocksize=settings.COG_BLOCKSIZE, overview_resampling='average')
+    else:
+        da.rio.to_raster(output_path, driver='GTiff', tiled=True, compress='DEFLATE', predictor=3,
+                         blockxsize=settings.COG_BLOCKSIZE, blockysize=settings.COG_BLOCKSIZE)
+    return output_path
 
-        nombre_archivo = f'wb_{dominio}_{periodo_nombre}.tif'
-        output_path = os.path.join(output_dir, nombre_archivo)
-
-
-        if rioxarray is None:
-            raise ImportError("rioxarray no está instalado. Ejecute: pip install rioxarray")
-
-
-
-        if not hasattr(wb_promedio, 'rio'):
-            wb_promedio = wb_promedio.rio.write_crs("EPSG:4326")
-        elif wb_promedio.rio.crs is None:
-            wb_promedio = wb_promedio.rio.write_crs("EPSG:4326")
-
-
-        if 'lat' in wb_promedio.dims and 'lon' in wb_promedio.dims:
-            wb_promedio = wb_promedio.rename({'lat': 'y', 'lon': 'x'})
-
-
-        if 'y' in wb_promedio.dims and 'x' in wb_promedio.dims:
-
-            wb_promedio = wb_promedio.sortby('y', ascending=False)
-
-
-        wb_promedio.rio.to_raster(output_path, driver='GTiff')
-
-        print(f'    ✅ Exportado: {nombre_archivo}')
-        return True
 
-    except ImportError as e:
-        print(f'    ⚠️ rioxarray no está instalado.')
-        print(f'    Por favor ejecute: pip install rioxarray')
-        return False
-    except Exception as e:
-        print(f'    ❌ Error exportando {dominio} período {periodo_nombre}: {e}')
-        import traceback
-        traceback.print_exc()
-        return False
+def _jobs_for_region(root_dir):
+    """(DataArray, ruta) de cada ráster individual y de las pilas multibanda de la región."""
+    output_dir = os.path.join(root_dir, OUT_SUBDIR)
+    os.makedirs(output_dir, exist_ok=True)
+    periodos = list(PERIODOS_ESPECIFICOS.values())
+    nombres = list(PERIODOS_ESPECIFICOS)
 
+    base = None
+    base_means, base_coords = period_means(root_dir, HIST, [(f"{settings.BASE_PERIOD[0]}", f"{settings.BASE_PERIOD[1]}")])
+    if base_means is not None:
+        base = {k: v[0] for k, v in base_means.items()}
 
-def process_region(root_dir):
+    jobs, stacks = [], {}
+    for dominio in SCENARIOS_FUTUROS:
+        means, coords = period_means(root_dir, dominio, periodos)
+        if means is None:
+            continue
+        same_grid = base is not None and base_coords['lat'].size == coords['lat'].size \
+            and base_coords['lon'].size == coords['lon'].size
+        for var, arr in means.items():
+            for i, periodo in enumerate(nombres):
+                if not np.isfinite(arr[i]).any():
+                    print(f'    ⚠️ No hay datos en el período {periodo} para {dominio}')
+                    continue
+                layers = [(var, arr[i])]
+                if same_grid and var in base:
+                    layers.append((f'delta_{var}', arr[i] - base[var]))
+                for name, values in layers:
+                    fname = f'{name}_{dominio}_{periodo}.tif'
+                    jobs.append((_raster(values, coords), os.path.join(output_dir, fname)))
+                    stacks.setdefault(name, ([], [], coords))
+                    stacks[name][0].append(values)
+                    stacks[name][1].append(f'{dominio.replace("_ecuador", "")}_{periodo}')
+
+    if settings.COG_STACKS:
+        for name, (bands, labels, coords) in stacks.items():
+            jobs.append((_raster(np.stack(bands), coords, labels), os.path.join(output_dir, f'stack_{name}.tif')))
+    return jobs
+
+
+def process_region(root_dir, workers=None):
     """
-    Procesa una región completa, exportando TIFFs para todos los períodos y escenarios.
+    Procesa una región completa, exportando COGs para todos los períodos, escenarios y variables.
     """
     print(f"\nProcesando región: {root_dir}")
+    if rioxarray is None:
+        print(f'    ⚠️ rioxarray no está instalado.')
+        print(f'    Por favor ejecute: pip install rioxarray')
+        return 0, 0
 
+    jobs = _jobs_for_region(root_dir)
     total_exportados = 0
     total_fallidos = 0
 
-    for dominio in SCENARIOS_FUTUROS:
-        print(f"\n  Dominio: {dominio}")
+    def _write(job):
+        da, path = job
+        try:
+            write_cog(da, path)
+            print(f'    ✅ Exportado: {os.path.basename(path)}')
+            return True
+        except Exception as e:
+            print(f'    ❌ Error exportando {os.path.basename(path)}: {e}')
+            return False
 
-        for periodo_nombre, (t0, t1) in PERIODOS_ESPECIFICOS.items():
-            if export_wb_tif(root_dir, dominio, periodo_nombre, t0, t1):
+    workers = max(1, workers or settings.COG_WORKERS)
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        futures = [ex.submit(run_scope.bind(_write), job) for job in jobs]
+        for fut in futures:
+            if fut.result():
                 total_exportados += 1
             else:
                 total_fallidos += 1
@@ -155,21 +193,22 @@ def process_region(root_dir):
 
 def run(target_dirs=None):
     """
-    Ejecuta la exportación de TIFFs para períodos específicos.
+    Ejecuta la exportación de COGs para períodos específicos.
 
     Args:
         target_dirs: Lista de directorios a procesar. Si None, usa las regiones configuradas.
     """
     print("\n" + "="*80)
-    print("EXPORTACIÓN DE WATER BALANCE A TIFF - PERÍODOS ESPECÍFICOS")
+    print("EXPORTACIÓN DE WATER BALANCE A COG - PERÍODOS ESPECÍFICOS")
     print("="*80)
     print("\nPeríodos a procesar:")
     for periodo, (t0, t1) in PERIODOS_ESPECIFICOS.items():
         print(f"  - {periodo}: {t0} a {t1}")
+    print(f"Variables: {', '.join(f'{k} ({UNIDADES[k]})' for k in VARIABLES)} y sus deltas vs {settings.BASE_PERIOD}")
     print()
 
     if target_dirs is None:
-        dirs_to_process = [settings.get_region_output_dir(code) for code in settings.REGIONS]
+        dirs_to_process = [out for _, out in settings.current_registry().pairs()]
     else:
         dirs_to_process = target_dirs
 
@@ -191,11 +230,10 @@ def run(target_dirs=None):
     print("EXPORTACIÓN COMPLETADA")
     print("="*80)
     print(f"\n📊 ESTADÍSTICAS TOTALES:")
-    print(f"   Archivos TIFF exportados: {total_exportados}")
+    print(f"   Archivos COG exportados: {total_exportados}")
     print(f"   Archivos fallidos: {total_fallidos}")
-    print(f"\nLos archivos se encuentran en: tifs_periodos_especificos/ dentro de cada región\n")
+    print(f"\nLos archivos se encuentran en: {OUT_SUBDIR}/ dentro de cada región\n")
 
 
 if __name__ == "__main__":
     run()
-
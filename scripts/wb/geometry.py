@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Shared region-boundary service.
+
+Each shapefile is read, validated and reprojected to EPSG:4326 once per process; the result
+is persisted as WKB under settings.GEOMETRY_CACHE_DIR (keyed by path, size and mtime), so later
+runs skip the shapefile parse and reprojection entirely. Plot modules ask for simplified outline
+segments (tolerance tied to the grid resolution) and build LineCollections from them.
+"""
+import hashlib
+import os
+import sys
+import threading
+
+import numpy as np
+import geopandas as gpd
+from shapely import wkb as shapely_wkb
+from shapely.geometry import GeometryCollection
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
+from organized.config import settings
+from organized.scripts.wb import gis_env
+
+_lock = threading.RLock()
+_geo = {}
+_segs = {}
+
+
+def _stamp(path):
+    parts = []
+    for p in (path, os.path.splitext(path)[0] + ".prj"):
+        if os.path.exists(p):
+            st = os.stat(p)
+            parts.append(f"{os.path.abspath(p)}:{st.st_size}:{st.st_mtime_ns}")
+    return "|".join(parts)
+
+
+def _cache_file(path, stamp):
+    h = hashlib.sha1(stamp.encode("utf-8")).hexdigest()[:16]
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(settings.GEOMETRY_CACHE_DIR, f"{stem}_{h}.wkb")
+
+
+def _read_validated(path):
+    gis_env.setup()
+    g = gpd.read_file(path)
+    if g.crs is None:
+        print(f"  ⚠️ Warning: Shapefile {os.path.basename(path)} has no CRS. Assuming EPSG:4326.")
+        g = g.set_crs("EPSG:4326")
+    if g.crs.to_epsg() != 4326:
+        print(f"  🔍 Reprojecting {os.path.basename(path)} from {g.crs} to EPSG:4326")
+        g = g.to_crs("EPSG:4326")
+    g = g[g.geometry.notna() & ~g.geometry.is_empty]
+    invalid = ~g.geometry.is_valid
+    if invalid.any():
+        g = g.copy()
+        g.loc[invalid, "geometry"] = g.geometry[invalid].buffer(0)
+    return g
+
+
+def load(path):
+    """Region boundary as a GeoDataFrame in EPSG:4326 (geometry only), or None if unavailable."""
+    if not path or not os.path.exists(path):
+        return None
+    stamp = _stamp(path)
+    with _lock:
+        if stamp in _geo:
+            return _geo[stamp]
+        cache = _cache_file(path, stamp)
+        try:
+            if os.path.exists(cache):
+                with open(cache, "rb") as f:
+                    geoms = list(shapely_wkb.loads(f.read()).geoms)
+                g = gpd.GeoDataFrame(geometry=geoms, crs="EPSG:4326")
+            else:
+                g = _read_validated(path)
+                g = gpd.GeoDataFrame(geometry=list(g.geometry), crs="EPSG:4326")
+                try:
+                    os.makedirs(settings.GEOMETRY_CACHE_DIR, exist_ok=True)
+                    tmp = cache + ".tmp"
+                    with open(tmp, "wb") as f:
+                        f.write(shapely_wkb.dumps(GeometryCollection(list(g.geometry))))
+                    os.replace(tmp, cache)
+                except OSError:
+                    pass
+        except Exception as e:
+            print(f"  ❌ Error loading shapefile {path}: {e}")
+            return None
+        _geo[stamp] = g
+        return g
+
+
+def features(path):
+    """Validated EPSG:4326 GeoDataFrame with attributes (one row per feature), or None."""
+    if not path or not os.path.exists(path):
+        return None
+    key = ("features", _stamp(path))
+    with _lock:
+        if key not in _geo:
+            try:
+                _geo[key] = _read_validated(path).reset_index(drop=True)
+            except Exception as e:
+                print(f"  ❌ Error loading shapefile {path}: {e}")
+                return None
+        return _geo[key]
+
+
+def bounds(path):
+    """(minx, miny, maxx, maxy) of the region, or None."""
+    g = load(path)
+    return None if g is None or g.empty else tuple(g.total_bounds)
+
+
+def union(path):
+    """Dissolved region geometry (EPSG:4326), or None."""
+    g = load(path)
+    if g is None or g.empty:
+        return None
+    u = g.geometry.union_all() if hasattr(g.geometry, "union_all") else g.geometry.unary_union
+    return u if u.is_valid else u.buffer(0)
+
+
+def tolerance_for_grid(lat=None, lon=None):
+    """Simplification tolerance (degrees): a fraction of the finest grid spacing, 0 without grid."""
+    steps = [np.abs(np.diff(np.asarray(c, dtype=float))).min()
+             for c in (lat, lon) if c is not None and np.size(c) > 1]
+    return float(min(steps)) * settings.GEOMETRY_SIMPLIFY_FRACTION if steps else 0.0
+
+
+def outline_segments(path, lat=None, lon=None):
+    """Boundary vertices as a list of (N, 2) arrays, simplified for the given grid. Cached."""
+    tol = tolerance_for_grid(lat, lon)
+    g = load(path)
+    if g is None:
+        return []
+    key = (_stamp(path), round(tol, 9))
+    with _lock:
+        if key in _segs:
+            return _segs[key]
+        geoms = g.geometry.simplify(tol, preserve_topology=True) if tol > 0 else g.geometry
+        segs = []
+        for b in geoms.boundary:
+            if b is None or b.is_empty:
+                continue
+            for line in getattr(b, "geoms", [b]):
+                segs.append(np.asarray(line.coords)[:, :2])
+        _segs[key] = segs
+        return segs
+
+
+def outline_collection(path, lat=None, lon=None, colors="k", linewidths=0.9, zorder=5):
+    """New LineCollection over the cached outline segments (artists cannot be shared between axes)."""
+    from matplotlib.collections import LineCollection
+    segs = outline_segments(path, lat, lon)
+    return LineCollection(segs, colors=colors, linewidths=linewidths, zorder=zorder) if segs else None
+
+
+def clear_cache():
+    with _lock:
+        _geo.clear()
+        _segs.clear()
@@ -0,0 +1,42 @@
+"""
+One-time PROJ/GDAL environment setup.
+
+Points PROJ_LIB / GDAL_DATA at the active (conda) prefix when they are unset, registers the
+PROJ data dir with pyproj (GDAL_DATA falls back to fiona's bundled copy) and probes EPSG:4326
+once. Call setup() before the first reprojection or clip; later calls return immediately.
+"""
+import os
+import sys
+import threading
+
+_done = False
+_lock = threading.Lock()
+
+
+def setup():
+    global _done
+    if _done:
+        return
+    with _lock:
+        if _done:
+            return
+        prefix = os.environ.get("CONDA_PREFIX") or getattr(sys, "prefix", "")
+        if prefix:
+            for var, sub in (("PROJ_LIB", ("share", "proj")), ("GDAL_DATA", ("share", "gdal"))):
+                path = os.path.join(prefix, *sub)
+                if os.path.isdir(path):
+                    os.environ.setdefault(var, path)
+        if "GDAL_DATA" not in os.environ:
+            try:
+                import fiona
+                os.environ["GDAL_DATA"] = fiona.datadir
+            except Exception:
+                pass
+        try:
+            from pyproj import datadir, CRS
+            if os.environ.get("PROJ_LIB"):
+                datadir.set_data_dir(os.environ["PROJ_LIB"])
+            CRS.from_epsg(4326)
+        except Exception:
+            pass
+        _done = True
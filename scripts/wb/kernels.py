@@ -0,0 +1,214 @@
+"""
+Hot inner loops with an optional Numba backend.
+
+Every kernel has a NumPy implementation and, when numba is importable, a compiled one
+(parallel over cells/time steps where that applies). Both accumulate in the same order, so
+their results are bit-identical; self_test() checks that on random data.
+
+The backend is chosen at import from settings.KERNEL_BACKEND ("auto", "numba" or "numpy").
+
+    python scripts/wb/kernels.py      # self-test of both backends
+"""
+import math
+import os
+import sys
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
+from organized.config import settings
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+BACKENDS = ("numpy", "numba") if numba is not None else ("numpy",)
+BACKEND = "numba" if numba is not None and settings.KERNEL_BACKEND in ("auto", "numba") else "numpy"
+if settings.KERNEL_BACKEND == "numba" and numba is None:
+    print("⚠️ numba no está instalado; se usan los kernels NumPy")
+
+
+def set_backend(name):
+    global BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"backend no disponible: {name} (disponibles: {', '.join(BACKENDS)})")
+    BACKEND = name
+
+
+# --- NumPy implementations ------------------------------------------------------------------
+def _roll_nanmean_np(y, half, min_pts):
+    n = y.size
+    padded = np.concatenate([np.full(half, np.nan), y, np.full(half, np.nan)])
+    acc = np.zeros(n)
+    cnt = np.zeros(n, dtype=np.int64)
+    for j in range(2 * half + 1):
+        w = padded[j:j + n]
+        ok = np.isfinite(w)
+        acc += np.where(ok, w, 0.0)
+        cnt += ok
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(cnt >= min_pts, acc / cnt, np.nan)
+
+
+def _max_runs_np(mask, starts):
+    T = mask.shape[0]
+    idx = np.arange(T)[:, None]
+    first = np.repeat(starts, np.diff(np.r_[starts, T]))[:, None]
+    last_break = np.maximum.accumulate(np.maximum(np.where(mask, -1, idx), first - 1), axis=0)
+    return np.maximum.reduceat(idx - last_break, starts, axis=0)
+
+
+def _hargreaves_np(ra, tas, tasmax, tasmin):
+    return 0.0023 * ra * (tas + 17.8) * np.clip(tasmax - tasmin, 0, None) ** 0.5
+
+
+# --- Numba implementations (same accumulation order as above) -------------------------------
+if numba is not None:
+    @numba.njit(cache=True, parallel=True)
+    def _roll_nanmean_nb(y, half, min_pts):
+        n = y.size
+        out = np.empty(n)
+        for i in numba.prange(n):
+            s = 0.0
+            c = 0
+            for j in range(2 * half + 1):
+                k = i - half + j
+                if 0 <= k < n:
+                    v = y[k]
+                    if np.isfinite(v):
+                        s += v
+                        c += 1
+                    else:
+                        s += 0.0
+                else:
+                    s += 0.0
+            out[i] = s / c if c >= min_pts else np.nan
+        return out
+
+    @numba.njit(cache=True, parallel=True)
+    def _max_runs_nb(mask, starts):
+        T, ncell = mask.shape
+        nseg = starts.size
+        out = np.zeros((nseg, ncell), dtype=np.int64)
+        for c in numba.prange(ncell):
+            for s in range(nseg):
+                end = starts[s + 1] if s + 1 < nseg else T
+                run = 0
+                best = 0
+                for t in range(starts[s], end):
+                    if mask[t, c]:
+                        run += 1
+                        if run > best:
+                            best = run
+                    else:
+                        run = 0
+                out[s, c] = best
+        return out
+
+    @numba.njit(cache=True, parallel=True)
+    def _hargreaves_nb(ra, tas, tasmax, tasmin):
+        T, ny, nx = tas.shape
+        out = np.empty((T, ny, nx))
+        for t in numba.prange(T):
+            for j in range(ny):
+                r = 0.0023 * ra[t, j]
+                for i in range(nx):
+                    d = tasmax[t, j, i] - tasmin[t, j, i]
+                    if d < 0:
+                        d = 0.0
+                    out[t, j, i] = r * (tas[t, j, i] + 17.8) * math.sqrt(d)
+        return out
+
+
+# --- public kernels ---------------------------------------------------------------------------
+def roll_nanmean(y, k, min_frac=0.6):
+    """
+    Centred moving mean over 2*(k//2)+1 points ignoring NaN; NaN where fewer than
+    ceil(k*min_frac) valid points. Series shorter than 2 (or k <= 1) are returned as is.
+    """
+    y = np.asarray(y, float)
+    if k <= 1 or y.size < 2:
+        return y
+    half, min_pts = int(k) // 2, max(1, int(np.ceil(k * min_frac)))
+    if BACKEND == "numba":
+        return _roll_nanmean_nb(np.ascontiguousarray(y), half, min_pts)
+    return _roll_nanmean_np(y, half, min_pts)
+
+
+def max_runs(mask, starts=None):
+    """
+    Longest run of True along axis 0 within each segment (segment i starts at starts[i];
+    default: one segment). mask is (time, ...); returns int64 (n_segments, ...).
+    """
+    mask = np.asarray(mask, dtype=bool)
+    starts = np.zeros(1, dtype=np.int64) if starts is None else np.asarray(starts, dtype=np.int64)
+    shape = (starts.size,) + mask.shape[1:]
+    if mask.shape[0] == 0 or starts.size == 0:
+        return np.zeros(shape, dtype=np.int64)
+    flat = mask.reshape(mask.shape[0], -1)
+    if BACKEND == "numba":
+        out = _max_runs_nb(np.ascontiguousarray(flat), starts)
+    else:
+        out = _max_runs_np(flat, starts)
+    return out.reshape(shape)
+
+
+def hargreaves(ra, tas, tasmax, tasmin):
+    """Hargreaves PET (mm/day); ra is MJ m-2 day-1 as (time, lat[, 1]), temperatures (time, lat, lon) in °C."""
+    ra = np.asarray(ra, dtype=float)
+    tas, tasmax, tasmin = (np.asarray(a, dtype=float) for a in (tas, tasmax, tasmin))
+    if BACKEND == "numba" and tas.ndim == 3:
+        ra2 = np.ascontiguousarray(np.broadcast_to(ra.reshape(ra.shape[0], -1), tas.shape[:2]))
+        return _hargreaves_nb(ra2, *(np.ascontiguousarray(a) for a in (tas, tasmax, tasmin)))
+    return _hargreaves_np(ra, tas, tasmax, tasmin)
+
+
+def self_test(seed=0):
+    """Runs every kernel with each available backend on random data; True when all agree bit for bit."""
+    rng = np.random.default_rng(seed)
+    y = rng.normal(size=301)
+    y[rng.random(301) < 0.15] = np.nan
+    mask = rng.random((400, 37)) < 0.6
+    starts = np.r_[0, np.sort(rng.choice(np.arange(1, 400), 11, replace=False))]
+    tas = rng.normal(20, 5, (60, 7, 9))
+    tasmax = tas + rng.normal(4, 3, tas.shape)
+    tasmin = tas - rng.normal(4, 3, tas.shape)
+    tas[0, 0, 0] = np.nan
+    ra = rng.uniform(25, 40, (60, 7, 1))
+
+    cases = {
+        "roll_nanmean": lambda: roll_nanmean(y, 11),
+        "roll_nanmean_even": lambda: roll_nanmean(y, 10, 0.8),
+        "max_runs": lambda: max_runs(mask, starts),
+        "hargreaves": lambda: hargreaves(ra, tas, tasmax, tasmin),
+    }
+    previous = BACKEND
+    results = {}
+    try:
+        for backend in BACKENDS:
+            set_backend(backend)
+            results[backend] = {name: fn() for name, fn in cases.items()}
+    finally:
+        set_backend(previous)
+
+    ok = True
+    ref = results["numpy"]
+    for name in cases:
+        for backend in BACKENDS[1:]:
+            same = np.array_equal(ref[name], results[backend][name], equal_nan=True)
+            ok &= same
+            print(f"  {'✅' if same else '❌'} {name}: numpy vs {backend}")
+    # Reference check of the run-length kernel against a plain loop.
+    for s, e in zip(starts, np.r_[starts[1:], mask.shape[0]]):
+        for c in range(mask.shape[1]):
+            best = run = 0
+            for v in mask[s:e, c]:
+                run = run + 1 if v else 0
+                best = max(best, run)
+            ok &= bool(ref["max_runs"][np.searchsorted(starts, s), c] == best)
+    print(f"{'✅' if ok else '❌'} Kernels ({', '.join(BACKENDS)}), backend activo: {BACKEND}")
+    return ok
+
+
+if __name__ == "__main__":
+    sys.exit(0 if self_test() else 1)
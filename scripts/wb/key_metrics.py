@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+"""
+Key climate-change numbers of a region (key_numbers.json / key_numbers.txt).
+
+Each scenario's daily area-mean P/PET/WB and tas are read once from the series store and
+reduced in one pass to year tables: annual totals, AI, dry days, CDD, mean temperature and
+(year, month) totals. Baseline and window numbers are masked means over those tables, so a
+window costs a year slice instead of a reload. The wet/dry trimesters are taken from the
+baseline monthly climatology and reused for every window.
+
+KeyNumbers holds the whole result of a region; run() computes the regions in parallel
+(KEY_METRICS_WORKERS processes) and writes both files from it.
+"""
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
+from organized.config import settings
+from organized.scripts.wb import aggregation, ensemble, kernels, series_store
+
+np.seterr(all="ignore")
+
+HIST = "historical_ecuador"
+SCENS = ["ssp126_ecuador", "ssp370_ecuador", "ssp585_ecuador"]
+BASE = settings.BASE_PERIOD
+WIN_NAMES = {"cercano": "Cercano", "medio": "Medio", "tardio": "Tardío"}
+WINS = [tuple(str(y) for y in settings.WINDOWS[k]) for k in WIN_NAMES]
+WIN_LABEL = {w: f"{WIN_NAMES[k]} ({w[0]}–{w[1]})" for k, w in zip(WIN_NAMES, WINS)}
+LATE = WINS[-1]
+DRY_THRESH_MM = 1.0
+WB_VARS = ("P", "PET", "WB")
+N2M = {1: "Ene", 2: "Feb", 3: "Mar", 4: "Abr", 5: "May", 6: "Jun", 7: "Jul", 8: "Ago", 9: "Sep", 10: "Oct", 11: "Nov", 12: "Dic"}
+
+
+def label_trim(months):
+    return "-".join(N2M[m] for m in months)
+
+
+def _mean(x):
+    x = np.asarray(x, dtype=float)
+    return float(np.nanmean(x)) if np.isfinite(x).any() else np.nan
+
+
+class YearTable:
+    """Per-year values of one scenario, from its full daily series (one reduction per quantity)."""
+
+    def __init__(self, ds, tas=None):
+        idx = aggregation.time_index(ds["time"])
+        starts, _ = idx.segments("YS")
+        self.years = idx.year[starts]
+        daily = np.column_stack([np.asarray(ds[v].values, dtype=float) for v in WB_VARS])
+        ann = aggregation.reduce_segments(daily, starts, "sum")
+        self.annual = dict(zip(WB_VARS, ann.T))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            ai = self.annual["P"] / self.annual["PET"]
+        self.annual["AI"] = np.where(np.isfinite(ai), ai, np.nan)
+
+        dry = daily[:, 0] < DRY_THRESH_MM
+        self.annual["dry_days"] = aggregation.reduce_segments(dry.astype(float), starts, "sum")
+        self.annual["CDD"] = kernels.max_runs(dry, starts).astype(float)
+
+        mstarts, _ = idx.segments("MS")
+        rows = np.searchsorted(self.years, idx.year[mstarts])
+        self.monthly = np.full((self.years.size, 12, len(WB_VARS)), np.nan)
+        self.monthly[rows, idx.month[mstarts] - 1] = aggregation.reduce_segments(daily, mstarts, "sum")
+
+        self.tas_years, self.tas = np.zeros(0, int), np.zeros(0)
+        if tas is not None:
+            tidx = aggregation.time_index(tas["time"])
+            tstarts, _ = tidx.segments("YS")
+            self.tas_years = tidx.year[tstarts]
+            self.tas = aggregation.reduce_segments(np.asarray(tas.values, dtype=float), tstarts, "mean")
+
+    def window(self, t0, t1):
+        """Means over the years [t0, t1], or None when the window has no year."""
+        sel = (self.years >= int(t0)) & (self.years <= int(t1))
+        if not sel.any():
+            return None
+        out = {k: _mean(v[sel]) for k, v in self.annual.items()}
+        out.update({f"{k}_std": float(np.nanstd(self.annual[k][sel])) for k in WB_VARS})
+        tsel = (self.tas_years >= int(t0)) & (self.tas_years <= int(t1))
+        out["Temp"] = _mean(self.tas[tsel])
+        # Mean annual cycle of monthly totals: (12, variable).
+        out["clim"] = np.nanmean(self.monthly[sel], axis=0)
+        return out
+
+
+def trimesters(clim_p):
+    """Wettest and driest three consecutive months of a monthly P climatology (12,)."""
+    ext = np.r_[clim_p, clim_p[:2]]
+    sums = np.convolve(ext, np.ones(3), "valid")[:12]
+
+    def tri(start):
+        return [(start - 1) % 12 + 1, start % 12 + 1, (start + 1) % 12 + 1]
+
+    return {"wet": tri(int(np.nanargmax(sums)) + 1), "dry": tri(int(np.nanargmin(sums)) + 1)}
+
+
+def tri_sums(stats, months):
+    """{var: total over the trimester} from the window's monthly climatology."""
+    cols = stats["clim"][np.asarray(months) - 1]
+    return {v: float(np.nansum(cols[:, i])) for i, v in enumerate(WB_VARS)}
+
+
+def load_table(input_dir, output_dir, dom):
+    ds = series_store.dataset(output_dir, dom, list(WB_VARS), input_dir=input_dir)
+    if ds is None or any(v not in ds for v in WB_VARS):
+        return None
+    # tas is read separately: its time axis may cover other years than the WB series.
+    tas = series_store.dataset(output_dir, dom, ["tas"], input_dir=input_dir)
+    return YearTable(ds, tas["tas"] if tas is not None and "tas" in tas else None)
+
+
+def ensemble_section(data_dir):
+    """Ensemble quantiles (p10/p50/p90) of annual ΔP, ΔPET, ΔWB per scenario and window; {} without members."""
+    out = {}
+    for scen in SCENS:
+        if not ensemble.members(data_dir, scen):
+            continue
+        scen_out = {}
+        for (t0, t1) in WINS:
+            win = {}
+            for key, var in (("P", "p_ann"), ("PET", "pet_ann"), ("WB", "wb_ann")):
+                res = ensemble.delta_quantiles(data_dir, scen, var, t0, t1, base=BASE, hist=HIST)
+                if res is None:
+                    continue
+                q, n = res
+                win[key] = {k: round(v) if np.isfinite(v) else None for k, v in q.items()}
+                scen_out["n_members"] = n
+            if win:
+                scen_out[f"{t0}-{t1}"] = win
+        if scen_out:
+            out[scen.replace('_ecuador', '')] = scen_out
+    return out
+
+
+def _r(x, nd=0):
+    if x is None or not np.isfinite(x):
+        return None
+    return round(x) if nd == 0 else round(x, nd)
+
+
+def _pct(d, ref):
+    return d / ref * 100.0 if ref else np.nan
+
+
+class KeyNumbers:
+    """All key numbers of one region; to_dict() is the key_numbers.json schema, lines() the report."""
+
+    def __init__(self, region, base, tri=None):
+        self.region = region
+        self.base = base
+        self.tri = tri
+        self.base_tri = {k: tri_sums(base, m) for k, m in tri.items()} if tri else {}
+        self.windows = {}
+        self.ensemble = {}
+
+    def add_window(self, scen, t0, t1, stats):
+        """Stores the changes of scenario window stats (or None: no data) relative to the baseline."""
+        b = self.base
+        if stats is None:
+            self.windows[(scen, t0, t1)] = None
+            return
+        d = {k: stats[k] - b[k] for k in ("P", "PET", "WB", "AI", "dry_days", "CDD", "Temp")}
+        for k in WB_VARS:
+            d[f"{k}_pct"] = _pct(d[k], b[k])
+        for k, months in (self.tri or {}).items():
+            fut = tri_sums(stats, months)
+            for v in WB_VARS:
+                d[f"{v}_{k}"] = fut[v] - self.base_tri[k][v]
+        self.windows[(scen, t0, t1)] = d
+
+    def to_dict(self):
+        b = self.base
+        baseline = {
+            "P_annual": {"mean": _r(b["P"]), "std": _r(b["P_std"])},
+            "PET_annual": {"mean": _r(b["PET"]), "std": _r(b["PET_std"])},
+            "WB_annual": {"mean": _r(b["WB"]), "std": _r(b["WB_std"])},
+            "AI": _r(b["AI"], 2),
+            "Dry_Days": _r(b["dry_days"]),
+            "CDD": _r(b["CDD"]),
+            "Temp": _r(b["Temp"], 1),
+        }
+        if self.tri:
+            baseline["seasonality"] = {"wet_quarter": label_trim(self.tri["wet"]),
+                                       "dry_quarter": label_trim(self.tri["dry"])}
+        projections = {}
+        for scen in SCENS:
+            scen_out = projections.setdefault(scen.replace('_ecuador', ''), {})
+            for (t0, t1) in WINS:
+                d = self.windows.get((scen, t0, t1))
+                if d is None:
+                    continue
+                win = {}
+                for k in WB_VARS:
+                    win[f"delta_{k}_mm"] = _r(d[k])
+                    win[f"delta_{k}_pct"] = _r(d[f"{k}_pct"], 1)
+                win.update({"delta_AI": _r(d["AI"], 2), "delta_DryDays": _r(d["dry_days"]),
+                            "delta_CDD": _r(d["CDD"]), "delta_Temp": _r(d["Temp"], 1)})
+                for k in (self.tri or {}):
+                    for v in WB_VARS:
+                        win[f"delta_{v}_{k}_quarter_mm"] = _r(d[f"{v}_{k}"])
+                scen_out[f"{t0}-{t1}"] = win
+        out = {"region": self.region, "base_period": f"{BASE[0]}-{BASE[1]}",
+               "baseline": baseline, "projections": projections}
+        if self.ensemble:
+            out["ensemble"] = self.ensemble
+        return out
+
+    def lines(self):
+        b = self.base
+        out = [f"# NÚMEROS CLAVE DE CAMBIO CLIMÁTICO — {self.region}",
+               f"Período base: {BASE[0]}–{BASE[1]}",
+               "",
+               "## Oferta hídrica y balance — Línea base (promedio ± DE)",
+               f"• Precipitación anual: {b['P']:,.0f} ± {b['P_std']:,.0f} mm/año",
+               f"• Evapotranspiración potencial anual: {b['PET']:,.0f} ± {b['PET_std']:,.0f} mm/año",
+               f"• Balance hídrico anual (P - PET): {b['WB']:,.0f} ± {b['WB_std']:,.0f} mm/año",
+               f"• Índice de aridez (AI = P/PET): {b['AI']:,.2f}",
+               f"• Días secos por año (P<{DRY_THRESH_MM} mm/día): {b['dry_days']:,.0f} días/año",
+               f"• Racha seca máxima media (CDD): {b['CDD']:,.0f} días"]
+        if np.isfinite(b["Temp"]):
+            out.append(f"• Temperatura media anual: {b['Temp']:,.1f} °C")
+        out.append("")
+
+        if self.tri:
+            out.append("## Estacionalidad — Línea base (trimestres)")
+            for k, name in (("wet", "Trimestre más húmedo"), ("dry", "Trimestre más seco  ")):
+                s = self.base_tri[k]
+                out.append(f"• {name} (base): {label_trim(self.tri[k])} | P={s['P']:,.0f} mm, PET={s['PET']:,.0f} mm, WB={s['WB']:,.0f} mm")
+            out.append("")
+        else:
+            out += ["⚠ No fue posible definir trimestres húmedo/seco (datos base insuficientes).", ""]
+
+        out.append(f"## Cambios proyectados vs {BASE[0]}–{BASE[1]}")
+        for scen in SCENS:
+            out.append(f"### {scen.replace('_ecuador', '').upper()}")
+            for (t0, t1) in WINS:
+                d = self.windows.get((scen, t0, t1))
+                if d is None:
+                    out.append(f"• {WIN_LABEL[(t0, t1)]}: sin datos")
+                    continue
+                out.append(f"• {WIN_LABEL[(t0, t1)]}:")
+                out.append(f"   – ΔP = {d['P']:,.0f} mm/año ({d['P_pct']:+.1f}%) | ΔPET = {d['PET']:,.0f} mm/año ({d['PET_pct']:+.1f}%) | ΔWB = {d['WB']:,.0f} mm/año ({d['WB_pct']:+.1f}%)")
+                out.append(f"   – ΔAI (P/PET) = {d['AI']:+.2f}")
+                out.append(f"   – Δ días secos/año = {d['dry_days']:+.0f} | Δ CDD = {d['CDD']:+.0f} días")
+                if np.isfinite(d["Temp"]):
+                    out.append(f"   – ΔT media anual = {d['Temp']:+.1f} °C")
+                if self.tri:
+                    out.append(f"   – Trimestre húmedo ({label_trim(self.tri['wet'])}) ΔP={d['P_wet']:+.0f} mm, ΔPET={d['PET_wet']:+.0f} mm, ΔWB={d['WB_wet']:+.0f} mm")
+                    out.append(f"   – Trimestre seco   ({label_trim(self.tri['dry'])}) ΔP={d['P_dry']:+.0f} mm, ΔPET={d['PET_dry']:+.0f} mm, ΔWB={d['WB_dry']:+.0f} mm")
+            out.append("")
+
+        if self.ensemble:
+            out.append(f"## Ensamble multi-modelo — mediana [p10–p90] de cambios vs {BASE[0]}–{BASE[1]}")
+            fmt = lambda v: "s/d" if v is None else f"{v:,.0f}"
+            for scen_key, wins in self.ensemble.items():
+                out.append(f"### {scen_key.upper()} (n={wins['n_members']} modelos)")
+                for (t0, t1) in WINS:
+                    d = wins.get(f"{t0}-{t1}")
+                    if not d:
+                        continue
+                    txt = " | ".join(f"Δ{k} = {fmt(d[k]['p50'])} [{fmt(d[k]['p10'])} – {fmt(d[k]['p90'])}] mm/año"
+                                     for k in WB_VARS if k in d)
+                    out.append(f"• {WIN_LABEL[(t0, t1)]}: {txt}")
+                out.append("")
+
+        out += ["Notas:",
+                f"• ‘Días secos’ definidos como P < {DRY_THRESH_MM} mm/día (serie promediada espacialmente).",
+                "• CDD = racha seca máxima anual sobre la serie promediada espacialmente.",
+                "• Índice de aridez AI = P/PET con promedios anuales (mm/año).",
+                "• Cambios estacionales calculados sobre los trimestres húmedo/seco definidos con la línea base.",
+                ""]
+        return out + self._summary_lines()
+
+    def _summary_lines(self):
+        def fmt(x, spec, suffix=""):
+            return "N/D" if x is None or not np.isfinite(x) else f"{x:{spec}}{suffix}"
+
+        late = {scen: self.windows.get((scen,) + LATE) for scen in SCENS}
+        out = ["### Resumen ejecutivo (para tomadores de decisión)",
+               f"Horizonte: {LATE[0]}–{LATE[1]} respecto a {BASE[0]}–{BASE[1]}."]
+        for scen, name in zip(SCENS, ("Trayectoria baja (SSP1-2.6)", "Trayectoria media (SSP3-7.0)", "Trayectoria alta (SSP5-8.5)")):
+            m = late[scen]
+            if not m:
+                out.append(f"- {name}: sin datos para {LATE[0]}–{LATE[1]}.")
+                continue
+            temp = "" if not np.isfinite(m["Temp"]) else "Temperatura: " + fmt(m["Temp"], "+.1f", " °C")
+            out.append((f"- {name}: el balance hídrico anual cambia {fmt(m['WB'], '+.0f')} mm/año "
+                        f"({fmt(m['WB_pct'], '+.1f', '%')}); la precipitación {fmt(m['P'], '+.0f')} mm/año "
+                        f"({fmt(m['P_pct'], '+.1f', '%')}) y la PET {fmt(m['PET'], '+.0f')} mm/año ({fmt(m['PET_pct'], '+.1f', '%')}). "
+                        f"El índice de aridez varía {fmt(m['AI'], '+.2f')}. Se esperan {fmt(m['dry_days'], '+.0f')} días secos/año "
+                        f"adicionales (o menos) y un cambio en la racha seca máxima de {fmt(m['CDD'], '+.0f')} días. "
+                        f"{temp}").strip())
+        out.append("")
+        if all(late.values()):
+            dir_wb = "menor disponibilidad hídrica" if np.nanmean([m["WB"] for m in late.values()]) < 0 else "mayor disponibilidad hídrica"
+            out += ["Mensajes clave:",
+                    f"• Las señales son coherentes entre escenarios: tendencia hacia {dir_wb} a finales de siglo (magnitud creciente de SSP1-2.6 → SSP5-8.5).",
+                    "• La aridez (AI) se desplaza en la misma dirección que el balance hídrico: reducciones en AI implican mayor estrés hídrico relativo.",
+                    "• Aumentos en días secos y rachas secas largas sugieren reforzar medidas de almacenamiento, eficiencia y gestión de la demanda.",
+                    "• Prioridades: proteger fuentes de agua (páramos/bosques), mejorar eficiencia en riego y consumo humano, y diversificar portafolio de medidas (infraestructura verde y gris)."]
+            out.append("")
+        return out
+
+    def write(self, out_dir):
+        """Writes key_numbers.json and key_numbers.txt to out_dir; returns their paths."""
+        os.makedirs(out_dir, exist_ok=True)
+        out_json = os.path.join(out_dir, "key_numbers.json")
+        out_txt = os.path.join(out_dir, "key_numbers.txt")
+        with open(out_json, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2, ensure_ascii=False)
+        with open(out_txt, "w", encoding="utf-8") as f:
+            f.write("\n".join(self.lines()) + "\n")
+        return out_json, out_txt
+
+
+def compute(input_dir, output_dir, region_name):
+    """KeyNumbers of one region, or None without historical baseline data."""
+    hist = load_table(input_dir, output_dir, HIST)
+    base = hist.window(*BASE) if hist is not None else None
+    if base is None:
+        return None
+    tri = trimesters(base["clim"][:, 0]) if np.isfinite(base["clim"][:, 0]).all() else None
+    result = KeyNumbers(region_name, base, tri)
+    for scen in SCENS:
+        table = load_table(input_dir, output_dir, scen)
+        for (t0, t1) in WINS:
+            result.add_window(scen, t0, t1, table.window(t0, t1) if table is not None else None)
+    result.ensemble = ensemble_section(output_dir)
+    return result
+
+
+def process_region(input_dir, output_dir, region_name, subdir=None):
+    """Computes and writes the key numbers of one region; returns the written paths or None."""
+    result = compute(input_dir, output_dir, region_name)
+    if result is None:
+        print(f"  ⚠️ {region_name}: no historical data found.")
+        return None
+    paths = result.write(os.path.join(output_dir, subdir or settings.OUT_CAT_RESUMEN))
+    for p in paths:
+        print(f"  ✔ {region_name}: {p}")
+    return paths
+
+
+def run(region_codes=None, workers=None, subdir=None):
+    print("\n" + "="*60)
+    print("GENERATING MASTER KEY NUMBERS (JSON & TXT)")
+    print("="*60)
+    jobs = [(settings.get_region_input_dir(code), settings.get_region_output_dir(code), info["name"])
+            for code, info in settings.iter_regions(region_codes)]
+    workers = max(1, min(workers or settings.KEY_METRICS_WORKERS, len(jobs) or 1))
+    if workers == 1:
+        for job in jobs:
+            try:
+                process_region(*job, subdir=subdir)
+            except Exception as e:
+                print(f"  ❌ {job[2]}: {e}")
+        return
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        futures = [(job, ex.submit(process_region, *job, subdir=subdir)) for job in jobs]
+        for job, fut in futures:
+            try:
+                fut.result()
+            except Exception as e:
+                print(f"  ❌ {job[2]}: {e}")
+
+
+if __name__ == "__main__":
+    run()
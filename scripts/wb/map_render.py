@@ -0,0 +1,117 @@
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
+
+
+def grid_edges(lat, lon):
+    """Cell edges for pcolormesh, including degenerate 1xN / Nx1 grids."""
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    dx = np.abs(np.diff(lon)).mean() if lon.size > 1 else 0
+    dy = np.abs(np.diff(lat)).mean() if lat.size > 1 else 0
+    res = max(dx, dy) or 0.1
+
+    def edges(c):
+        if c.size <= 1:
+            return np.array([c[0] - res/2, c[0] + res/2])
+        mid = (c[:-1] + c[1:]) / 2.0
+        return np.concatenate([[c[0] - (c[1] - c[0]) / 2.0], mid, [c[-1] + (c[-1] - c[-2]) / 2.0]])
+
+    return edges(lat), edges(lon)
+
+
+class MapTemplate:
+    """
+    Multi-panel map figure built once per region and grid.
+    Figure, axes, QuadMesh artists, outline collections and colorbars are created in
+    __init__; render() only swaps array data, colour limits, colormaps and titles
+    before saving, so repeated figures cost little more than the PNG encode.
+    """
+
+    def __init__(self, lat, lon, nrows, ncols, figsize, outline=None, bounds=None,
+                 colorbar="per_axes", cbar_rect=(0.985, 0.15, 0.02, 0.7), title_fontsize=None,
+                 suptitle_fontsize=None):
+        self.fig, axes = plt.subplots(nrows, ncols, figsize=figsize, sharex=True, sharey=True, squeeze=False)
+        self.axes = axes.ravel()
+        self.shape = (len(lat), len(lon))
+        self.suptitle_kw = {"fontsize": suptitle_fontsize} if suptitle_fontsize else {}
+        lat_e, lon_e = grid_edges(lat, lon)
+        empty = np.ma.masked_all(self.shape)
+        segs = outline or []
+        if bounds is None:
+            bounds = (lon_e.min(), lat_e.min(), lon_e.max(), lat_e.max())
+
+        self.centers = np.meshgrid(np.asarray(lon, dtype=float), np.asarray(lat, dtype=float))
+        self.meshes, self.nodata, self.stipples = [], [], []
+        for ax in self.axes:
+            m = ax.pcolormesh(lon_e, lat_e, empty, cmap="RdBu")
+            self.meshes.append(m)
+            self.stipples.append(ax.plot([], [], ls="none", marker=".", ms=1.5, color="k", zorder=4)[0])
+            if segs:
+                ax.add_collection(LineCollection(segs, colors="k", linewidths=0.9, zorder=5))
+            ax.set_xlim(bounds[0], bounds[2])
+            ax.set_ylim(bounds[1], bounds[3])
+            ax.set_aspect('equal', 'box')
+            ax.grid(True, alpha=.2)
+            if title_fontsize:
+                ax.title.set_fontsize(title_fontsize)
+            self.nodata.append(ax.text(0.5, 0.5, "sin datos", ha="center", va="center",
+                                       transform=ax.transAxes, visible=False))
+
+        self.cbars = []
+        if colorbar == "shared":
+            cax = self.fig.add_axes(list(cbar_rect))
+            self.cbars = [self.fig.colorbar(self.meshes[0], cax=cax)]
+        elif colorbar == "per_axes":
+            self.cbars = [self.fig.colorbar(m, ax=ax, fraction=0.046, pad=0.04)
+                          for m, ax in zip(self.meshes, self.axes)]
+
+    @staticmethod
+    def _per_panel(value, n):
+        return list(value) if isinstance(value, (list, tuple)) else [value] * n
+
+    def render(self, fields, out_png, titles=None, suptitle=None, vmin=None, vmax=None, cmap="RdBu",
+               cbar_label=None, hide_missing=False, stipple=None, dpi=180):
+        """
+        Updates every panel with fields (None = no data) and saves the figure to out_png.
+        stipple: per-panel boolean masks (e.g. significance) drawn as dots over the cells.
+        """
+        n = len(self.axes)
+        fields = list(fields) + [None] * (n - len(fields))
+        vmins, vmaxs, cmaps = self._per_panel(vmin, n), self._per_panel(vmax, n), self._per_panel(cmap, n)
+        titles = self._per_panel(titles, n) if titles is not None else [None] * n
+        labels = self._per_panel(cbar_label, n)
+        stipple = list(stipple or []) + [None] * n
+
+        for i, (ax, mesh, field) in enumerate(zip(self.axes, self.meshes, fields)):
+            has = field is not None
+            if has:
+                mesh.set_array(np.ma.masked_invalid(np.asarray(field, dtype=float).reshape(self.shape)).ravel())
+                mesh.set_cmap(cmaps[i])
+                mesh.set_clim(vmins[i], vmaxs[i])
+            mesh.set_visible(has)
+            dots = np.asarray(stipple[i], dtype=bool).reshape(self.shape) if has and stipple[i] is not None else None
+            if dots is None:
+                self.stipples[i].set_data([], [])
+            else:
+                self.stipples[i].set_data(self.centers[0][dots], self.centers[1][dots])
+            self.nodata[i].set_visible(not has and not hide_missing)
+            if hide_missing:
+                ax.set_axis_on() if has else ax.set_axis_off()
+                if len(self.cbars) == n:
+                    self.cbars[i].ax.set_visible(has)
+            if len(self.cbars) == n and has and labels[i]:
+                self.cbars[i].set_label(labels[i])
+            if titles[i] is not None:
+                ax.set_title(titles[i], fontsize=ax.title.get_fontsize())
+
+        if len(self.cbars) == 1:
+            self.cbars[0].update_normal(next((m for m, f in zip(self.meshes, fields) if f is not None), self.meshes[0]))
+            if cbar_label:
+                self.cbars[0].set_label(cbar_label)
+        if suptitle is not None:
+            self.fig.suptitle(suptitle, **self.suptitle_kw)
+        self.fig.savefig(out_png, dpi=dpi, bbox_inches="tight")
+
+    def close(self):
+        plt.close(self.fig)
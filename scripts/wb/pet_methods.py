@@ -0,0 +1,147 @@
+"""
+PET method registry.
+
+Every method is a vectorised kernel over a (time, lat, lon) block of daily inputs in °C,
+W m-2, m s-1 and %. Kernels share a per-grid extraterrestrial radiation / daylength table
+(cached by latitude vector), so several methods can be evaluated in a single pass over
+the temperature data. Penman-Monteith also uses the surface elevation (m) for the
+atmospheric pressure and the clear-sky radiation (FAO-56 eqs. 7 and 37).
+"""
+import threading
+import numpy as np
+from organized.scripts.wb import kernels
+
+GSC = 0.0820          # solar constant, MJ m-2 min-1
+LAMBDA = 2.45         # latent heat of vaporisation, MJ kg-1
+
+METHODS = {}
+_tables = {}
+_lock = threading.Lock()
+
+
+def register(name, requires, label, prepare=None):
+    """Decorator: adds a kernel fn(v, ctx) -> PET (mm/day) to the registry."""
+    def deco(fn):
+        METHODS[name] = {"fn": fn, "requires": tuple(requires), "label": label, "prepare": prepare}
+        return fn
+    return deco
+
+
+def available(present):
+    """Registered methods whose required variables are all in `present`."""
+    present = set(present)
+    return [m for m, spec in METHODS.items() if set(spec["requires"]) <= present]
+
+
+def required_vars(methods):
+    out = []
+    for m in methods:
+        out += [v for v in METHODS[m]["requires"] if v not in out]
+    return out
+
+
+def ra_daily_np(lat_deg, doy):
+    phi=np.deg2rad(lat_deg)
+    dr=1+0.033*np.cos(2*np.pi*doy/365.0)
+    delta=0.409*np.sin(2*np.pi*doy/365.0-1.39)
+    ws=np.arccos(np.clip(-np.tan(phi)*np.tan(delta), -1, 1))
+    return (24*60/np.pi)*GSC*dr*(ws*np.sin(phi)*np.sin(delta)+np.cos(phi)*np.cos(delta)*np.sin(ws))
+
+
+def daylength_np(lat_deg, doy):
+    phi=np.deg2rad(lat_deg)
+    delta=0.409*np.sin(2*np.pi*doy/365.0-1.39)
+    return 24/np.pi*np.arccos(np.clip(-np.tan(phi)*np.tan(delta), -1, 1))
+
+
+def tables(lat):
+    """(Ra, N) tables of shape (366, nlat) for doy 1..366, cached per latitude vector."""
+    lat = np.asarray(lat, dtype=float)
+    key = lat.tobytes()
+    with _lock:
+        if key not in _tables:
+            doy = np.arange(1, 367, dtype=float)[:, None]
+            _tables[key] = (ra_daily_np(lat[None, :], doy), daylength_np(lat[None, :], doy))
+        return _tables[key]
+
+
+class Context:
+    """
+    Per-block geometry shared by all kernels: Ra and daylength broadcast to (time, lat, 1),
+    elevation (m) as a scalar or a (lat, lon) field.
+    """
+
+    def __init__(self, lat, doy, months, state=None, elevation=0.0):
+        ra, n = tables(lat)
+        idx = np.asarray(doy, dtype=int) - 1
+        self.ra = ra[idx][:, :, None]
+        self.daylength = n[idx][:, :, None]
+        self.months = np.asarray(months, dtype=int)
+        self.state = state or {}
+        self.elevation = np.asarray(elevation, dtype=float)
+
+
+def _thornthwaite_prepare(monthly_tmean):
+    """Heat index I and exponent a from the (12, lat, lon) monthly mean temperature climatology."""
+    t = np.clip(monthly_tmean, 0, None)
+    I = np.nansum((t / 5.0) ** 1.514, axis=0)
+    a = 6.75e-7 * I**3 - 7.71e-5 * I**2 + 1.792e-2 * I + 0.49239
+    return {"I": I, "a": a}
+
+
+@register("hargreaves", ("tasmin", "tasmax", "tas"), "Hargreaves")
+def hargreaves(v, ctx):
+    return kernels.hargreaves(ctx.ra, v["tas"], v["tasmax"], v["tasmin"])
+
+
+@register("oudin", ("tas",), "Oudin")
+def oudin(v, ctx):
+    t = v["tas"]
+    return np.where(t + 5 > 0, ctx.ra / LAMBDA * (t + 5) / 100.0, 0.0)
+
+
+@register("thornthwaite", ("tas",), "Thornthwaite", prepare=_thornthwaite_prepare)
+def thornthwaite(v, ctx):
+    I, a = ctx.state["thornthwaite"]["I"], ctx.state["thornthwaite"]["a"]
+    t = np.clip(v["tas"], 0, None)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        pet_month = 16.0 * np.where(I > 0, (10.0 * t / I) ** a, 0.0)
+    return pet_month * (ctx.daylength / 12.0) / 30.0
+
+
+@register("penman_monteith", ("tasmin", "tasmax", "tas", "rsds", "sfcWind", "hurs"), "FAO-56 Penman-Monteith")
+def penman_monteith(v, ctx):
+    tmin, tmax, t = v["tasmin"], v["tasmax"], v["tas"]
+    es_fn = lambda T: 0.6108 * np.exp(17.27 * T / (T + 237.3))
+    es = (es_fn(tmax) + es_fn(tmin)) / 2.0
+    ea = np.clip(v["hurs"], 0, 100) / 100.0 * es
+    delta = 4098 * es_fn(t) / (t + 237.3) ** 2
+    z = np.nan_to_num(ctx.elevation)
+    pressure = 101.3 * ((293.0 - 0.0065 * z) / 293.0) ** 5.26
+    gamma = 0.665e-3 * pressure
+    u2 = v["sfcWind"] * 4.87 / np.log(67.8 * 10 - 5.42)
+    rs = v["rsds"] * 0.0864
+    rso = (0.75 + 2e-5 * z) * ctx.ra
+    rns = (1 - 0.23) * rs
+    with np.errstate(invalid="ignore", divide="ignore"):
+        ratio = np.clip(np.where(rso > 0, rs / rso, 1.0), 0.3, 1.0)
+    rnl = 4.903e-9 * ((tmax + 273.16) ** 4 + (tmin + 273.16) ** 4) / 2 * (0.34 - 0.14 * np.sqrt(np.clip(ea, 0, None))) * (1.35 * ratio - 0.35)
+    rn = rns - rnl
+    pet = (0.408 * delta * rn + gamma * 900 / (t + 273) * u2 * (es - ea)) / (delta + gamma * (1 + 0.34 * u2))
+    return np.clip(pet, 0, None)
+
+
+def prepare(methods, monthly_tmean=None):
+    """One-off per-domain state (e.g. Thornthwaite heat index) for the selected methods."""
+    state = {}
+    for m in methods:
+        prep = METHODS[m]["prepare"]
+        if prep is not None:
+            state[m] = prep(monthly_tmean)
+    return state
+
+
+def compute(v, lat, doy, months, methods, state=None, elevation=0.0):
+    """Evaluates every method in `methods` on one block of inputs v (dict of (time, lat, lon) arrays)."""
+    ctx = Context(lat, doy, months, state, elevation)
+    return {m: METHODS[m]["fn"](v, ctx) for m in methods}
@@ -10,6 +10,7 @@ import matplotlib.pyplot as plt
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
 from organized.config import settings
+from organized.scripts.wb import aggregation, kernels, series_store
 
 DOMS = settings.DOMAINS
 BASE = settings.BASE_PERIOD
@@ -19,88 +20,27 @@ DRY_THRESH_MM = 1.0
 PALETTE = settings.PALETTE
 LABELS = {d: d.replace("_ecuador", "").upper() for d in DOMS}
 
-def wlat(lat):
-    return xr.DataArray(np.cos(np.deg2rad(lat)), coords={'lat': lat}, dims=['lat'])
-
-def wmean(da):
-    return da.weighted(wlat(da['lat'])).mean(('lat', 'lon'))
-
 def load_wb_series(data_dir, dom):
-    """Carga series diarias promediadas (data_dir = output dir donde está wb_*.nc)."""
-    p = os.path.join(data_dir, dom, f"wb_{dom}.nc")
-    if not os.path.exists(p):
-        p = os.path.join(data_dir, dom, "wb.nc")
-        if not os.path.exists(p):
-            return None
-
-    ds = xr.open_dataset(p)
-    if "time" not in ds:
-        return None
-
-
-    if "p_mmday" not in ds:
-
-
-         return None
-
-
-    P = wmean(ds["p_mmday"])
-    PET = wmean(ds["pet_mmday"])
-    WB = wmean(ds["wb_mmday"])
-    return xr.Dataset({"P": P, "PET": PET, "WB": WB})
+    """Series diarias promediadas P, PET, WB (data_dir = output dir de la región) desde el series store."""
+    return series_store.dataset(data_dir, dom, ["P", "PET", "WB"])
 
 def compute_ai_annual(ds):
     """Calcula AI anual = P_anual / PET_anual."""
-    P_ann = ds["P"].resample(time="YS").sum("time")
-    PET_ann = ds["PET"].resample(time="YS").sum("time")
+    P_ann = aggregation.resample(ds["P"], "YS")
+    PET_ann = aggregation.resample(ds["PET"], "YS")
     AI = P_ann / PET_ann
     return AI.where(np.isfinite(AI))
 
 def compute_cdd_annual(ds):
     """Calcula CDD (Consecutive Dry Days) anual - racha seca máxima por año."""
     P = ds["P"]
-    t = P["time"].to_index()
-    years = sorted(set(t.year))
-
-    is_dry = (P.values < DRY_THRESH_MM).astype(int)
-
-
-
-
-    cdd_values = []
-    cdd_years = []
-
-
-
-
-
-
-    year_arr = t.year
-
-    for y in years:
-        mask = (year_arr == y)
-        if not np.any(mask): continue
-
-        dry_subset = is_dry[mask]
-
-
-        padded = np.concatenate(([0], dry_subset, [0]))
-        changes = np.diff(padded)
-        starts = np.where(changes == 1)[0]
-        ends = np.where(changes == -1)[0]
-
-        if len(starts) == 0:
-            max_run = 0
-        else:
-            max_run = (ends - starts).max()
-
-        cdd_values.append(max_run)
-        cdd_years.append(y)
-
+    index = aggregation.time_index(P["time"])
+    starts, _ = index.segments("YS")
+    cdd_values = kernels.max_runs(np.asarray(P.values) < DRY_THRESH_MM, starts)
 
     return xr.DataArray(
         cdd_values,
-        coords={"year": cdd_years},
+        coords={"year": index.year[starts]},
         dims=["year"]
     )
 
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+import sys
+import os
+import numpy as np
+import matplotlib.pyplot as plt
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
+from organized.config import settings
+from organized.scripts.wb import climate_extremes
+
+DOMS = settings.DOMAINS
+BASE = settings.BASE_PERIOD
+PALETTE = settings.PALETTE
+LABELS = {d: d.replace("_ecuador", "").upper() for d in DOMS}
+TITULOS = {
+    "txx": "TXx — máxima de Tmax", "tnn": "TNn — mínima de Tmin",
+    "tx90p": "TX90p — días cálidos", "tn10p": "TN10p — noches frías",
+    "su": "SU — días de verano (Tmax > 25 °C)", "tr": "TR — noches tropicales (Tmin > 20 °C)",
+    "rx1day": "Rx1day — máx. precipitación 1 día", "rx5day": "Rx5day — máx. precipitación 5 días",
+    "r95p": "R95p — precipitación en días muy húmedos", "sdii": "SDII — intensidad diaria",
+    "cwd": "CWD — días húmedos consecutivos",
+}
+
+
+def rolling_mean(data, window=11):
+    if len(data) < window:
+        return data
+    return np.convolve(data, np.ones(window) / window, mode="valid")
+
+
+def run(region_codes=None):
+    print("\n" + "="*60)
+    print("GENERATING ETCCDI CLIMATE EXTREMES")
+    print("="*60)
+
+    for region_code, region_info in settings.iter_regions(region_codes):
+        input_dir = settings.get_region_input_dir(region_code)
+        output_dir = settings.get_region_output_dir(region_code)
+        print(f"Processing region: {region_info['name']} ({output_dir})")
+
+        thr = climate_extremes.thresholds(input_dir, output_dir)
+        products = {}
+        for dom in DOMS:
+            ds = climate_extremes.for_domain(input_dir, output_dir, dom, thr)
+            if ds is not None:
+                products[dom] = ds
+        if not products:
+            print(f"  ⚠️ Sin datos diarios para {region_info['name']}"); continue
+
+        idx = [k for k in climate_extremes.INDICES if any(f"{k}_area" in ds for ds in products.values())]
+        ncols = 3
+        nrows = int(np.ceil(len(idx) / ncols))
+        fig, axes = plt.subplots(nrows, ncols, figsize=(16, 3.2 * nrows), sharex=True, squeeze=False)
+        for ax, k in zip(axes.ravel(), idx):
+            for dom, ds in products.items():
+                var = f"{k}_area"
+                if var not in ds:
+                    continue
+                years, y = ds["year"].values, ds[var].values
+                c = PALETTE.get(dom, "k")
+                ax.plot(years, y, color=c, lw=0.7, alpha=0.35)
+                if len(y) >= 11:
+                    ax.plot(years[5:-5], rolling_mean(y), color=c, lw=2, label=LABELS.get(dom, dom))
+            ax.axvspan(int(BASE[0]), int(BASE[1]), alpha=0.12, color="gray")
+            ax.set_title(TITULOS[k], fontsize=10)
+            ax.set_ylabel(climate_extremes.UNITS[k])
+            ax.grid(True, alpha=0.3)
+        for ax in axes.ravel()[len(idx):]:
+            ax.axis("off")
+        axes[0, 0].legend(loc="best", fontsize=8, ncol=2)
+        fig.suptitle(f"Índices de extremos climáticos ETCCDI (media areal) — {region_info['name']}",
+                     fontsize=13, fontweight="bold")
+        plt.tight_layout()
+        out = settings.fig_path(output_dir, settings.OUT_CAT_EXTREMOS, "indices_extremos_serie_temporal.png")
+        plt.savefig(out, dpi=180, bbox_inches="tight")
+        plt.close()
+        print(f"  Generated: {os.path.basename(out)}")
+
+if __name__ == "__main__":
+    run()
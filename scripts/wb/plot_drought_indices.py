@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+import sys
+import os
+import numpy as np
+import matplotlib.pyplot as plt
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
+from organized.config import settings
+from organized.scripts.wb import drought_indices
+
+DOMS = settings.DOMAINS
+BASE = settings.BASE_PERIOD
+PALETTE = settings.PALETTE
+LABELS = {d: d.replace("_ecuador", "").upper() for d in DOMS}
+NOMBRES = {"spi": "SPI (precipitación)", "spei": "SPEI (P − PET)"}
+
+
+def years_axis(da):
+    t = da["time"]
+    return t.dt.year.values + (t.dt.month.values - 0.5) / 12.0
+
+
+def rolling_mean(data, window=12):
+    if len(data) < window:
+        return data
+    return np.convolve(data, np.ones(window) / window, mode="same")
+
+
+def plot_indice(output_dir, region_name, products, idx, scales):
+    fig, axes = plt.subplots(len(scales), 1, figsize=(14, 2.6 * len(scales)), sharex=True, squeeze=False)
+    for ax, s in zip(axes[:, 0], scales):
+        var = f"{idx}_{s}_area"
+        for dom, ds in products.items():
+            if var not in ds:
+                continue
+            ax.plot(years_axis(ds[var]), ds[var].values, color=PALETTE.get(dom, "k"), lw=0.9,
+                    alpha=0.85, label=LABELS.get(dom, dom))
+        ax.axhline(0, color="k", lw=0.8, alpha=0.5)
+        ax.axhline(settings.DROUGHT_THRESHOLD, color="tab:red", ls="--", lw=1, alpha=0.7)
+        ax.axvspan(int(BASE[0]), int(BASE[1]) + 1, alpha=0.12, color="gray")
+        ax.set_ylabel(f"{idx.upper()}-{s}")
+        ax.grid(True, alpha=0.3)
+    axes[0, 0].set_title(f"{NOMBRES[idx]} — media areal — {region_name}", fontsize=13, fontweight="bold")
+    axes[0, 0].legend(loc="best", fontsize=9, ncol=4)
+    axes[-1, 0].set_xlabel("Año")
+    plt.tight_layout()
+    out = settings.fig_path(output_dir, settings.OUT_CAT_INDICES_SEQUIA, f"{idx}_serie_temporal.png")
+    plt.savefig(out, dpi=180, bbox_inches="tight")
+    plt.close()
+    print(f"  Generated: {os.path.basename(out)}")
+
+
+def plot_fraccion(output_dir, region_name, products, scale):
+    fig, axes = plt.subplots(2, 1, figsize=(14, 7), sharex=True)
+    for ax, idx in zip(axes, ("spi", "spei")):
+        var = f"{idx}_{scale}_frac"
+        for dom, ds in products.items():
+            if var not in ds:
+                continue
+            ax.plot(years_axis(ds[var]), 100 * rolling_mean(ds[var].values), color=PALETTE.get(dom, "k"),
+                    lw=1.8, label=LABELS.get(dom, dom))
+        ax.axvspan(int(BASE[0]), int(BASE[1]) + 1, alpha=0.12, color="gray")
+        ax.set_ylabel(f"% área {idx.upper()}-{scale} < {settings.DROUGHT_THRESHOLD:g}")
+        ax.set_ylim(0, 100)
+        ax.grid(True, alpha=0.3)
+    axes[0].set_title(f"Fracción del área en sequía (media móvil 12 meses) — {region_name}", fontsize=13, fontweight="bold")
+    axes[0].legend(loc="best", fontsize=9, ncol=4)
+    axes[1].set_xlabel("Año")
+    plt.tight_layout()
+    out = settings.fig_path(output_dir, settings.OUT_CAT_INDICES_SEQUIA, f"fraccion_area_sequia_{scale}m.png")
+    plt.savefig(out, dpi=180, bbox_inches="tight")
+    plt.close()
+    print(f"  Generated: {os.path.basename(out)}")
+
+
+def run(region_codes=None):
+    print("\n" + "="*60)
+    print("GENERATING SPI / SPEI DROUGHT INDICES")
+    print("="*60)
+
+    scales = [int(s) for s in settings.DROUGHT_SCALES]
+    for region_code, region_info in settings.iter_regions(region_codes):
+        output_dir = settings.get_region_output_dir(region_code)
+        print(f"Processing region: {region_info['name']} ({output_dir})")
+
+        params = drought_indices.load_params(output_dir, scales)
+        if params is None:
+            print("  ⚠️ Missing historical data for the base-period fit"); continue
+
+        products = {}
+        for dom in DOMS:
+            ds = drought_indices.for_domain(output_dir, dom, params)
+            if ds is not None:
+                products[dom] = ds
+        if not products:
+            continue
+
+        for idx in ("spi", "spei"):
+            plot_indice(output_dir, region_info["name"], products, idx, scales)
+        plot_fraccion(output_dir, region_info["name"], products, max(scales))
+
+if __name__ == "__main__":
+    run()
@@ -1,11 +1,11 @@
 #!/usr/bin/env python3
 import os
 import sys
-import xarray as xr
 import matplotlib.pyplot as plt
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
 from organized.config import settings
+from organized.scripts.wb import storage
 
 
 TOP_ROOTS = [info["path"] for info in settings.REGIONS.values()]
@@ -15,9 +15,9 @@ BASE = (str(settings.BASE_PERIOD[0]), str(settings.BASE_PERIOD[1]))
 FUT = ("2081", "2100")
 
 def mean_period(root, domain, var, t0, t1):
-    p=f'{root}/{domain}/wb_{domain}.nc'
-    if not os.path.exists(p): return None
-    ds=xr.open_dataset(p)
+    p=storage.wb_path(root, domain)
+    if not p: return None
+    ds=storage.open_wb(p)
     return ds[var].sel(time=slice(f'{t0}-01-01', f'{t1}-12-31')).mean('time')
 
 def plot_field(ax, lat, lon, field, title, cmap='viridis', vmin=None, vmax=None):
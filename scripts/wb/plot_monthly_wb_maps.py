@@ -2,26 +2,11 @@
 import sys
 import os
 import numpy as np
-import xarray as xr
-import matplotlib.pyplot as plt
 
 
-_prefix = os.environ.get("CONDA_PREFIX") or getattr(sys, "prefix", "")
-if _prefix:
-    os.environ.setdefault("PROJ_LIB", os.path.join(_prefix, "share", "proj"))
-    os.environ.setdefault("GDAL_DATA", os.path.join(_prefix, "share", "gdal"))
-try:
-    from pyproj import datadir, CRS
-    if os.environ.get("PROJ_LIB"):
-        datadir.set_data_dir(os.environ["PROJ_LIB"])
-    CRS.from_epsg(4326)
-except Exception:
-    pass
-
-import geopandas as gpd
-
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
 from organized.config import settings
+from organized.scripts.wb import aggregation, datasets, geometry, gis_env, map_render, storage
 
 DOMINIOS = settings.DOMAINS
 VENTANAS = {
@@ -34,33 +19,13 @@ VENTANAS = {
 
 MESES = ["Ene", "Feb", "Mar", "Abr", "May", "Jun", "Jul", "Ago", "Sep", "Oct", "Nov", "Dic"]
 
-_GEO_CACHE={}
-def cargar_outline(path):
-    if path in _GEO_CACHE: return _GEO_CACHE[path]
-    if not os.path.exists(path): return None
-    try:
-        g = gpd.read_file(path)
-        if g.crs is None:
-            print(f"  ⚠️ Warning: Shapefile {os.path.basename(path)} has no CRS. Assuming EPSG:4326.")
-            g.set_crs("EPSG:4326", inplace=True)
-        if g.crs.to_epsg()!=4326:
-            print(f"  🔍 Reprojecting {os.path.basename(path)} from {g.crs} to EPSG:4326")
-            g = g.to_crs("EPSG:4326")
-        _GEO_CACHE[path]=g
-        return g
-    except Exception as e:
-        print(f"  ❌ Error loading shapefile {path}: {e}")
-        return None
-
 def clim_mensual_wb(data_dir, dominio, t0, t1):
     """Climatología mensual de WB (mm/mes). data_dir = output dir con wb_*.nc."""
-    p = os.path.join(data_dir, dominio, f"wb_{dominio}.nc")
-    if not os.path.exists(p):
-        p = os.path.join(data_dir, dominio, "wb.nc")
-    if not os.path.exists(p):
+    p = storage.wb_path(data_dir, dominio)
+    if p is None:
         return None
 
-    ds = xr.open_dataset(p)
+    ds = datasets.open_wb(p)
     if ("time" not in ds.dims) and ("time" not in ds.coords): return None
     ds = ds.sel(time=slice(f"{t0}-01-01", f"{t1}-12-31"))
     if ds.sizes.get("time",0) == 0: return None
@@ -68,8 +33,7 @@ def clim_mensual_wb(data_dir, dominio, t0, t1):
     if "wb_mmday" not in ds: return None
 
 
-    mon_sum = ds["wb_mmday"].resample(time="MS").sum("time")
-    clim = mon_sum.groupby("time.month").mean("time")
+    clim = aggregation.climatology(ds["wb_mmday"])
     return clim
 
 def limites_comunes(*arrs, default=(-300,300)):
@@ -86,68 +50,24 @@ def limites_comunes(*arrs, default=(-300,300)):
     span=np.ceil(span/50)*50
     return (-span, span)
 
-def dibujar_shp(ax, shp_path):
-    if not shp_path: return
-    try:
-        geo=cargar_outline(shp_path)
-        if geo is not None:
-            geo.boundary.plot(ax=ax, edgecolor="k", linewidth=0.9, facecolor="none", zorder=5)
-    except Exception:
-        pass
-
-def panel_3x4(lat, lon, cubo, titulo, out_png, shp_path, vmin=None, vmax=None, cmap="RdBu"):
-
-    fig, axes = plt.subplots(3,4, figsize=(16.5,8.0), sharex=True, sharey=True)
-    axes = axes.ravel()
-    last_im=None
+def plantilla_3x4(lat, lon, shp_path):
+    """Figura 3x4 (un panel por mes) construida una sola vez por región."""
+    tpl = map_render.MapTemplate(lat, lon, 3, 4, figsize=(16.5, 8.0), outline=geometry.outline_segments(shp_path, lat, lon),
+                                 bounds=geometry.bounds(shp_path),
+                                 colorbar="shared", title_fontsize=10, suptitle_fontsize=14)
+    for ax in tpl.axes[-4:]: ax.set_xlabel("Longitud")
+    for i in [0,4,8]: tpl.axes[i].set_ylabel("Latitud")
+    return tpl
+
+def panel_3x4(tpl, cubo, titulo, out_png, vmin=None, vmax=None, cmap="RdBu"):
+    campos = []
     for m in range(1,13):
-        ax=axes[m-1]
         if cubo is not None and ("month" in cubo.dims) and (m in cubo["month"].values):
-            campo = cubo.sel(month=m).values
-            if len(np.unique(lat)) <= 1 or len(np.unique(lon)) <= 1:
-                # Handle 1xN grids
-                dx = np.abs(np.diff(lon)).mean() if len(np.unique(lon)) > 1 else 0
-                dy = np.abs(np.diff(lat)).mean() if len(np.unique(lat)) > 1 else 0
-                res = max(dx, dy)
-                if res == 0: res = 0.1
-                
-                if len(np.unique(lat)) <= 1:
-                    lat_e = np.array([lat[0] - res/2, lat[0] + res/2])
-                else:
-                    lat_e = np.concatenate([lat - dy/2, [lat[-1] + dy/2]])
-                
-                if len(np.unique(lon)) <= 1:
-                    lon_e = np.array([lon[0] - res/2, lon[0] + res/2])
-                else:
-                    lon_e = np.concatenate([lon - dx/2, [lon[-1] + dx/2]])
-                
-                last_im = ax.pcolormesh(lon_e, lat_e, campo, cmap=cmap, vmin=vmin, vmax=vmax)
-            else:
-                last_im = ax.pcolormesh(lon, lat, campo, shading="auto", cmap=cmap, vmin=vmin, vmax=vmax)
-            
-            shp = cargar_outline(shp_path)
-            if shp is not None:
-                try:
-                    b = shp.total_bounds
-                    ax.set_xlim(b[0], b[2])
-                    ax.set_ylim(b[1], b[3])
-                except:
-                    pass
-
-            ax.set_aspect('equal', 'box')
-            dibujar_shp(ax, shp_path)
+            campos.append(cubo.sel(month=m).values)
         else:
-            ax.text(0.5,0.5,"sin datos",ha="center",va="center",transform=ax.transAxes)
-        ax.set_title(MESES[m-1], fontsize=10); ax.grid(True, alpha=.2)
-
-    if last_im is not None:
-        cax = fig.add_axes([0.985, 0.15, 0.02, 0.7])
-        cb  = fig.colorbar(last_im, cax=cax); cb.set_label("Balance Hídrico (mm/mes)")
-    fig.suptitle(titulo, fontsize=14)
-    for ax in axes[-4:]: ax.set_xlabel("Longitud")
-    for i in [0,4,8]: axes[i].set_ylabel("Latitud")
-    plt.savefig(out_png, dpi=180, bbox_inches="tight")
-    plt.close()
+            campos.append(None)
+    tpl.render(campos, out_png, titles=MESES, suptitle=titulo, vmin=vmin, vmax=vmax, cmap=cmap,
+               cbar_label="Balance Hídrico (mm/mes)")
 
 def _monthly_map_output(dom, etiqueta, is_delta):
     """Return (category, filename) for monthly WB maps."""
@@ -165,7 +85,38 @@ def _monthly_map_output(dom, etiqueta, is_delta):
         if "ssp585" in dom: return settings.OUT_CAT_MAPAS_DELTA_SSP585, f"delta_WB_mensual_ssp585_{suf}.png"
     return settings.OUT_CAT_MAPAS_MENSUALES_HIST, "out.png"
 
+def _render_region(tpl, output_dir, base):
+    for dom in DOMINIOS:
+        for etiqueta, (t0, t1) in VENTANAS.items():
+            clim = clim_mensual_wb(output_dir, dom, t0, t1)
+            if clim is None:
+                continue
+            vmin, vmax = limites_comunes(clim)
+            cat, fname = _monthly_map_output(dom, etiqueta, is_delta=False)
+            out_png = settings.fig_path(output_dir, cat, fname)
+            titulo = f"{dom.replace('_ecuador','')} | Balance Hídrico Mensual | {etiqueta.replace('_',' ')}"
+            panel_3x4(tpl, clim, titulo, out_png, vmin=vmin, vmax=vmax, cmap="RdBu")
+            print(f"  Generado: {os.path.basename(out_png)}")
+
+    if base is None:
+        return
+    for dom in [d for d in DOMINIOS if "historical" not in d]:
+        for etiqueta, (t0, t1) in VENTANAS.items():
+            if etiqueta.startswith("Base"):
+                continue
+            fut = clim_mensual_wb(output_dir, dom, t0, t1)
+            if fut is None:
+                continue
+            delta = fut - base
+            vmin, vmax = limites_comunes(delta, default=(-300, 300))
+            cat, fname = _monthly_map_output(dom, etiqueta, is_delta=True)
+            out_png = settings.fig_path(output_dir, cat, fname)
+            titulo = f"{dom.replace('_ecuador','')} | Δ Balance Hídrico Mensual vs Base | {etiqueta.replace('_',' ')}"
+            panel_3x4(tpl, delta, titulo, out_png, vmin=vmin, vmax=vmax, cmap="RdBu")
+            print(f"  Generado: {os.path.basename(out_png)}")
+
 def run(region_codes=None):
+    gis_env.setup()
     print("\n" + "="*60)
     print("GENERANDO MAPAS MENSUALES DE WB (ESPAÑOL)")
     print("="*60)
@@ -190,35 +141,11 @@ def run(region_codes=None):
             print("  ⚠️ Sin datos para mapas mensuales")
             continue
         lat, lon = ref["lat"].values, ref["lon"].values
-
-        for dom in DOMINIOS:
-            for etiqueta, (t0, t1) in VENTANAS.items():
-                clim = clim_mensual_wb(output_dir, dom, t0, t1)
-                if clim is None:
-                    continue
-                vmin, vmax = limites_comunes(clim)
-                cat, fname = _monthly_map_output(dom, etiqueta, is_delta=False)
-                out_png = settings.fig_path(output_dir, cat, fname)
-                titulo = f"{dom.replace('_ecuador','')} | Balance Hídrico Mensual | {etiqueta.replace('_',' ')}"
-                panel_3x4(lat, lon, clim, titulo, out_png, shp_path, vmin=vmin, vmax=vmax, cmap="RdBu")
-                print(f"  Generado: {os.path.basename(out_png)}")
-
-        if base is None:
-            continue
-        for dom in [d for d in DOMINIOS if "historical" not in d]:
-            for etiqueta, (t0, t1) in VENTANAS.items():
-                if etiqueta.startswith("Base"):
-                    continue
-                fut = clim_mensual_wb(output_dir, dom, t0, t1)
-                if fut is None:
-                    continue
-                delta = fut - base
-                vmin, vmax = limites_comunes(delta, default=(-300, 300))
-                cat, fname = _monthly_map_output(dom, etiqueta, is_delta=True)
-                out_png = settings.fig_path(output_dir, cat, fname)
-                titulo = f"{dom.replace('_ecuador','')} | Δ Balance Hídrico Mensual vs Base | {etiqueta.replace('_',' ')}"
-                panel_3x4(lat, lon, delta, titulo, out_png, shp_path, vmin=vmin, vmax=vmax, cmap="RdBu")
-                print(f"  Generado: {os.path.basename(out_png)}")
+        tpl = plantilla_3x4(lat, lon, shp_path)
+        try:
+            _render_region(tpl, output_dir, base)
+        finally:
+            tpl.close()
 
 if __name__ == "__main__":
     run()
@@ -9,6 +9,7 @@ import matplotlib.pyplot as plt
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
 
 from organized.config import settings
+from organized.scripts.wb import aggregation, datasets, storage
 
 DOMAINS_FUT = [d for d in settings.DOMAINS if 'historical' not in d]
 
@@ -21,18 +22,18 @@ def wmean(da): return da.weighted(wlat(da['lat'])).mean(('lat','lon'))
 
 def clim_month(data_dir, domain, t0, t1):
     """data_dir = output dir where wb_*.nc lives."""
-    p = os.path.join(data_dir, domain, f'wb_{domain}.nc')
-    if not os.path.exists(p): return None
+    p = storage.wb_path(data_dir, domain)
+    if not p: return None
     try:
-        ds = xr.open_dataset(p).sel(time=slice(f'{t0}-01-01', f'{t1}-12-31'))
+        ds = datasets.open_wb(p).sel(time=slice(f'{t0}-01-01', f'{t1}-12-31'))
 
         mon = xr.Dataset({
-            'P'  : wmean(ds['p_mmday']).resample(time='MS').sum(),
-            'PET': wmean(ds['pet_mmday']).resample(time='MS').sum(),
-            'WB' : wmean(ds['wb_mmday']).resample(time='MS').sum(),
+            'P'  : aggregation.resample(wmean(ds['p_mmday']), 'MS'),
+            'PET': aggregation.resample(wmean(ds['pet_mmday']), 'MS'),
+            'WB' : aggregation.resample(wmean(ds['wb_mmday']), 'MS'),
         })
 
-        clim = mon.groupby('time.month').mean('time')
+        clim = xr.Dataset({k: aggregation.groupby(mon[k], 'month') for k in mon})
         return {k:clim[k].values for k in ['P','PET','WB']}
     except Exception as e:
         print(f"Error processing {domain}: {e}")
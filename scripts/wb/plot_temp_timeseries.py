@@ -1,14 +1,13 @@
 #!/usr/bin/env python3
 import sys
 import os
-import numpy as np
-import xarray as xr
 import matplotlib.pyplot as plt
 
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
 
 from organized.config import settings
+from organized.scripts.wb import aggregation, kernels, series_store
 
 PERIOD_START = settings.PERIOD_START
 PERIOD_END = settings.PERIOD_END
@@ -18,63 +17,8 @@ DOMAINS = settings.DOMAINS
 
 def roll_nanmean(y, k=11, min_frac=0.6):
     """Media móvil robusta con NaNs; ventana impar k."""
-    y = np.asarray(y, float)
-    n = len(y); out = np.full(n, np.nan)
-    if k <= 1 or n < 2: return y
     k = int(k) if int(k)%2==1 else int(k)+1
-    half = k//2; min_pts = max(1, int(np.ceil(k*min_frac)))
-    for i in range(n):
-        a = max(0, i-half); b = min(n, i+half+1)
-        w = y[a:b]; m = np.isfinite(w)
-        if m.sum() >= min_pts: out[i] = w[m].mean()
-    return out
-
-def wlat(lat):
-    """Pesos cos(lat) como DataArray (se normaliza al promediar)."""
-    return xr.DataArray(np.cos(np.deg2rad(lat)), coords={'lat': lat}, dims=['lat'])
-
-def wmean(da):
-    """
-    Promedio espacial ponderado por cos(lat) y media en lon.
-    xarray.weighted normaliza por suma de pesos automáticamente.
-    """
-    return da.weighted(wlat(da['lat'])).mean(("lat", "lon"))
-
-def apply_scale_offset(da):
-    """Aplica CF scale_factor/add_offset si existen (por si vienen sin decodificar)."""
-    sf = da.attrs.get("scale_factor", None)
-    ao = da.attrs.get("add_offset",  None)
-    if sf is not None or ao is not None:
-        sf = 1.0 if sf is None else float(sf)
-        ao = 0.0 if ao is None else float(ao)
-        da = da.astype("float64") * sf + ao
-    return da
-
-def as_celsius(da):
-    """
-    Devuelve temperatura en °C (robusto a unidades corruptas).
-    """
-    da = apply_scale_offset(da)
-    u = str(da.attrs.get("units", "")).lower()
-
-
-    if ("k" in u) and ("c" not in u):
-        return da - 273.15
-    if "c" in u:
-        return da
-
-
-    finite = da.where(np.isfinite(da), drop=True)
-    try:
-        vmin = float(finite.min())
-        vmax = float(finite.max())
-    except Exception:
-
-        return da - 273.15
-
-    if (vmax > 100.0) or (vmin < -50.0):
-        return da - 273.15
-    return da
+    return kernels.roll_nanmean(y, k, min_frac)
 
 def run(region_codes=None):
     print("\n" + "="*60)
@@ -96,30 +40,11 @@ def run(region_codes=None):
             drew = False
 
             for dom in DOMAINS:
-                p = os.path.join(input_dir, dom, f"{var}_{dom}.nc")
-                if not os.path.exists(p):
-                    p = os.path.join(input_dir, dom, f"{var}.nc")
-                    if not os.path.exists(p):
-                        continue
-
-                ds = xr.open_dataset(p)
-                if "time" not in ds:
+                ds = series_store.dataset(output_dir, dom, [var], PERIOD_START, PERIOD_END, input_dir=input_dir)
+                if ds is None or var not in ds:
                     continue
 
-                var_in_file = var
-                if var not in ds:
-
-                    if var == 'tas' and 'tmean' in ds: var_in_file = 'tmean'
-                    elif var == 'tasmin' and 'tmin' in ds: var_in_file = 'tmin'
-                    elif var == 'tasmax' and 'tmax' in ds: var_in_file = 'tmax'
-
-                if var_in_file not in ds:
-                    continue
-
-                T = as_celsius(ds[var_in_file])
-
-
-                ann = T.resample(time="YS").mean()
+                ann = aggregation.resample(ds[var], "YS", "mean")
                 if ann.sizes.get("time", 0) == 0:
                     continue
 
@@ -128,7 +53,7 @@ def run(region_codes=None):
                 if sel.sum() == 0:
                     continue
 
-                y = wmean(ann).values[sel]
+                y = ann.values[sel]
                 yrs = years[sel]
 
 
@@ -2,49 +2,26 @@
 import sys
 import os
 import numpy as np
-import xarray as xr
 import matplotlib.pyplot as plt
 
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
 
 from organized.config import settings
+from organized.scripts.wb import ensemble, series_store
+from organized.scripts.wb.kernels import roll_nanmean
 
 PERIOD_START = settings.PERIOD_START
 PERIOD_END = settings.PERIOD_END
-
-def wlat(lat):
-    return xr.DataArray(np.cos(np.deg2rad(lat)), coords={'lat': lat}, dims=['lat'])
-
-def wmean(da):
-    return da.weighted(wlat(da['lat'])).mean(('lat','lon'))
+AGG_VARS = {"P": "P_ann", "PET": "PET_ann", "WB": "WB_ann"}
+ENSEMBLE_VARS = {"P": "p_ann", "PET": "pet_ann", "WB": "wb_ann"}
 
 def load_ann(data_dir, dom):
-    """data_dir = output dir where wb_agg_*.nc lives."""
-    p = os.path.join(data_dir, dom, f"wb_agg_{dom}.nc")
-    if not os.path.exists(p): return None, None
-    ds=xr.open_dataset(p)
-    years = xr.DataArray(ds["p_ann"]["time"]).dt.year.values
-    p_ann   = wmean(ds["p_ann"]).values
-    pet_ann = wmean(ds["pet_ann"]).values
-    wb_ann  = wmean(ds["wb_ann"]).values
-    m = (years >= PERIOD_START) & (years <= PERIOD_END)
-    if m.sum()==0: return None, None
-    return years[m], {"P":p_ann[m], "PET":pet_ann[m], "WB":wb_ann[m]}
-
-def roll_nanmean(y, k, min_frac=0.6):
-    y = np.asarray(y, float)
-    n = len(y)
-    out = np.full(n, np.nan)
-    if k <= 1 or n < 2: return y
-    half = k // 2
-    min_pts = max(1, int(np.ceil(k * min_frac)))
-    for i in range(n):
-        a = max(0, i-half); b = min(n, i+half+1)
-        w = y[a:b]; valid = np.isfinite(w)
-        if valid.sum() >= min_pts:
-            out[i] = w[valid].mean()
-    return out
+    """Annual area-mean P/PET/WB (mm/año) from the region's series store."""
+    ds = series_store.dataset(data_dir, dom, list(AGG_VARS.values()), PERIOD_START, PERIOD_END)
+    if ds is None: return None, None
+    years = ds["time"].dt.year.values
+    return years, {k: ds[v].values if v in ds else np.full(years.size, np.nan) for k, v in AGG_VARS.items()}
 
 def run(region_codes=None):
     print("\n" + "="*60)
@@ -66,6 +43,25 @@ def run(region_codes=None):
             fig = plt.figure(figsize=(10, 4))
             drew = False
             for dom in settings.DOMAINS:
+                c = palette.get(dom, "tab:blue")
+                dom_label = dom.replace("_ecuador", "")
+                if dom_label == "historical":
+                    dom_label = "Histórico"
+
+                bands = ensemble.series_bands(output_dir, dom, ENSEMBLE_VARS[var])
+                if bands is not None:
+                    years, q, n = bands
+                    m = np.isfinite(q["p50"])
+                    if m.sum() == 0:
+                        continue
+                    years = years[m]
+                    win = min(11, max(3, (int(years[-1] - years[0] + 1) // 15) * 2 + 1))
+                    plt.fill_between(years, roll_nanmean(q["p10"][m], win), roll_nanmean(q["p90"][m], win),
+                                     color=c, alpha=0.2, lw=0)
+                    plt.plot(years, roll_nanmean(q["p50"][m], win), lw=2, color=c, label=f"{dom_label} (mediana, n={n})")
+                    drew = True
+                    continue
+
                 years, dat = load_ann(output_dir, dom)
                 if years is None:
                     continue
@@ -73,11 +69,7 @@ def run(region_codes=None):
                 span = int(years[-1] - years[0] + 1)
                 win = min(11, max(3, (span // 15) * 2 + 1))
                 y_smooth = roll_nanmean(y, win, min_frac=0.6)
-                c = palette.get(dom, "tab:blue")
                 plt.scatter(years, y, s=10, alpha=0.4, color=c)
-                dom_label = dom.replace("_ecuador", "")
-                if dom_label == "historical":
-                    dom_label = "Histórico"
                 plt.plot(years, y_smooth, lw=2, color=c, label=dom_label)
                 drew = True
             plt.title(f"{region_info['name']}: {ylabel}, {PERIOD_START}–{PERIOD_END}")
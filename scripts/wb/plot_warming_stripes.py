@@ -2,11 +2,11 @@
 import sys
 import os
 import numpy as np
-import xarray as xr
 import matplotlib.pyplot as plt
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
 from organized.config import settings
+from organized.scripts.wb import aggregation, series_store
 
 DOMAINS = settings.DOMAINS
 BASE = settings.BASE_PERIOD
@@ -14,13 +14,6 @@ DOMAINS_TO_PLOT = [d for d in settings.DOMAINS if "historical" not in d]
 
 LABELS = {d: d.replace("_ecuador", "").upper() for d in settings.DOMAINS}
 
-def wlat(lat): return xr.DataArray(np.cos(np.deg2rad(lat)), coords={'lat':lat}, dims=['lat'])
-def wmean(da): return da.weighted(wlat(da['lat'])).mean(("lat","lon"))
-def as_celsius(da):
-    u=str(da.attrs.get("units","")).lower()
-    if "c" in u: return da
-    sample=float(da.isel(time=0)); return da-273.15 if sample>150 else da
-
 def run(region_codes=None):
     print("\n" + "="*60)
     print("GENERANDO WARMING STRIPES (ESPAÑOL)")
@@ -31,26 +24,13 @@ def run(region_codes=None):
         output_dir = settings.get_region_output_dir(region_code)
         print(f"Procesando región: {region_info['name']} ({output_dir})")
 
-        hb = os.path.join(input_dir, "historical_ecuador", "tas_historical_ecuador.nc")
-        if not os.path.exists(hb):
-            hb = os.path.join(input_dir, "historical_ecuador", "tas.nc")
-        if not os.path.exists(hb):
-            print(f"  ⚠️ Datos históricos no encontrados para línea base")
-            continue
-
         try:
-            ds_hist = xr.open_dataset(hb)
-            tas_var = 'tas' if 'tas' in ds_hist else 'tmean'
-            T = ds_hist[tas_var]
-            T = as_celsius(T)
-
-
-            base_slice = T.sel(time=slice(f"{BASE[0]}-01-01", f"{BASE[1]}-12-31"))
-            if base_slice.sizes['time'] == 0:
-                 print(f"  ⚠️ No hay datos en período base {BASE} para {region_info['name']}")
-                 continue
+            ds_hist = series_store.dataset(output_dir, "historical_ecuador", ["tas"], BASE[0], BASE[1], input_dir=input_dir)
+            if ds_hist is None or "tas" not in ds_hist:
+                print(f"  ⚠️ No hay datos en período base {BASE} para {region_info['name']}")
+                continue
 
-            base = wmean(base_slice.resample(time="YS").mean()).mean().item()
+            base = aggregation.resample(ds_hist["tas"], "YS", "mean").mean().item()
         except Exception as e:
             print(f"  ❌ Error calculando línea base: {e}")
             continue
@@ -61,21 +41,13 @@ def run(region_codes=None):
         if nrows == 1: axes = [axes]
 
         for ax, dom in zip(axes, target_domains):
-            p = os.path.join(input_dir, dom, f"tas_{dom}.nc")
-            if not os.path.exists(p):
-                p = os.path.join(input_dir, dom, "tas.nc")
-
-            if not os.path.exists(p):
+            ds = series_store.dataset(output_dir, dom, ["tas"], input_dir=input_dir)
+            if ds is None or "tas" not in ds:
                 ax.axis("off")
                 continue
 
             try:
-                ds = xr.open_dataset(p)
-                tas_var = 'tas' if 'tas' in ds else 'tmean'
-                T = ds[tas_var]
-                T = as_celsius(T)
-
-                ann = wmean(T.resample(time="YS").mean())
+                ann = aggregation.resample(ds["tas"], "YS", "mean")
                 years = ann["time"].dt.year.values
                 anom = (ann.values - base)
 
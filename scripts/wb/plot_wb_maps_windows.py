@@ -1,66 +1,27 @@
 #!/usr/bin/env python3
 import sys
 import os
-import xarray as xr
 import numpy as np
 import matplotlib.pyplot as plt
 
 
-_prefix = os.environ.get("CONDA_PREFIX") or getattr(sys, "prefix", "")
-if _prefix:
-    os.environ.setdefault("PROJ_LIB", os.path.join(_prefix, "share", "proj"))
-    os.environ.setdefault("GDAL_DATA", os.path.join(_prefix, "share", "gdal"))
-try:
-    from pyproj import datadir, CRS
-    if os.environ.get("PROJ_LIB"):
-        datadir.set_data_dir(os.environ["PROJ_LIB"])
-    CRS.from_epsg(4326)
-except Exception:
-    pass
-
-import geopandas as gpd
-
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
 from organized.config import settings
+from organized.scripts.wb import geometry, gis_env, window_stats
 
 SCENS = [d for d in settings.DOMAINS if "historical" not in d]
 WIN = {
-    "Base (1981–2010)": ("1981","2010"),
-    "Cercano (2021–2050)": ("2021","2050"),
-    "Medio (2041–2070)": ("2041","2070"),
-    "Tardío (2071–2100)": ("2071","2100"),
+    f"{name} ({t0}–{t1})": (t0, t1)
+    for name, (t0, t1) in zip(["Base", "Cercano", "Medio", "Tardío"],
+                              [settings.WINDOWS[k] for k in ("base", "cercano", "medio", "tardio")])
 }
 
-_cache_geo = {}
-def cargar_shp(path):
-    if path in _cache_geo: return _cache_geo[path]
-    if not os.path.exists(path): return None
-    try:
-        g = gpd.read_file(path)
-        if g.crs is None:
-            print(f"  ⚠️ Warning: Shapefile {os.path.basename(path)} has no CRS. Assuming EPSG:4326.")
-            g.set_crs("EPSG:4326", inplace=True)
-        if g.crs.to_epsg() != 4326:
-            print(f"  🔍 Reprojecting {os.path.basename(path)} from {g.crs} to EPSG:4326")
-            g = g.to_crs("EPSG:4326")
-        _cache_geo[path] = g
-        return g
-    except Exception as e:
-        print(f"  ❌ Error loading shapefile {path}: {e}")
-        return None
-
 def mean_wb(data_dir, domain, t0, t1):
-    p = os.path.join(data_dir, domain, f"wb_{domain}.nc")
-    if not os.path.exists(p):
-        p = os.path.join(data_dir, domain, "wb.nc")
-    if not os.path.exists(p): return None
-    ds = xr.open_dataset(p).sel(time=slice(f"{t0}-01-01", f"{t1}-12-31"))
-    if ds.sizes.get("time", 0) == 0: return None
-
-    if "wb_mmday" not in ds: return None
-    return (ds["wb_mmday"].mean("time")*365.0)
+    w = window_stats.select(window_stats.for_domain(data_dir, domain, "wb_mmday", WIN.values()), t0, t1)
+    if w is None: return None
+    return w["mean"]*365.0
 
-def pmesh(ax, lat, lon, field, title, cmap="RdBu", vmin=None, vmax=None, shp=None):
+def pmesh(ax, lat, lon, field, title, cmap="RdBu", vmin=None, vmax=None, bounds=None):
     u_lat = np.unique(lat)
     u_lon = np.unique(lon)
     
@@ -85,13 +46,9 @@ def pmesh(ax, lat, lon, field, title, cmap="RdBu", vmin=None, vmax=None, shp=Non
     else:
         m = ax.pcolormesh(lon, lat, field, shading="auto", cmap=cmap, vmin=vmin, vmax=vmax)
     
-    if shp is not None:
-        try:
-            b = shp.total_bounds
-            ax.set_xlim(b[0], b[2])
-            ax.set_ylim(b[1], b[3])
-        except:
-            pass
+    if bounds is not None:
+        ax.set_xlim(bounds[0], bounds[2])
+        ax.set_ylim(bounds[1], bounds[3])
 
     ax.set_aspect('equal', 'box')
     ax.set_title(title)
@@ -101,6 +58,7 @@ def pmesh(ax, lat, lon, field, title, cmap="RdBu", vmin=None, vmax=None, shp=Non
     return m
 
 def run(region_codes=None):
+    gis_env.setup()
     print("\n" + "="*60)
     print("GENERANDO MAPAS DE BALANCE HÍDRICO (ESPAÑOL)")
     print("="*60)
@@ -116,7 +74,7 @@ def run(region_codes=None):
         lat, lon = base["lat"].values, base["lon"].values
 
         shp_path = region_info.get("shapefile")
-        geo = cargar_shp(shp_path) if shp_path else None
+        bbox = geometry.bounds(shp_path)
 
         base_vals = base.values
         base_max = np.nanmax(np.abs(base_vals))
@@ -160,9 +118,9 @@ def run(region_codes=None):
             for i, (label, (t0, t1)) in enumerate(WIN.items()):
                 ax = axes[j, i]
                 if label.startswith("Base"):
-                    m = pmesh(ax, lat, lon, base.values, f"{label}\nBalance Hídrico (mm/año)", cmap="RdBu", vmin=-base_lim, vmax=base_lim, shp=geo)
-                    if geo is not None:
-                        geo.boundary.plot(ax=ax, edgecolor="k", linewidth=0.9, zorder=5)
+                    m = pmesh(ax, lat, lon, base.values, f"{label}\nBalance Hídrico (mm/año)", cmap="RdBu", vmin=-base_lim, vmax=base_lim, bounds=bbox)
+                    lc = geometry.outline_collection(shp_path, lat, lon)
+                    if lc is not None: ax.add_collection(lc)
                     if i == 0: fig.colorbar(m, ax=ax, fraction=0.046, pad=0.04)
                     continue
 
@@ -173,9 +131,9 @@ def run(region_codes=None):
                     continue
 
                 d = (fut - base).values
-                m = pmesh(ax, lat, lon, d, f"{scen.replace('_ecuador','').upper()} Δ{t0}–{t1}", cmap=cmap_delta, vmin=vmin_delta, vmax=vmax_delta, shp=geo)
-                if geo is not None:
-                    geo.boundary.plot(ax=ax, edgecolor="k", linewidth=0.9, zorder=5)
+                m = pmesh(ax, lat, lon, d, f"{scen.replace('_ecuador','').upper()} Δ{t0}–{t1}", cmap=cmap_delta, vmin=vmin_delta, vmax=vmax_delta, bounds=bbox)
+                lc = geometry.outline_collection(shp_path, lat, lon)
+                if lc is not None: ax.add_collection(lc)
                 fig.colorbar(m, ax=ax, fraction=0.046, pad=0.04)
 
         plt.tight_layout()
@@ -0,0 +1,122 @@
+"""
+Background I/O for the per-domain stages.
+
+prefetch() loads the next items (domains, time blocks) on a reader thread while the caller
+computes the current one; AsyncWriter writes finished outputs on a writer thread. Both use
+bounded queues: at most depth loaded items wait besides the one being computed and the one
+being read, and at most depth outputs wait to be written, so memory stays predictable.
+
+NetCDF decompression runs inside HDF5 calls that xarray serialises with a global lock, so
+the reader and the writer do not overlap each other; each overlaps with the computation,
+which releases the GIL inside NumPy. With depth 0 everything runs inline.
+"""
+import queue
+import threading
+from organized.config import settings
+from organized.scripts.wb import run_scope
+
+_DONE = object()
+
+
+def _put(q, entry, stop):
+    while not stop.is_set():
+        try:
+            q.put(entry, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def prefetch(items, load, depth=None):
+    """
+    Yields (item, load(item), error) in order; error is the exception raised by load (value None).
+    Up to depth items are loaded ahead on a background thread.
+    """
+    depth = settings.PREFETCH_DEPTH if depth is None else depth
+    if depth <= 0:
+        for item in items:
+            try:
+                yield item, load(item), None
+            except Exception as e:
+                yield item, None, e
+        return
+
+    q = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def worker():
+        for item in items:
+            if stop.is_set():
+                return
+            try:
+                entry = (item, load(item), None)
+            except Exception as e:
+                entry = (item, None, e)
+            if not _put(q, entry, stop):
+                return
+        _put(q, _DONE, stop)
+
+    t = threading.Thread(target=run_scope.bind(worker), name="prefetch-reader", daemon=True)
+    t.start()
+    try:
+        while True:
+            entry = q.get()
+            if entry is _DONE:
+                break
+            yield entry
+    finally:
+        stop.set()
+        t.join()
+
+
+class AsyncWriter:
+    """
+    Runs submitted writes (fn(*args, **kwargs)) in order on one background thread. submit()
+    blocks when depth writes are already waiting. Errors are reported, not raised, like the
+    per-domain error handling of the stages. Use as a context manager to wait for every write.
+    """
+
+    def __init__(self, depth=None):
+        self.depth = settings.WRITE_QUEUE_DEPTH if depth is None else depth
+        self.failed = []
+        self._thread = None
+        if self.depth > 0:
+            self._q = queue.Queue(maxsize=self.depth)
+            self._thread = threading.Thread(target=self._loop, name="async-writer", daemon=True)
+            self._thread.start()
+
+    def _write(self, fn, args, kwargs, label):
+        try:
+            fn(*args, **kwargs)
+            if label:
+                print(f'    ✅ Wrote {label}')
+        except Exception as e:
+            label = label or getattr(fn, '__qualname__', str(fn))
+            self.failed.append(label)
+            print(f'    ❌ Error writing {label}: {e}')
+
+    def _loop(self):
+        while True:
+            job = self._q.get()
+            if job is _DONE:
+                return
+            self._write(*job)
+
+    def submit(self, fn, *args, label=None, **kwargs):
+        if self._thread is None:
+            self._write(fn, args, kwargs, label)
+        else:
+            self._q.put((run_scope.bind(fn), args, kwargs, label))
+
+    def close(self):
+        if self._thread is not None:
+            self._q.put(_DONE)
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
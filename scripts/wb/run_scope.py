@@ -0,0 +1,53 @@
+"""
+Run scopes for the process-wide caches (dataset pool, window statistics, working cache).
+
+One Streamlit server runs several sessions in the same process, and their plot stages share
+those caches. Each stage runs inside scope(); the caches record which scopes used an entry,
+and release(run_id) only drops the entries that no other active scope is still using.
+Work outside any scope (CLI modules run directly) is attributed to None and kept until
+close_all()/clear(). Threads do not inherit the scope: work handed to reader, writer or
+pool threads goes through bind() so it is attributed to the submitting run.
+"""
+import contextvars
+import functools
+import itertools
+import threading
+from contextlib import contextmanager
+
+_current = contextvars.ContextVar("ffla_run_scope", default=None)
+_ids = itertools.count(1)
+_active = set()
+_lock = threading.Lock()
+
+
+@contextmanager
+def scope():
+    """Marks the calling thread's work as one run; yields its id."""
+    run_id = next(_ids)
+    with _lock:
+        _active.add(run_id)
+    token = _current.set(run_id)
+    try:
+        yield run_id
+    finally:
+        _current.reset(token)
+        with _lock:
+            _active.discard(run_id)
+
+
+def current():
+    return _current.get()
+
+
+def bind(fn):
+    """fn bound to a copy of the caller's context, for running on another thread (one call per job)."""
+    return functools.partial(contextvars.copy_context().run, fn)
+
+
+def in_use(users, run_id, unscoped=True):
+    """
+    True when an entry used by `users` is still needed once run_id is released. With
+    unscoped=False, use outside any scope (None) does not keep the entry alive.
+    """
+    with _lock:
+        return any((u is None and unscoped) or (u is not None and u != run_id and u in _active) for u in users)
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Columnar store of regional (area-mean) series.
+
+The cos(lat)-weighted area means of the daily P/PET/WB, the annual P/PET/WB totals and the
+daily tas/tasmax/tasmin (°C) of every scenario are computed once from the gridded files and
+stored as a long table (region, scenario, variable, date, value), partitioned as
+
+    <region output>/series_store/region=<region>/scenario=<dom>/part.parquet
+
+Readers prune columns and push the variable / date-range predicates down to the Parquet row
+groups, so the series products never open the gridded data. A partition is rebuilt when any
+of its source files changes (_manifest.json keeps their size/mtime). Without pyarrow the
+partitions are CSV and the filters are applied after reading.
+
+Dates are ISO strings so noleap/360_day calendars round-trip; the calendar is in the manifest.
+"""
+import json
+import os
+import sys
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
+from organized.config import settings
+from organized.scripts.wb import datasets, storage
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+STORE_SUBDIR = "series_store"
+MANIFEST = "_manifest.json"
+ROW_GROUP = 50_000
+DAILY = {"P": "p_mmday", "PET": "pet_mmday", "WB": "wb_mmday"}
+ANNUAL = {"P_ann": "p_ann", "PET_ann": "pet_ann", "WB_ann": "wb_ann"}
+TEMPS = {"tas": ("tas", "tmean"), "tasmax": ("tasmax", "tmax"), "tasmin": ("tasmin", "tmin")}
+
+
+def wmean(da):
+    w = xr.DataArray(np.cos(np.deg2rad(da["lat"].values)), coords={"lat": da["lat"]}, dims=["lat"])
+    return da.weighted(w).mean(("lat", "lon"))
+
+
+def to_celsius(da):
+    """°C from K or °C, robust to missing units and undecoded scale_factor/add_offset."""
+    sf, ao = da.attrs.get("scale_factor"), da.attrs.get("add_offset")
+    if sf is not None or ao is not None:
+        da = da.astype("float64") * (1.0 if sf is None else float(sf)) + (0.0 if ao is None else float(ao))
+    u = str(da.attrs.get("units", "")).lower()
+    if "k" in u and "c" not in u:
+        return da - 273.15
+    if "c" in u:
+        return da
+    try:
+        vmin, vmax = float(da.min(skipna=True)), float(da.max(skipna=True))
+    except Exception:
+        return da - 273.15
+    return da - 273.15 if (vmax > 100.0 or vmin < -50.0) else da
+
+
+def store_dir(output_dir):
+    return os.path.join(output_dir, STORE_SUBDIR)
+
+
+def region_label(output_dir):
+    return os.path.basename(os.path.normpath(output_dir))
+
+
+def partition_path(output_dir, dom):
+    ext = "parquet" if pyarrow is not None else "csv"
+    return os.path.join(store_dir(output_dir), f"region={region_label(output_dir)}", f"scenario={dom}", f"part.{ext}")
+
+
+def _sources(input_dir, output_dir, dom):
+    out = {}
+    p = storage.wb_path(output_dir, dom)
+    if p:
+        out["wb"] = p
+    p = storage.agg_path(output_dir, dom)
+    if p:
+        out["agg"] = p
+    if input_dir:
+        for var in TEMPS:
+            for p in (os.path.join(input_dir, dom, f"{var}_{dom}.nc"), os.path.join(input_dir, dom, f"{var}.nc")):
+                if os.path.exists(p):
+                    out[var] = p
+                    break
+    return out
+
+
+def _stamps(sources):
+    out = {}
+    for kind, p in sources.items():
+        st = os.stat(p)
+        out[kind] = f"{os.path.abspath(p)}:{st.st_size}:{st.st_mtime_ns}"
+    return out
+
+
+def _manifest(output_dir):
+    p = os.path.join(store_dir(output_dir), MANIFEST)
+    if os.path.exists(p):
+        try:
+            with open(p, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            pass
+    return {}
+
+
+def _save_manifest(output_dir, manifest):
+    p = os.path.join(store_dir(output_dir), MANIFEST)
+    tmp = p + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp, p)
+
+
+def _iso_dates(time):
+    values = np.asarray(time.values)
+    if np.issubdtype(values.dtype, np.datetime64):
+        return pd.DatetimeIndex(values).strftime("%Y-%m-%d").to_numpy(), "standard"
+    dates = np.array([f"{t.year:04d}-{t.month:02d}-{t.day:02d}" for t in values])
+    return dates, getattr(values[0], "calendar", "standard") if values.size else "standard"
+
+
+def _frame(dom, variable, series):
+    dates, calendar = _iso_dates(series["time"])
+    df = pd.DataFrame({"date": dates, "value": np.asarray(series.values, dtype=float)})
+    df.insert(0, "variable", variable)
+    df.insert(0, "scenario", dom)
+    return df, calendar
+
+
+def build_domain(input_dir, output_dir, dom, force=False):
+    """Writes (or keeps, when current) the partition of dom. Returns its path or None without sources."""
+    manifest = _manifest(output_dir)
+    entry = manifest.get(dom, {})
+    input_dir = input_dir or entry.get("input_dir")
+    sources = _sources(input_dir, output_dir, dom)
+    if not sources:
+        return None
+    path = partition_path(output_dir, dom)
+    stamps = _stamps(sources)
+    if not force and entry.get("sources") == stamps and os.path.exists(path):
+        return path
+
+    frames, calendar = [], "standard"
+    if "wb" in sources:
+        ds = datasets.open_wb(sources["wb"])
+        for name, v in DAILY.items():
+            if v in ds:
+                df, calendar = _frame(dom, name, wmean(ds[v]))
+                frames.append(df)
+    if "agg" in sources:
+        ds = datasets.open_dataset(sources["agg"])
+        for name, v in ANNUAL.items():
+            if v in ds:
+                frames.append(_frame(dom, name, wmean(ds[v]))[0])
+    for var, names in TEMPS.items():
+        if var not in sources:
+            continue
+        ds = datasets.open_dataset(sources[var])
+        name = next((n for n in names if n in ds), None)
+        if name is not None and "time" in ds[name].dims:
+            frames.append(_frame(dom, var, wmean(to_celsius(ds[name])))[0])
+    if not frames:
+        return None
+
+    df = pd.concat(frames, ignore_index=True).sort_values(["variable", "date"], kind="stable")
+    df.insert(0, "region", region_label(output_dir))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if pyarrow is not None:
+        df.to_parquet(path, index=False, row_group_size=ROW_GROUP)
+    else:
+        df.to_csv(path, index=False)
+    manifest[dom] = {"sources": stamps, "calendar": calendar, "input_dir": input_dir,
+                     "variables": sorted(df["variable"].unique().tolist())}
+    _save_manifest(output_dir, manifest)
+    return path
+
+
+def build(input_dir, output_dir, domains=None, force=False):
+    return {dom: build_domain(input_dir, output_dir, dom, force) for dom in (domains or settings.DOMAINS)}
+
+
+def read(output_dir, dom, variables=None, t0=None, t1=None, input_dir=None):
+    """Long DataFrame (variable, date, value) of dom restricted to variables and years [t0, t1]."""
+    path = build_domain(input_dir, output_dir, dom)
+    if path is None:
+        return None
+    lo = f"{int(t0):04d}-01-01" if t0 is not None else None
+    hi = f"{int(t1):04d}-12-31" if t1 is not None else None
+    cols = ["variable", "date", "value"]
+    if path.endswith(".parquet"):
+        filters = []
+        if variables:
+            filters.append(("variable", "in", list(variables)))
+        if lo:
+            filters.append(("date", ">=", lo))
+        if hi:
+            filters.append(("date", "<=", hi))
+        return pd.read_parquet(path, columns=cols, filters=filters or None)
+    df = pd.read_csv(path, usecols=cols, dtype={"variable": str, "date": str})
+    keep = np.ones(len(df), dtype=bool)
+    if variables:
+        keep &= df["variable"].isin(list(variables)).to_numpy()
+    if lo:
+        keep &= (df["date"] >= lo).to_numpy()
+    if hi:
+        keep &= (df["date"] <= hi).to_numpy()
+    return df[keep]
+
+
+def _decode(dates, calendar):
+    if calendar in ("standard", "gregorian", "proleptic_gregorian"):
+        return pd.to_datetime(dates).to_numpy()
+    import cftime
+    return np.array([cftime.datetime(int(d[:4]), int(d[5:7]), int(d[8:10]), calendar=calendar) for d in dates])
+
+
+def dataset(output_dir, dom, variables, t0=None, t1=None, input_dir=None):
+    """xr.Dataset (time) with one variable per requested series, or None when none is stored."""
+    df = read(output_dir, dom, variables, t0, t1, input_dir)
+    if df is None or df.empty:
+        return None
+    wide = df.pivot(index="date", columns="variable", values="value").sort_index()
+    time = _decode(wide.index.to_numpy(), _manifest(output_dir).get(dom, {}).get("calendar", "standard"))
+    return xr.Dataset({v: ("time", wide[v].to_numpy()) for v in wide.columns if not variables or v in variables},
+                      coords={"time": time})
+
+
+def run(region_codes=None):
+    print("\n" + "="*60)
+    print("SERIES STORE")
+    print("="*60)
+    for region_code, region_info in settings.iter_regions(region_codes):
+        input_dir = settings.get_region_input_dir(region_code)
+        output_dir = settings.get_region_output_dir(region_code)
+        built = {dom: p for dom, p in build(input_dir, output_dir).items() if p}
+        print(f"  ✅ {region_info['name']}: {len(built)} escenario(s) en {store_dir(output_dir)}")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,79 @@
+import os
+import numpy as np
+import xarray as xr
+from organized.config import settings
+from organized.scripts.wb import ensemble
+
+PROFILES = ("float64", "float32", "int16")
+
+_INT16_FILL = -32768
+_INT16_SPAN = 65534
+
+def resolve_profile(profile=None):
+    profile = (profile or settings.STORAGE_PROFILE or "float64").lower()
+    if profile not in PROFILES:
+        print(f"    ⚠️ Unknown storage profile '{profile}', using float64")
+        return "float64"
+    return profile
+
+def _packing(da):
+    """CF scale_factor/add_offset that maps the finite range of da onto int16."""
+    vmin = float(da.min(skipna=True))
+    vmax = float(da.max(skipna=True))
+    if not (np.isfinite(vmin) and np.isfinite(vmax)):
+        return 1.0, 0.0
+    span = vmax - vmin
+    scale = span / _INT16_SPAN if span > 0 else 1.0
+    offset = (vmax + vmin) / 2.0
+    return scale, offset
+
+def var_encoding(da, profile=None, complevel=4):
+    """netCDF encoding for one variable under the given storage profile."""
+    profile = resolve_profile(profile)
+    enc = {'zlib': True, 'complevel': complevel}
+    if profile == "float32":
+        enc['dtype'] = 'float32'
+    elif profile == "int16":
+        scale, offset = _packing(da)
+        enc.update(dtype='int16', scale_factor=scale, add_offset=offset, _FillValue=_INT16_FILL)
+    return enc
+
+def dataset_encoding(ds, profile=None, complevel=4):
+    return {k: var_encoding(ds[k], profile, complevel) for k in ds.data_vars}
+
+def to_netcdf(ds, path, profile=None):
+    """Writes ds with the storage profile applied to every data variable."""
+    if isinstance(ds, xr.DataArray):
+        ds = ds.to_dataset()
+    ds.to_netcdf(path, encoding=dataset_encoding(ds, profile))
+
+def wb_path(data_dir, dom):
+    """Path of wb_<dom>.nc (or legacy wb.nc) inside data_dir/dom, None if missing."""
+    p = os.path.join(data_dir, dom, f"wb_{dom}.nc")
+    if os.path.exists(p):
+        return p
+    p = os.path.join(data_dir, dom, "wb.nc")
+    if os.path.exists(p):
+        return p
+    ensemble.warn_members_only(data_dir, dom, f"wb_{dom}.nc")
+    return None
+
+def agg_path(data_dir, dom):
+    """Path of wb_agg_<dom>.nc inside data_dir/dom, None if missing."""
+    p = os.path.join(data_dir, dom, f"wb_agg_{dom}.nc")
+    if os.path.exists(p):
+        return p
+    ensemble.warn_members_only(data_dir, dom, f"wb_agg_{dom}.nc")
+    return None
+
+def with_wb(ds):
+    """Reconstructs wb_mmday = P - PET for lean files that only store P and PET."""
+    if "wb_mmday" in ds or "p_mmday" not in ds or "pet_mmday" not in ds:
+        return ds
+    wb = (ds["p_mmday"] - ds["pet_mmday"]).rename("wb_mmday")
+    wb.attrs['units'] = 'mm/day'
+    return ds.assign(wb_mmday=wb)
+
+def open_wb(path, **kwargs):
+    """Opens a wb_<dom>.nc file, full or lean, always exposing wb_mmday."""
+    return with_wb(xr.open_dataset(path, **kwargs))
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Time of emergence (ToE) of annual tas, P, WB and AI per cell and scenario.
+
+Noise is the interannual standard deviation σ of the historical annual values in BASE_PERIOD.
+The signal is the centred TOE_SMOOTH_YEARS-year moving mean of the historical years followed
+by the scenario years, minus the base mean. The signal's direction is its sign in the last
+year. ToE is the first year after the base period from which the signal stays beyond
+TOE_K·σ in that direction until the end of the run. Cells that never emerge are NaN.
+
+Everything is vectorised over (year, cell) arrays of the cached annual cubes (annual_cube):
+rolling means from cumulative sums and "stays above" from a reversed cumulative AND.
+
+Outputs (OUT_CAT_EMERGENCIA): one ToE map per variable (panels = scenarios), the emerged-area
+fraction per year, and toe_resumen.csv; the per-cell fields go to <dom>/toe_<dom>.nc.
+
+    python scripts/wb/time_of_emergence.py --self-test   # synthetic trend / noise checks
+"""
+import os
+import sys
+import warnings
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+import xarray as xr
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
+from organized.config import settings
+from organized.scripts.wb import annual_cube, geometry, gis_env, map_render, storage
+from organized.scripts.wb.trend_analysis import area_mean, area_weights
+
+HIST = "historical_ecuador"
+SCENS = [d for d in settings.DOMAINS if "historical" not in d]
+BASE = settings.BASE_PERIOD
+PALETTE = settings.PALETTE
+LABELS = {d: d.replace("_ecuador", "").upper() for d in settings.DOMAINS}
+VARS = ("tas", "P", "WB", "AI")
+TITULOS = {
+    "tas": "Temperatura media anual", "P": "Precipitación anual",
+    "WB": "Balance hídrico anual", "AI": "Índice de aridez (P/PET)",
+}
+HORIZONS = (2050, 2100)
+
+
+def rolling_mean(values, k, min_frac=0.6):
+    """Centred moving mean along axis 0 of (n, ...) ignoring NaN; NaN with fewer than ceil(k*min_frac) values."""
+    v = np.asarray(values, dtype=float)
+    k = int(k) if int(k) % 2 == 1 else int(k) + 1
+    half, min_pts = k // 2, max(1, int(np.ceil(k * min_frac)))
+    valid = np.isfinite(v)
+    pad = [(half, half)] + [(0, 0)] * (v.ndim - 1)
+    zero = np.zeros((1,) + v.shape[1:])
+    cs = np.concatenate([zero, np.cumsum(np.pad(np.where(valid, v, 0.0), pad), 0)])
+    cn = np.concatenate([zero, np.cumsum(np.pad(valid.astype(float), pad), 0)])
+    s, c = cs[k:] - cs[:-k], cn[k:] - cn[:-k]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(c >= min_pts, s / c, np.nan)
+
+
+def emergence(years, values, mu, sigma, first_year, k=None, smooth=None):
+    """
+    ToE along axis 0 of values (n, ...) against base mean mu and std sigma (shaped like values[0]).
+    Returns (toe, direction): first year >= first_year from which the smoothed anomaly stays
+    beyond k·σ on the side of its final sign (NaN when it never does), and that sign.
+    """
+    k = settings.TOE_K if k is None else k
+    anom = rolling_mean(values, smooth or settings.TOE_SMOOTH_YEARS) - mu
+    finite = np.isfinite(anom)
+    # Sign of the last smoothed value of each cell.
+    last = np.where(finite.any(0), finite.shape[0] - 1 - np.argmax(finite[::-1], 0), 0)
+    direction = np.sign(np.take_along_axis(anom, last[None], 0)[0])
+    with np.errstate(invalid="ignore"):
+        beyond = (direction * anom > k * sigma) & (sigma > 0)
+    # Years without a smoothed value (series edges, gaps) neither break nor start the run.
+    holds = beyond | ~finite
+    holds[np.asarray(years) < first_year] = False
+    stays = np.logical_and.accumulate(holds[::-1], 0)[::-1] & beyond
+    emerged = stays.any(0)
+    toe = np.where(emerged, np.asarray(years, dtype=float)[np.argmax(stays, 0)], np.nan)
+    return toe, np.where(emerged, direction, 0.0)
+
+
+def self_test():
+    """Synthetic checks: a steady trend far beyond k·σ emerges, pure noise and a reverting signal do not."""
+    rng = np.random.default_rng(0)
+    years = np.arange(1981, 2101)
+    first = int(BASE[1]) + 1
+    base = (years >= int(BASE[0])) & (years <= int(BASE[1]))
+    trend = np.where(years > int(BASE[1]), (years - int(BASE[1])) * 0.8, 0.0)
+    noise = rng.normal(0, 1, (years.size, 3))
+    cases = {
+        "trend": (np.c_[trend, -trend, trend + 0.1 * noise[:, 0]], True),
+        "noise": (noise, False),
+        "reverting": (np.where(years > 2060, 0.0, trend)[:, None] + 0.1 * noise[:, :1], False),
+    }
+    ok = True
+    for name, (v, expect) in cases.items():
+        mu, sd = v[base].mean(0), np.maximum(v[base].std(0, ddof=1), 0.1)
+        toe, _ = emergence(years, v, mu, sd, first, k=2.0, smooth=11)
+        good = bool(np.isfinite(toe).all() if expect else np.isnan(toe).all())
+        if expect and good:
+            good = bool((toe >= first).all() and (toe <= 2030).all())
+        ok &= good
+        print(f"  {'✅' if good else '❌'} {name}: ToE = {toe}")
+    # Same answer on a 1-D (area-mean) series.
+    toe1, _ = emergence(years, trend, 0.0, 1.0, first, k=2.0, smooth=11)
+    ok &= bool(np.isfinite(toe1))
+    print(f"{'✅' if ok else '❌'} Time of emergence self-test")
+    return ok
+
+
+def base_stats(hist):
+    """Base-period mean and interannual std (ddof=1) per cell of every variable of the historical cubes."""
+    sel = hist.sel(year=slice(int(BASE[0]), int(BASE[1])))
+    out = {}
+    for var in VARS:
+        if var in sel and sel.sizes["year"] > 1:
+            v = sel[var].values
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", RuntimeWarning)
+                out[var] = (np.nanmean(v, 0), np.nanstd(v, 0, ddof=1))
+    return out
+
+
+def joined(hist, cubes, var):
+    """(years, values) of the historical years before the scenario followed by the scenario years."""
+    years = cubes["year"].values
+    v = cubes[var].values
+    if var in hist and hist[var].shape[1:] == v.shape[1:]:
+        h = hist[var].isel(year=np.flatnonzero(hist["year"].values < years.min()))
+        years = np.r_[h["year"].values, years]
+        v = np.concatenate([h.values, v])
+    return years, v
+
+
+def domain_toe(scen, hist, stats, cubes):
+    """(toe Dataset (lat, lon), area-mean rows, emerged-area fraction per year) of one scenario."""
+    w = area_weights(cubes["lat"].values, cubes["lon"].values)
+    data, rows, frac = {}, [], {}
+    first = int(BASE[1]) + 1
+    for var in VARS:
+        if var not in cubes or var not in stats:
+            continue
+        years, v = joined(hist, cubes, var)
+        mu, sigma = stats[var]
+        toe, direction = emergence(years, v, mu, sigma, first)
+        data[f"{var}_toe"] = (("lat", "lon"), toe, {"units": "año"})
+        data[f"{var}_signo"] = (("lat", "lon"), direction)
+
+        # Area-mean series against the σ of the area-mean base series (not the mean of cell σ).
+        hv = hist[var].sel(year=slice(int(BASE[0]), int(BASE[1]))).values
+        base_area = area_mean(hv, w)
+        series = area_mean(v, w)
+        toe_area, _ = emergence(years, series, np.nanmean(base_area), np.nanstd(base_area, ddof=1), first)
+
+        valid = np.isfinite(mu) & np.isfinite(sigma)
+        wv = (w * valid).sum()
+        share = lambda m: round(100.0 * (w * (m & valid)).sum() / wv, 1) if wv > 0 else np.nan
+        frac[var] = (years[years >= first], [share(toe <= y) for y in years[years >= first]])
+        row = {"escenario": LABELS[scen], "variable": var,
+               "k_sigma": settings.TOE_K, "suavizado_anios": settings.TOE_SMOOTH_YEARS,
+               "toe_media_areal": None if np.isnan(toe_area) else int(toe_area),
+               "toe_mediana_celdas": float(np.nanmedian(toe[valid])) if np.isfinite(toe[valid]).any() else None}
+        for h in HORIZONS:
+            row[f"area_emergida_{h}_pct"] = share(toe <= h)
+        rows.append(row)
+    ds = xr.Dataset(data, coords={"lat": cubes["lat"].values, "lon": cubes["lon"].values},
+                    attrs={"base_period": f"{BASE[0]}-{BASE[1]}", "k_sigma": settings.TOE_K,
+                           "smooth_years": settings.TOE_SMOOTH_YEARS})
+    return ds, rows, frac
+
+
+def render_maps(output_dir, region_info, toes):
+    ref = next(iter(toes.values()))
+    lat, lon = ref["lat"].values, ref["lon"].values
+    shp = region_info.get("shapefile")
+    tpl = map_render.MapTemplate(lat, lon, 1, len(SCENS), figsize=(5 * len(SCENS), 4),
+                                 outline=geometry.outline_segments(shp, lat, lon), bounds=geometry.bounds(shp),
+                                 colorbar="per_axes")
+    try:
+        for var in VARS:
+            fields = [toes[s][f"{var}_toe"].values if s in toes and f"{var}_toe" in toes[s] else None for s in SCENS]
+            if all(f is None for f in fields):
+                continue
+            out = settings.fig_path(output_dir, settings.OUT_CAT_EMERGENCIA, f"toe_{var}.png")
+            tpl.render(fields, out, titles=[LABELS[s] for s in SCENS],
+                       suptitle=f"{TITULOS[var]} — año de emergencia (> {settings.TOE_K:g}σ de {BASE[0]}–{BASE[1]});"
+                                f" blanco: sin emergencia — {region_info['name']}",
+                       cmap="magma", vmin=int(BASE[1]) + 1, vmax=max(HORIZONS), cbar_label="Año", hide_missing=True)
+            print(f"  Generated: {os.path.basename(out)}")
+    finally:
+        tpl.close()
+
+
+def plot_fractions(output_dir, region_info, fracs):
+    vars_ = [v for v in VARS if any(v in f for f in fracs.values())]
+    fig, axes = plt.subplots(1, len(vars_), figsize=(4.5 * len(vars_), 3.6), sharey=True, squeeze=False)
+    for ax, var in zip(axes[0], vars_):
+        for scen, f in fracs.items():
+            if var in f:
+                ax.plot(f[var][0], f[var][1], color=PALETTE.get(scen, "k"), lw=2, label=LABELS[scen])
+        ax.set_title(TITULOS[var], fontsize=10)
+        ax.set_xlabel("Año")
+        ax.grid(True, alpha=0.3)
+    axes[0, 0].set_ylabel("Área emergida (%)")
+    axes[0, 0].set_ylim(0, 100)
+    axes[0, 0].legend(fontsize=8)
+    fig.suptitle(f"Fracción del área con señal emergida (> {settings.TOE_K:g}σ) — {region_info['name']}",
+                 fontsize=12, fontweight="bold")
+    plt.tight_layout()
+    out = settings.fig_path(output_dir, settings.OUT_CAT_EMERGENCIA, "fraccion_area_emergida.png")
+    plt.savefig(out, dpi=180, bbox_inches="tight")
+    plt.close()
+    print(f"  Generated: {os.path.basename(out)}")
+
+
+def run(region_codes=None):
+    gis_env.setup()
+    print("\n" + "="*60)
+    print("TIME OF EMERGENCE")
+    print("="*60)
+
+    for region_code, region_info in settings.iter_regions(region_codes):
+        input_dir = settings.get_region_input_dir(region_code)
+        output_dir = settings.get_region_output_dir(region_code)
+        print(f"Processing region: {region_info['name']} ({output_dir})")
+
+        hist = annual_cube.load(input_dir, output_dir, HIST)
+        stats = base_stats(hist) if hist is not None else {}
+        if not stats:
+            print(f"  ⚠️ Sin línea base anual para {region_info['name']}"); continue
+
+        toes, rows, fracs = {}, [], {}
+        for scen in SCENS:
+            cubes = annual_cube.load(input_dir, output_dir, scen)
+            if cubes is None:
+                continue
+            if cubes.sizes["lat"] != hist.sizes["lat"] or cubes.sizes["lon"] != hist.sizes["lon"]:
+                print(f"  ⚠️ {scen}: malla distinta a la histórica (omitido)"); continue
+            toes[scen], scen_rows, fracs[scen] = domain_toe(scen, hist, stats, cubes)
+            storage.to_netcdf(toes[scen], os.path.join(output_dir, scen, f"toe_{scen}.nc"))
+            rows += scen_rows
+        if not toes:
+            print(f"  ⚠️ Sin escenarios para {region_info['name']}"); continue
+
+        out_csv = settings.fig_path(output_dir, settings.OUT_CAT_EMERGENCIA, "toe_resumen.csv")
+        pd.DataFrame(rows).to_csv(out_csv, index=False)
+        print(f"  ✅ Wrote {os.path.basename(out_csv)}")
+        render_maps(output_dir, region_info, toes)
+        plot_fractions(output_dir, region_info, fracs)
+
+
+if __name__ == "__main__":
+    if "--self-test" in sys.argv:
+        sys.exit(0 if self_test() else 1)
+    run()
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Mann-Kendall significance and Sen's slope of annual P, PET, WB, AI and tas, per cell and
+for the area mean, over the full span of every scenario.
+
+The tests are vectorised across cells: for a block of cells, all year pairs (i < j) are formed
+at once as (pairs, cells) differences, so S is a sum of signs and Sen's slope a nanmedian
+along the pair axis. Blocks are sized by TREND_BLOCK_MB (pairs grow as n_years²), which keeps
+national grids within memory. The variance of S includes the tie correction; NaN years are
+dropped cell by cell.
+
+Outputs (OUT_CAT_TENDENCIAS): one map per variable (Sen's slope per decade, dots where
+p < TREND_ALPHA) and tendencias_media_areal.csv; the per-cell fields go to <dom>/trends_<dom>.nc.
+"""
+import os
+import sys
+import warnings
+import numpy as np
+import pandas as pd
+import xarray as xr
+from scipy import special
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
+from organized.config import settings
+from organized.scripts.wb import annual_cube, geometry, gis_env, map_render, storage
+
+DOMS = settings.DOMAINS
+LABELS = {d: d.replace("_ecuador", "").upper() for d in DOMS}
+TITULOS = {
+    "P": "Precipitación anual", "PET": "Evapotranspiración potencial anual", "WB": "Balance hídrico anual",
+    "AI": "Índice de aridez (P/PET)", "tas": "Temperatura media anual",
+}
+CMAPS = {"P": "BrBG", "PET": "PuOr_r", "WB": "RdBu", "AI": "BrBG", "tas": "RdYlBu_r"}
+
+
+def mann_kendall(y, x=None, block_mb=None):
+    """
+    Mann-Kendall test and Sen's slope along axis 0 of y (n, ...) with abscissa x (default 0..n-1).
+    Returns {"s", "z", "p", "slope", "n"} shaped like y[0]; cells with fewer than
+    TREND_MIN_YEARS valid values are NaN.
+    """
+    y = np.asarray(y, dtype=float)
+    shape = y.shape[1:]
+    n = y.shape[0]
+    y = y.reshape(n, -1)
+    x = np.arange(n, dtype=float) if x is None else np.asarray(x, dtype=float)
+    ncell = y.shape[1]
+    out = {k: np.full(ncell, np.nan) for k in ("s", "z", "p", "slope", "n")}
+    if n < 2 or ncell == 0:
+        return {k: v.reshape(shape) for k, v in out.items()}
+
+    i, j = np.triu_indices(n, 1)
+    dx = (x[j] - x[i])[:, None]
+    budget = (block_mb or settings.TREND_BLOCK_MB) * 2**20
+    step = int(max(1, budget // (3 * 8 * i.size)))
+    for c0 in range(0, ncell, step):
+        b = y[:, c0:c0 + step]
+        d = b[j] - b[i]
+        nv = np.isfinite(b).sum(0)
+        s = np.nansum(np.sign(d), 0)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            slope = np.nanmedian(d / dx, 0)
+
+        # Tie groups per cell from the sorted values (NaN never equals itself: no ties).
+        srt = np.sort(b, 0)
+        gid = np.cumsum(np.r_[np.ones((1, b.shape[1]), bool), srt[1:] != srt[:-1]], 0) - 1
+        t = np.bincount((gid + n * np.arange(b.shape[1])).ravel(), minlength=n * b.shape[1]).reshape(b.shape[1], n)
+        ties = (t * (t - 1) * (2 * t + 5)).sum(1)
+        var = (nv * (nv - 1) * (2 * nv + 5) - ties) / 18.0
+        with np.errstate(invalid="ignore", divide="ignore"):
+            z = np.where(var > 0, (s - np.sign(s)) / np.sqrt(var), 0.0)
+
+        ok = nv >= settings.TREND_MIN_YEARS
+        sl = slice(c0, c0 + b.shape[1])
+        out["s"][sl] = np.where(ok, s, np.nan)
+        out["z"][sl] = np.where(ok, z, np.nan)
+        out["p"][sl] = np.where(ok, 2.0 * special.ndtr(-np.abs(z)), np.nan)
+        out["slope"][sl] = np.where(ok, slope, np.nan)
+        out["n"][sl] = nv
+    return {k: v.reshape(shape) for k, v in out.items()}
+
+
+def area_weights(lat, lon):
+    return np.cos(np.deg2rad(np.asarray(lat, dtype=float)))[:, None] * np.ones(len(lon))
+
+
+def area_mean(cube, w):
+    """cos(lat)-weighted mean over the valid cells of each (lat, lon) slice of cube (year, lat, lon)."""
+    valid = np.isfinite(cube)
+    wv = (w[None] * valid).sum((1, 2))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(wv > 0, (np.where(valid, cube, 0.0) * w[None]).sum((1, 2)) / wv, np.nan)
+
+
+def domain_trends(cubes):
+    """Per-cell trends of every variable of one scenario's annual cubes -> xr.Dataset (lat, lon)."""
+    years = cubes["year"].values
+    data = {}
+    for var in annual_cube.VARS:
+        if var not in cubes:
+            continue
+        r = mann_kendall(cubes[var].values, years)
+        data[f"{var}_slope"] = (("lat", "lon"), r["slope"] * 10.0, {"units": f"{annual_cube.UNITS[var]}/década"})
+        data[f"{var}_p"] = (("lat", "lon"), r["p"])
+        data[f"{var}_n"] = (("lat", "lon"), r["n"])
+    return xr.Dataset(data, coords={"lat": cubes["lat"].values, "lon": cubes["lon"].values},
+                      attrs={"period": f"{int(years.min())}-{int(years.max())}"})
+
+
+def area_rows(dom, cubes, trends):
+    """Area-mean trend and share of area with significant increases / decreases for one scenario."""
+    w = area_weights(cubes["lat"].values, cubes["lon"].values)
+    years = cubes["year"].values
+    rows = []
+    for var in annual_cube.VARS:
+        if var not in cubes:
+            continue
+        series = area_mean(cubes[var].values, w)
+        r = mann_kendall(series[:, None], years)
+        slope, p = trends[f"{var}_slope"].values, trends[f"{var}_p"].values
+        valid = np.isfinite(p)
+        wv = (w * valid).sum()
+        sig = valid & (p < settings.TREND_ALPHA)
+        share = lambda m: round(100.0 * (w * m).sum() / wv, 1) if wv > 0 else np.nan
+        rows.append({
+            "escenario": LABELS[dom], "variable": var, "unidad": f"{annual_cube.UNITS[var]}/década",
+            "periodo": trends.attrs["period"], "n_anios": int(np.isfinite(series).sum()),
+            "sen_pendiente_decada": float(r["slope"][0]) * 10.0, "mk_z": float(r["z"][0]), "mk_p": float(r["p"][0]),
+            "significativa": bool(r["p"][0] < settings.TREND_ALPHA),
+            "area_aumento_sig_pct": share(sig & (slope > 0)), "area_disminucion_sig_pct": share(sig & (slope < 0)),
+        })
+    return rows
+
+
+def render_maps(output_dir, region_info, trends):
+    ref = next(iter(trends.values()))
+    lat, lon = ref["lat"].values, ref["lon"].values
+    shp = region_info.get("shapefile")
+    doms = [d for d in DOMS if d in trends]
+    ncols = 2 if len(doms) > 1 else 1
+    nrows = (len(doms) + ncols - 1) // ncols
+    tpl = map_render.MapTemplate(lat, lon, nrows, ncols, figsize=(6 * ncols, 4.5 * nrows),
+                                 outline=geometry.outline_segments(shp, lat, lon), bounds=geometry.bounds(shp),
+                                 colorbar="per_axes")
+    try:
+        for var in annual_cube.VARS:
+            fields = [trends[d][f"{var}_slope"].values if f"{var}_slope" in trends[d] else None for d in doms]
+            if all(f is None for f in fields):
+                continue
+            vals = np.concatenate([f[np.isfinite(f)] for f in fields if f is not None])
+            vm = float(np.nanpercentile(np.abs(vals), 98)) if vals.size else 1.0
+            vm = vm or 1.0
+            stipple = [trends[d][f"{var}_p"].values < settings.TREND_ALPHA if f is not None else None
+                       for d, f in zip(doms, fields)]
+            unit = f"{annual_cube.UNITS[var]}/década"
+            out = settings.fig_path(output_dir, settings.OUT_CAT_TENDENCIAS, f"tendencia_{var}.png")
+            tpl.render(fields, out, titles=[f"{LABELS[d]} ({trends[d].attrs['period']})" for d in doms],
+                       suptitle=f"{TITULOS[var]} — pendiente de Sen ({unit}); puntos: Mann-Kendall p < {settings.TREND_ALPHA}"
+                                f" — {region_info['name']}",
+                       cmap=CMAPS[var], vmin=-vm, vmax=vm, cbar_label=unit, stipple=stipple, hide_missing=True)
+            print(f"  Generated: {os.path.basename(out)}")
+    finally:
+        tpl.close()
+
+
+def run(region_codes=None):
+    gis_env.setup()
+    print("\n" + "="*60)
+    print("TRENDS (MANN-KENDALL / SEN)")
+    print("="*60)
+
+    for region_code, region_info in settings.iter_regions(region_codes):
+        input_dir = settings.get_region_input_dir(region_code)
+        output_dir = settings.get_region_output_dir(region_code)
+        print(f"Processing region: {region_info['name']} ({output_dir})")
+
+        trends, rows = {}, []
+        for dom in DOMS:
+            cubes = annual_cube.load(input_dir, output_dir, dom)
+            if cubes is None or cubes.sizes["year"] < settings.TREND_MIN_YEARS:
+                continue
+            trends[dom] = domain_trends(cubes)
+            storage.to_netcdf(trends[dom], os.path.join(output_dir, dom, f"trends_{dom}.nc"))
+            rows += area_rows(dom, cubes, trends[dom])
+        if not trends:
+            print(f"  ⚠️ Sin series anuales para {region_info['name']}"); continue
+
+        out_csv = settings.fig_path(output_dir, settings.OUT_CAT_TENDENCIAS, "tendencias_media_areal.csv")
+        pd.DataFrame(rows).round(4).to_csv(out_csv, index=False)
+        print(f"  ✅ Wrote {os.path.basename(out_csv)}")
+        render_maps(output_dir, region_info, trends)
+
+
+if __name__ == "__main__":
+    run()
@@ -1,95 +1,280 @@
+#!/usr/bin/env python3
+"""
+Input NetCDF validation.
+
+Checks per domain: files and variables present, lat/lon coords strictly increasing and within the
+expected extent, identical grids across variables, time cadence (duplicates, gaps, non-monotonic
+steps), shared timestamps, units, NaN rate and tas within [tasmin, tasmax]. Metadata checks use
+only coordinates and attributes; data checks stream every file once in time blocks
+(settings.VALIDATION_BLOCK_DAYS). Domains run in parallel processes, and results are cached by
+file size/mtime so unchanged inputs are not re-read.
+"""
+import hashlib
+import json
 import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+
 import numpy as np
-import pandas as pd
 import xarray as xr
 
 
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
 from organized.config import settings
 DERIVED = settings.DERIVED_DIR
 DOMAINS = settings.DOMAINS
 
-FAILS=[]; WARNS=[]
-def fail(msg): FAILS.append(msg); print("❌",msg)
-def warn(msg): WARNS.append(msg); print("⚠️",msg)
-def ok(msg): print("✅",msg)
-
-def check_open(path,var):
-    if not os.path.exists(path): fail(f"missing file: {path}"); return None
-    try: ds=xr.open_dataset(path);
-    except Exception as e: fail(f"cannot open {path}: {e}"); return None
-    if var not in ds: fail(f"{os.path.basename(path)} missing var '{var}'"); return None
-    return ds
-
-def check_coords(ds,dom,var):
-    cds=set(ds.coords);
-    for c in ['time','lat','lon']:
-        if c not in cds: fail(f"{dom}:{var} missing coord '{c}'")
-    if 'lat' in ds and not np.all(np.diff(ds['lat'])>0): fail(f"{dom}:{var} lat not strictly increasing")
-    if 'lon' in ds and not np.all(np.diff(ds['lon'])>0): fail(f"{dom}:{var} lon not strictly increasing")
-
-    if 'lat' in ds and (ds.lat.min()< -6 or ds.lat.max()> 3): warn(f"{dom}:{var} lat extent unexpected: {float(ds.lat.min())}..{float(ds.lat.max())}")
-    if 'lon' in ds and (ds.lon.min()< -82 or ds.lon.max()>-74): warn(f"{dom}:{var} lon extent unexpected: {float(ds.lon.min())}..{float(ds.lon.max())}")
-
-def check_time(ds,dom,var):
-    t=ds['time'].values
-    if pd.Index(t).has_duplicates: fail(f"{dom}:{var} time has duplicates")
-    dt=pd.Series(pd.to_datetime(t)).diff().dropna().dt.days
-    if not len(dt): return
-    if not (dt.mode().iloc[0]==1): warn(f"{dom}:{var} cadence mode={dt.mode().iloc[0]}d (expected 1d)")
-    gaps=(dt>1).sum()
-    if gaps>0: warn(f"{dom}:{var} has {gaps} gap(s) >1 day")
-    if (dt<=0).any(): fail(f"{dom}:{var} non-monotonic time diffs ≤0")
-
-def check_units(ds,dom,var):
-    u=str(ds[var].attrs.get('units','')).strip().lower()
-    if var=='pr' and u not in ['kg m-2 s-1','kg m**-2 s**-1','kg m-2 s-1.','kg m-2 s^-1']: warn(f"{dom}:{var} units '{u}' (expected kg m-2 s-1)")
-    if var in ['tas','tasmin','tasmax'] and u not in ['k','kelvin','kelvins']: warn(f"{dom}:{var} units '{u}' (expected K)")
-
-def nan_rate(ds,dom,var):
-    da=ds[var]; frac=float(da.isnull().mean())
-    if frac>0.01: warn(f"{dom}:{var} NaN rate {frac:.2%} (>1%)")
-
-def arrays_equal(a,b): return a.size==b.size and np.allclose(a,b,equal_nan=False)
-
-def validate_domain(dom):
-    print("\n=== DOMAIN:",dom,"===")
-    pdir=f"{DERIVED}/{dom}"
-    paths={v:f"{pdir}/{v}_{dom}.nc" for v in ['pr','tas','tasmin','tasmax']}
-    dsets={v:check_open(paths[v],v) for v in paths}
-    if any(ds is None for ds in dsets.values()): return
-
-    for v,ds in dsets.items():
-        check_coords(ds,dom,v); check_time(ds,dom,v); check_units(ds,dom,v); nan_rate(ds,dom,v)
-
-    lats={v: dsets[v]['lat'].values for v in dsets}
-    lons={v: dsets[v]['lon'].values for v in dsets}
-    for v in ['tas','tasmin','tasmax']:
-        if not arrays_equal(lats['pr'],lats[v]): fail(f"{dom}: lat grid pr vs {v} differ")
-        if not arrays_equal(lons['pr'],lons[v]): fail(f"{dom}: lon grid pr vs {v} differ")
-
-    idx={v: pd.Index(pd.to_datetime(dsets[v]['time'].values)) for v in dsets}
-    inter=idx['pr'].intersection(idx['tas']).intersection(idx['tasmin']).intersection(idx['tasmax'])
-    for v in idx:
-        miss=len(idx[v])-len(inter)
-        if miss!=0: warn(f"{dom}:{v} has {miss} timestamp(s) not shared by all")
-
-    try:
-        tmin=dsets['tasmin']['tasmin']; t=dsets['tas']['tas']; tmax=dsets['tasmax']['tasmax']
-        bad_min=((t<tmin)-False).sum().item()
-        bad_max=((t>tmax)-False).sum().item()
-        bad_spread=((tmax<tmin)-False).sum().item()
-        if bad_min or bad_max or bad_spread:
-            warn(f"{dom}: tas outside [tasmin,tasmax] count: below={bad_min}, above={bad_max}, inverted_spread={bad_spread}")
-        else:
-            ok(f"{dom}: tas within [tasmin,tasmax]")
-    except Exception as e:
-        warn(f"{dom}: couldn’t check tas range: {e}")
-    ok(f"{dom}: validation completed")
-
-for dom in DOMAINS: validate_domain(dom)
-print("\n==== SUMMARY ====")
-if FAILS: print("Failures:",len(FAILS)); [print(" -",m) for m in FAILS]
-if WARNS: print("Warnings:",len(WARNS)); [print(" -",m) for m in WARNS]
-sys.exit(1 if FAILS else 0)
+VARS = ("pr", "tas", "tasmin", "tasmax")
+ALIASES = {"pr": ("pr", "precip"), "tas": ("tas", "tmean"), "tasmin": ("tasmin", "tmin"), "tasmax": ("tasmax", "tmax")}
+LEGACY_PREFIX = {"pr": "P_", "tas": "T_"}
+PR_UNITS = {"kg m-2 s-1", "kg m**-2 s**-1", "kg m-2 s-1.", "kg m-2 s^-1", "mm/day", "mm day-1", "mm d-1", "mm"}
+T_UNITS = {"k", "kelvin", "kelvins", "degc", "°c", "c", "celsius", "degrees_celsius"}
+LAT_RANGE = (-6, 3)
+LON_RANGE = (-82, -74)
+NAN_RATE_WARN = 0.01
+CACHE_DIR = os.path.join(DERIVED, "validation_cache")
+
+
+def fail(msg): print("❌", msg)
+def warn(msg): print("⚠️", msg)
+def ok(msg): print("✅", msg)
+
+
+class Report:
+    """Structured validation result: one dict per issue (level, domain, var, check, message)."""
+
+    def __init__(self, issues=None):
+        self.issues = list(issues or [])
+
+    def extend(self, issues):
+        self.issues.extend(issues)
+
+    @property
+    def failures(self):
+        return [i for i in self.issues if i["level"] == "fail"]
+
+    @property
+    def warnings(self):
+        return [i for i in self.issues if i["level"] == "warn"]
+
+    @property
+    def ok(self):
+        return not self.failures
+
+    def to_dict(self):
+        return {"ok": self.ok, "failures": len(self.failures), "warnings": len(self.warnings), "issues": self.issues}
+
+    def text(self, level=None):
+        return "\n".join(f"{i['domain']}:{i['var'] or '*'} {i['message']}"
+                         for i in self.issues if level is None or i["level"] == level)
+
+    def print_summary(self):
+        print("\n==== SUMMARY ====")
+        if self.failures: print("Failures:", len(self.failures)); [print(" -", m) for m in self.text("fail").splitlines()]
+        if self.warnings: print("Warnings:", len(self.warnings)); [print(" -", m) for m in self.text("warn").splitlines()]
+        if self.ok and not self.warnings: ok("all inputs valid")
+
+
+def find_file(dom_dir, dom, var):
+    for p in (os.path.join(dom_dir, f"{var}_{dom}.nc"), os.path.join(dom_dir, f"{var}.nc")):
+        if os.path.exists(p):
+            return p
+    if os.path.isdir(dom_dir):
+        prefixes = [f"{var}_"] + ([LEGACY_PREFIX[var]] if var in LEGACY_PREFIX else [])
+        for f in sorted(os.listdir(dom_dir)):
+            if f.endswith(".nc") and any(f.startswith(px) for px in prefixes):
+                return os.path.join(dom_dir, f)
+    return None
+
+
+def _seconds(t):
+    """Time coordinate as int64 seconds (datetime64 or cftime)."""
+    if np.issubdtype(t.dtype, np.datetime64):
+        return t.astype("datetime64[s]").astype(np.int64)
+    return np.array([int(round((x.toordinal() + (x.hour * 3600 + x.minute * 60 + x.second) / 86400.0) * 86400)) for x in t],
+                    dtype=np.int64)
+
+
+def _stamp(paths):
+    parts = []
+    for p in sorted(paths):
+        st = os.stat(p)
+        parts.append(f"{os.path.abspath(p)}:{st.st_size}:{st.st_mtime_ns}")
+    return "|".join(parts)
+
+
+def check_domain(dom_dir, dom, block_days=None):
+    """All checks for one domain folder; returns a list of issue dicts. Each file's data is read once."""
+    block_days = block_days or settings.VALIDATION_BLOCK_DAYS
+    issues = []
+
+    def add(level, var, check, msg):
+        issues.append({"level": level, "domain": dom, "var": var, "check": check, "message": msg})
+
+    paths = {v: find_file(dom_dir, dom, v) for v in VARS}
+    for v, p in paths.items():
+        if p is None:
+            add("fail", v, "missing_file", f"missing file in {dom_dir}")
+
+    with ExitStack() as stack:
+        arrays = {}
+        for v, p in paths.items():
+            if p is None:
+                continue
+            try:
+                ds = stack.enter_context(xr.open_dataset(p))
+            except Exception as e:
+                add("fail", v, "open", f"cannot open {os.path.basename(p)}: {e}"); continue
+            name = next((n for n in ALIASES[v] if n in ds), None)
+            if name is None:
+                add("fail", v, "missing_var", f"{os.path.basename(p)} missing var '{v}'"); continue
+            da = ds[name]
+            missing = [c for c in ("time", "lat", "lon") if c not in da.dims]
+            if missing:
+                add("fail", v, "coords", f"missing coord(s) {missing}"); continue
+            arrays[v] = da.transpose("time", "lat", "lon")
+
+        # Metadata: coords, extent, units, cadence (coordinates and attributes only).
+        times = {}
+        for v, da in arrays.items():
+            lat, lon = da["lat"].values, da["lon"].values
+            if lat.size > 1 and not np.all(np.diff(lat) > 0): add("fail", v, "coords", "lat not strictly increasing")
+            if lon.size > 1 and not np.all(np.diff(lon) > 0): add("fail", v, "coords", "lon not strictly increasing")
+            if lat.min() < LAT_RANGE[0] or lat.max() > LAT_RANGE[1]:
+                add("warn", v, "extent", f"lat extent unexpected: {float(lat.min())}..{float(lat.max())}")
+            if lon.min() < LON_RANGE[0] or lon.max() > LON_RANGE[1]:
+                add("warn", v, "extent", f"lon extent unexpected: {float(lon.min())}..{float(lon.max())}")
+
+            u = str(da.attrs.get("units", "")).strip().lower()
+            if u not in (PR_UNITS if v == "pr" else T_UNITS):
+                add("warn", v, "units", f"units '{u}' (expected {'kg m-2 s-1 or mm/day' if v == 'pr' else 'K or °C'})")
+
+            t = _seconds(da["time"].values)
+            times[v] = t
+            dt = np.diff(t) / 86400.0
+            if dt.size:
+                if (dt == 0).any(): add("fail", v, "time", f"time has {int((dt == 0).sum())} duplicate(s)")
+                if (dt < 0).any(): add("fail", v, "time", "non-monotonic time diffs ≤0")
+                vals, counts = np.unique(np.round(dt[dt > 0]), return_counts=True)
+                if vals.size and vals[counts.argmax()] != 1:
+                    add("warn", v, "time", f"cadence mode={vals[counts.argmax()]:g}d (expected 1d)")
+                gaps = int((dt > 1.5).sum())
+                if gaps: add("warn", v, "time", f"has {gaps} gap(s) >1 day")
+
+        ref = "pr" if "pr" in arrays else next(iter(arrays), None)
+        for v, da in arrays.items():
+            if v == ref:
+                continue
+            for c in ("lat", "lon"):
+                a, b = arrays[ref][c].values, da[c].values
+                if a.size != b.size or not np.allclose(a, b):
+                    add("fail", v, "grid", f"{c} grid {ref} vs {v} differ")
+
+        if times:
+            shared = None
+            for t in times.values():
+                shared = t if shared is None else np.intersect1d(shared, t)
+            for v, t in times.items():
+                miss = t.size - shared.size
+                if miss: add("warn", v, "time", f"has {miss} timestamp(s) not shared by all")
+
+        # Data: one streamed pass over every file; temperatures share blocks when aligned.
+        temps = [v for v in ("tas", "tasmin", "tasmax") if v in arrays]
+        aligned = len(temps) == 3 and all(np.array_equal(times[v], times["tas"]) for v in temps) \
+            and not any(i["check"] == "grid" for i in issues if i["var"] in temps)
+        nan = {v: 0 for v in arrays}
+        total = {v: 0 for v in arrays}
+        offset = {}
+        below = above = inverted = 0
+        nmax = max((da.sizes["time"] for da in arrays.values()), default=0)
+        for start in range(0, nmax, block_days):
+            sl = slice(start, start + block_days)
+            block = {}
+            for v, da in arrays.items():
+                if start >= da.sizes["time"]:
+                    continue
+                vals = np.asarray(da.isel(time=sl).values, dtype=float)
+                nan[v] += int(np.isnan(vals).sum())
+                total[v] += vals.size
+                if aligned and v in temps:
+                    if v not in offset:
+                        u = str(da.attrs.get("units", "")).lower()
+                        med = np.nanmedian(vals) if np.isfinite(vals).any() else 0.0
+                        offset[v] = 0.0 if "c" in u else (273.15 if med > 200 else 0.0)
+                    block[v] = vals - offset[v]
+            if aligned and len(block) == 3:
+                with np.errstate(invalid="ignore"):
+                    below += int((block["tas"] < block["tasmin"]).sum())
+                    above += int((block["tas"] > block["tasmax"]).sum())
+                    inverted += int((block["tasmax"] < block["tasmin"]).sum())
+
+        for v in arrays:
+            frac = nan[v] / total[v] if total[v] else 0.0
+            if frac > NAN_RATE_WARN:
+                add("warn", v, "nan_rate", f"NaN rate {frac:.2%} (>{NAN_RATE_WARN:.0%})")
+        if aligned:
+            if below or above or inverted:
+                add("warn", "tas", "tas_range",
+                    f"tas outside [tasmin,tasmax] count: below={below}, above={above}, inverted_spread={inverted}")
+        elif len(temps) == 3:
+            add("warn", "tas", "tas_range", "couldn’t check tas range: temperature files not aligned")
+    return issues
+
+
+def _cached_check(dom_dir, dom, use_cache=True):
+    paths = [p for p in (find_file(dom_dir, dom, v) for v in VARS) if p]
+    cache = None
+    if use_cache and paths:
+        key = hashlib.sha1(_stamp(paths).encode("utf-8")).hexdigest()[:16]
+        cache = os.path.join(CACHE_DIR, f"{dom}_{key}.json")
+        if os.path.exists(cache):
+            with open(cache, encoding="utf-8") as f:
+                return json.load(f)
+    issues = check_domain(dom_dir, dom)
+    if cache:
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            with open(cache, "w", encoding="utf-8") as f:
+                json.dump(issues, f, ensure_ascii=False)
+        except OSError:
+            pass
+    return issues
+
+
+def validate_dirs(dom_dirs, workers=None, use_cache=True):
+    """Validates {dom: folder} in parallel; returns a Report."""
+    report = Report()
+    items = [(d, p) for d, p in dom_dirs.items() if p]
+    for d in [d for d, p in dom_dirs.items() if not p]:
+        report.extend([{"level": "warn", "domain": d, "var": None, "check": "missing_domain", "message": "domain folder not found"}])
+    workers = max(1, min(workers or settings.VALIDATION_WORKERS, len(items) or 1))
+    if workers == 1:
+        results = [_cached_check(p, d, use_cache) for d, p in items]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            results = list(ex.map(_cached_check, [p for _, p in items], [d for d, _ in items], [use_cache] * len(items)))
+    for (d, _), issues in zip(items, results):
+        report.extend(issues)
+        levels = {i["level"] for i in issues}
+        (fail if "fail" in levels else warn if "warn" in levels else ok)(f"{d}: validation completed")
+    return report
+
+
+def validate_region(input_dir, domains=None, workers=None, use_cache=True):
+    """Validates input_dir/<dom> for every domain."""
+    return validate_dirs({d: os.path.join(input_dir, d) for d in (domains or DOMAINS)}, workers, use_cache)
+
+
+def validate_sources(source_dir=None, data_source=None, workers=None):
+    """Validates the national folders clip_inputs would read for data_source."""
+    from organized.scripts import clip_inputs
+    search_dirs = clip_inputs.source_search_dirs(source_dir or settings.BASE_DIR, data_source)
+    return validate_dirs({d: clip_inputs.find_domain_source(d, search_dirs) for d in DOMAINS}, workers)
+
+
+if __name__ == "__main__":
+    root = sys.argv[1] if len(sys.argv) > 1 else DERIVED
+    report = validate_region(root)
+    report.print_summary()
+    sys.exit(0 if report.ok else 1)
@@ -1,6 +1,7 @@
 import os
 import xarray as xr
 from organized.config import settings
+from organized.scripts.wb import aggregation, ensemble, prefetch, storage, working_cache
 
 def pr_to_mmday(da):
     u = str(da.attrs.get('units','')).lower().replace('**','^')
@@ -13,11 +14,10 @@ def pr_to_mmday(da):
     out.attrs['units'] = 'mm/day'
     return out
 
-def process_domain(input_dir, output_dir, dom):
-    """Read pr from input_dir/dom, pet from output_dir/dom; write wb to output_dir/dom."""
-    in_path = os.path.join(input_dir, dom)
-    out_path = os.path.join(output_dir, dom)
-    os.makedirs(out_path, exist_ok=True)
+def domain_paths(input_dir, output_dir, dom, member=None):
+    """(pr file, pet file, output dir) for dom[/member], or None when P or PET is missing."""
+    in_path = os.path.join(input_dir, dom, *([member] if member else []))
+    out_path = os.path.join(output_dir, dom, *([member] if member else []))
 
     p_pr = os.path.join(in_path, f'pr_{dom}.nc')
     p_pet = os.path.join(out_path, f'pet_{dom}.nc')
@@ -26,48 +26,84 @@ def process_domain(input_dir, output_dir, dom):
             p_pr = os.path.join(in_path, 'pr.nc')
             p_pet = os.path.join(out_path, 'pet.nc')
         else:
-            print(f'    ⚠️ Missing P or PET for {dom} (skipping)')
-            return
+            return None
+    return p_pr, p_pet, out_path
+
+def read_inputs(paths):
+    """P (mm/day) and PET loaded into memory from the files returned by domain_paths."""
+    p_pr, p_pet, _ = paths
+    with xr.open_dataset(p_pr) as dsP, xr.open_dataset(p_pet) as dsE:
+        P = pr_to_mmday(dsP['pr' if 'pr' in dsP else 'precip']).load()
+        PET = dsE['pet'].load()
+    return P, PET
+
+def process_domain(input_dir, output_dir, dom, member=None, inputs=None, writer=None):
+    """
+    Read pr from input_dir/dom[/member], pet from output_dir/dom[/member]; write wb next to the pet.
+    inputs: (P, PET) already read (see run); writer: AsyncWriter for the outputs.
+    """
+    paths = domain_paths(input_dir, output_dir, dom, member)
+    if paths is None:
+        print(f'    ⚠️ Missing P or PET for {dom} (skipping)')
+        return
+    out_path = paths[2]
+    os.makedirs(out_path, exist_ok=True)
+    writer = writer or prefetch.AsyncWriter(depth=0)
 
     try:
         print(f'    Calculating Water Balance for {dom}...')
-        with xr.open_dataset(p_pr) as dsP, xr.open_dataset(p_pet) as dsE:
-            P = pr_to_mmday(dsP['pr' if 'pr' in dsP else 'precip'])
-            PET = dsE['pet']
-            WB = (P - PET).rename('wb_mmday')
-            WB.attrs['units'] = 'mm/day'
+        P, PET = inputs if inputs is not None else read_inputs(paths)
+        WB = (P - PET).rename('wb_mmday')
+        WB.attrs['units'] = 'mm/day'
 
-            out = os.path.join(out_path, f'wb_{dom}.nc')
-            xr.Dataset({'p_mmday': P, 'pet_mmday': PET, 'wb_mmday': WB}).to_netcdf(
-                out, encoding={k: {'zlib': True, 'complevel': 4} for k in ['p_mmday', 'pet_mmday', 'wb_mmday']})
-            print(f'    ✅ Wrote {out}')
+        out = os.path.join(out_path, f'wb_{dom}.nc')
+        daily = {'p_mmday': P, 'pet_mmday': PET}
+        if not settings.LEAN_WB:
+            daily['wb_mmday'] = WB
+        writer.submit(storage.to_netcdf, xr.Dataset(daily), out,
+                      label=f'{out}{" (lean)" if settings.LEAN_WB else ""}')
+        if working_cache.enabled():
+            # Queued after the wb file, so the cache entry is stamped with the final file.
+            writer.submit(working_cache.write, out, {'p_mmday': P, 'pet_mmday': PET, 'wb_mmday': WB})
 
-            out_agg = os.path.join(out_path, f'wb_agg_{dom}.nc')
-            xr.Dataset({
-                'p_mon': P.resample(time='MS').sum('time'),
-                'pet_mon': PET.resample(time='MS').sum('time'),
-                'wb_mon': WB.resample(time='MS').sum('time'),
-                'p_ann': P.resample(time='YS').sum('time'),
-                'pet_ann': PET.resample(time='YS').sum('time'),
-                'wb_ann': WB.resample(time='YS').sum('time'),
-            }).to_netcdf(out_agg)
-        print(f'    ✅ Wrote {out_agg}')
+        out_agg = os.path.join(out_path, f'wb_agg_{dom}.nc')
+        agg = aggregation.aggregate({'p': P, 'pet': PET, 'wb': WB}, ('MS', 'YS'))
+        writer.submit(storage.to_netcdf, xr.Dataset({
+            f'{name}_{suffix}': agg[(name, freq)]
+            for name in ('p', 'pet', 'wb') for freq, suffix in (('MS', 'mon'), ('YS', 'ann'))
+        }), out_agg, label=out_agg)
     except Exception as e:
         print(f'    ❌ Error in Water Balance for {dom}: {e}')
 
-def run(region_pairs=None):
+def run(region_pairs=None, registry=None):
     """
     Run WB calculation. region_pairs: list of (input_dir, output_dir). Reads pr from input, pet from output; writes wb to output.
+    registry: RegionRegistry whose regions are processed when region_pairs is None.
     """
     print("\n" + "="*60)
     print("STEP 3: WATER BALANCE & AGGREGATION")
     print("="*60)
+    if region_pairs is None and registry is not None:
+        region_pairs = registry.pairs()
     if region_pairs is None:
         region_pairs = [(settings.DERIVED_DIR, settings.DERIVED_DIR)]
-    for input_dir, output_dir in region_pairs:
-        print(f"\nProcessing: {input_dir} -> {output_dir}")
-        for dom in settings.DOMAINS:
-            process_domain(input_dir, output_dir, dom)
+    # The next domain's P/PET are read on a background thread and the outputs are written on
+    # another while the current domain is computed.
+    with prefetch.AsyncWriter() as writer:
+        for input_dir, output_dir in region_pairs:
+            print(f"\nProcessing: {input_dir} -> {output_dir}")
+            single = [dom for dom in settings.DOMAINS
+                      if not ensemble.run_members(process_domain, input_dir, output_dir, dom)]
+
+            def _load(dom):
+                paths = domain_paths(input_dir, output_dir, dom)
+                return read_inputs(paths) if paths else None
+
+            for dom, inputs, err in prefetch.prefetch(single, _load):
+                if err is not None:
+                    print(f'    ❌ Error in Water Balance for {dom}: {err}')
+                    continue
+                process_domain(input_dir, output_dir, dom, inputs=inputs, writer=writer)
 
 if __name__ == "__main__":
     run()
@@ -2,28 +2,20 @@
 import sys
 import os
 import numpy as np
-import xarray as xr
 import matplotlib.pyplot as plt
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
 from organized.config import settings
+from organized.scripts.wb import datasets, storage, window_stats
 
 DOMS = settings.DOMAINS
 
-WIN = [("1981","2010"),("2021","2050"),("2041","2070"),("2071","2100")]
-LAB = ["1981–2010","2021–2050","2041–2070","2071–2100"]
+WIN = [settings.WINDOWS[k] for k in ("base", "cercano", "medio", "tardio")]
+LAB = [f"{t0}–{t1}" for t0, t1 in WIN]
 PALETTE = settings.PALETTE
 
-def wlat(lat): return xr.DataArray(np.cos(np.deg2rad(lat)), coords={'lat':lat}, dims=['lat'])
-def wmean(da): return da.weighted(wlat(da['lat'])).mean(("lat","lon"))
-
 def load_series(data_dir, dom):
-    p = os.path.join(data_dir, dom, f"wb_{dom}.nc")
-    if not os.path.exists(p):
-        p = os.path.join(data_dir, dom, "wb.nc")
-        if not os.path.exists(p):
-            return None
-    return xr.open_dataset(p)
+    return datasets.open_wb_domain(data_dir, dom)
 
 def run(region_codes=None):
     print("\n" + "="*60)
@@ -37,6 +29,7 @@ def run(region_codes=None):
         print(f"Procesando región: {region_info['name']} ({output_dir})")
 
         ds_map = {d: load_series(output_dir, d) for d in DOMS}
+        ds_paths = {d: storage.wb_path(output_dir, d) for d in DOMS}
 
         for var,label,fac in [("p_mmday","Precipitación (mm/año)", 365.0),
                               ("pet_mmday","Evapotranspiración Potencial (mm/año)", 365.0),
@@ -54,13 +47,11 @@ def run(region_codes=None):
 
                 if var_in_file not in ds: continue
 
+                st = window_stats.stats(ds_paths[dom], var_in_file, WIN)
                 for j, (t0, t1) in enumerate(WIN):
-                    try:
-                        daily_mean = wmean(ds[var_in_file])
-                        window_mean = daily_mean.sel(time=slice(f"{t0}-01-01", f"{t1}-12-31")).mean("time")
-                        vals[i,j] = float(window_mean.item()) * fac
-                    except Exception:
-                        pass
+                    w = window_stats.select(st, t0, t1)
+                    if w is not None:
+                        vals[i,j] = float(w["area_mean"]) * fac
 
 
             fig, ax = plt.subplots(figsize=(10, 4))
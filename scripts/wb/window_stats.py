@@ -0,0 +1,134 @@
+import os
+import threading
+import numpy as np
+import xarray as xr
+from organized.config import settings
+from organized.scripts.wb import datasets, run_scope, storage
+
+BLOCK_DAYS = 3650
+
+_cache = {}
+_users = {}
+_lock = threading.Lock()
+
+def window_key(t0, t1):
+    return f"{int(t0)}-{int(t1)}"
+
+def all_windows(extra=None):
+    """Union of settings.WINDOWS, settings.MAP_WINDOWS and any extra (t0, t1) pairs."""
+    wins = set()
+    for w in list(settings.WINDOWS.values()) + list(settings.MAP_WINDOWS.values()) + list(extra or []):
+        wins.add((int(w[0]), int(w[1])))
+    return sorted(wins)
+
+def _segments(years, windows):
+    """
+    Splits the time axis at every window boundary so overlapping windows can be
+    rebuilt from disjoint segments. Returns (segment id per step, window x segment membership).
+    """
+    bounds = sorted({t0 for t0, _ in windows} | {t1 + 1 for _, t1 in windows})
+    seg = np.searchsorted(bounds, years, side="right") - 1
+    seg[(years < bounds[0]) | (years >= bounds[-1])] = -1
+    lo = np.asarray(bounds[:-1])
+    hi = np.asarray(bounds[1:]) - 1
+    member = np.array([(lo >= t0) & (hi <= t1) for t0, t1 in windows], dtype=float)
+    return seg, member
+
+def _area_weights(lat, nlon):
+    w = np.cos(np.deg2rad(np.asarray(lat, dtype=float)))
+    return np.repeat(w[:, None], nlon, axis=1)
+
+def compute(da, windows):
+    """
+    Means, sums and standard deviations of a daily (time, lat, lon) field for every
+    window, gridded and area-weighted (cos lat), in a single blocked pass over time.
+    """
+    years = da["time"].dt.year.values
+    seg, member = _segments(years, windows)
+    nseg = member.shape[1]
+    ny, nx = da.sizes["lat"], da.sizes["lon"]
+    w = _area_weights(da["lat"].values, nx)
+
+    s1 = np.zeros((nseg, ny, nx)); s2 = np.zeros((nseg, ny, nx)); n = np.zeros((nseg, ny, nx))
+    a1 = np.zeros(nseg); a2 = np.zeros(nseg); an = np.zeros(nseg)
+
+    da = da.transpose("time", "lat", "lon")
+    for start in range(0, da.sizes["time"], BLOCK_DAYS):
+        sl = slice(start, start + BLOCK_DAYS)
+        bseg = seg[sl]
+        if (bseg < 0).all():
+            continue
+        vals = np.asarray(da.isel(time=sl).values, dtype=float)
+        valid = np.isfinite(vals)
+        v0 = np.where(valid, vals, 0.0)
+        wv = (w[None] * valid).sum((1, 2))
+        area = np.where(wv > 0, (v0 * w[None]).sum((1, 2)) / np.where(wv > 0, wv, 1), np.nan)
+        for k in np.unique(bseg[bseg >= 0]):
+            m = bseg == k
+            s1[k] += v0[m].sum(0); s2[k] += (v0[m] ** 2).sum(0); n[k] += valid[m].sum(0)
+            am = area[m]; am = am[np.isfinite(am)]
+            a1[k] += am.sum(); a2[k] += (am ** 2).sum(); an[k] += am.size
+
+    S1 = np.tensordot(member, s1, 1); S2 = np.tensordot(member, s2, 1); N = np.tensordot(member, n, 1)
+    A1 = member @ a1; A2 = member @ a2; AN = member @ an
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(N > 0, S1 / N, np.nan)
+        std = np.sqrt(np.clip(np.where(N > 0, S2 / N, np.nan) - mean ** 2, 0, None))
+        amean = np.where(AN > 0, A1 / AN, np.nan)
+        astd = np.sqrt(np.clip(np.where(AN > 0, A2 / AN, np.nan) - amean ** 2, 0, None))
+
+    coords = {"window": [window_key(*w_) for w_ in windows], "lat": da["lat"].values, "lon": da["lon"].values}
+    dims = ("window", "lat", "lon")
+    return xr.Dataset(
+        {
+            "mean": (dims, mean), "sum": (dims, np.where(N > 0, S1, np.nan)), "std": (dims, std), "count": (dims, N),
+            "area_mean": ("window", amean), "area_std": ("window", astd), "area_count": ("window", AN),
+        },
+        coords=coords,
+    )
+
+def stats(path, var, windows=None):
+    """Cached window statistics of var in the NetCDF at path (wb files expose wb_mmday even when lean)."""
+    wins = all_windows(windows)
+    key = (os.path.abspath(path), var, tuple(wins))
+    with _lock:
+        _users.setdefault(key, set()).add(run_scope.current())
+        if key in _cache:
+            return _cache[key]
+    ds = datasets.open_wb(path)
+    if var not in ds or "time" not in ds[var].dims:
+        return None
+    out = compute(ds[var], wins)
+    with _lock:
+        _cache[key] = out
+    return out
+
+def for_domain(data_dir, dom, var, windows=None):
+    p = storage.wb_path(data_dir, dom)
+    return stats(p, var, windows) if p else None
+
+def select(st, t0, t1):
+    """Statistics of one window, or None when the window has no data."""
+    if st is None:
+        return None
+    key = window_key(t0, t1)
+    if key not in st["window"].values:
+        return None
+    w = st.sel(window=key)
+    if float(w["area_count"]) == 0:
+        return None
+    return w
+
+def clear_cache():
+    with _lock:
+        _cache.clear()
+        _users.clear()
+
+def release(run_id):
+    """Drops the statistics used by run_id that no other active run still uses."""
+    with _lock:
+        for key in [k for k, users in _users.items() if run_id in users]:
+            _users[key].discard(run_id)
+            if not run_scope.in_use(_users[key], run_id):
+                del _users[key]
+                _cache.pop(key, None)
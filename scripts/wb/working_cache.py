@@ -0,0 +1,175 @@
+"""
+Opt-in uncompressed working cache of the daily WB cubes (settings.WORKING_CACHE).
+
+The WB stage writes p_mmday, pet_mmday and wb_mmday of every wb_<dom>.nc as raw float32
+.npy arrays (plus the time/lat/lon axes) under WORKING_CACHE_DIR, within WORKING_CACHE_MB.
+datasets.open_wb then serves those files as np.memmap-backed datasets, so the plot modules
+slice them without decompressing the NetCDF again. An entry is only used while the source
+file is unchanged. When a plot run ends (generate_plots) the entries it used are deleted
+unless another running session still uses them; the rest go when the process exits.
+"""
+import atexit
+import gc
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import numpy as np
+import xarray as xr
+from organized.config import settings
+from organized.scripts.wb import run_scope
+
+BLOCK_DAYS = 3650
+
+_open = {}
+_users = {}
+_pending = set()
+_lock = threading.Lock()
+
+
+def enabled():
+    return settings.WORKING_CACHE
+
+
+def root():
+    return settings.WORKING_CACHE_DIR or os.path.join(tempfile.gettempdir(), "ffla_working_cache")
+
+
+def _stamp(path):
+    st = os.stat(path)
+    return f"{os.path.abspath(path)}:{st.st_size}:{st.st_mtime_ns}"
+
+
+def entry_dir(source):
+    return os.path.join(root(), hashlib.sha1(os.path.abspath(source).encode()).hexdigest()[:16])
+
+
+def usage():
+    """Bytes currently held by the cache directory."""
+    total = 0
+    for dirpath, _, files in os.walk(root()):
+        for f in files:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, f))
+            except OSError:
+                pass
+    return total
+
+
+def write(source, arrays):
+    """
+    Writes the (time, lat, lon) arrays of the already written wb file `source` as float32 .npy.
+    Skipped when it would exceed WORKING_CACHE_MB. meta.json is written last and marks the entry valid.
+    """
+    if not enabled():
+        return None
+    first = next(iter(arrays.values())).transpose("time", "lat", "lon")
+    need = 4 * first.size * len(arrays)
+    d = entry_dir(source)
+    if os.path.isdir(d):
+        shutil.rmtree(d, ignore_errors=True)
+    if usage() + need > settings.WORKING_CACHE_MB * 2**20:
+        print(f"    ⚠️ Caché de trabajo llena ({settings.WORKING_CACHE_MB} MB): {os.path.basename(source)} no se cachea")
+        return None
+    os.makedirs(d, exist_ok=True)
+    with _lock:
+        _users.setdefault(d, set()).add(run_scope.current())
+    for name, da in arrays.items():
+        da = da.transpose("time", "lat", "lon")
+        mm = np.lib.format.open_memmap(os.path.join(d, f"{name}.npy"), mode="w+", dtype="float32", shape=da.shape)
+        for start in range(0, da.shape[0], BLOCK_DAYS):
+            sl = slice(start, start + BLOCK_DAYS)
+            mm[sl] = np.asarray(da.isel(time=sl).values, dtype="float32")
+        mm.flush()
+        del mm
+    for axis in ("time", "lat", "lon"):
+        np.save(os.path.join(d, f"{axis}.npy"), first[axis].values, allow_pickle=True)
+    with open(os.path.join(d, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({"source": os.path.abspath(source), "stamp": _stamp(source), "vars": list(arrays)}, f)
+    print(f"    ✅ Caché de trabajo: {os.path.basename(source)} ({need / 2**20:.0f} MB)")
+    return d
+
+
+def open_wb(source):
+    """memmap-backed Dataset for the wb file `source`, or None when there is no valid entry."""
+    if not enabled() or source is None:
+        return None
+    d = entry_dir(source)
+    with _lock:
+        if d in _open:
+            _users.setdefault(d, set()).add(run_scope.current())
+            return _open[d]
+        meta_path = os.path.join(d, "meta.json")
+        if not os.path.exists(meta_path) or not os.path.exists(source):
+            return None
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("stamp") != _stamp(source):
+                return None
+            coords = {a: np.load(os.path.join(d, f"{a}.npy"), allow_pickle=True) for a in ("time", "lat", "lon")}
+            data = {v: (("time", "lat", "lon"), np.load(os.path.join(d, f"{v}.npy"), mmap_mode="r"),
+                        {"units": "mm/day"}) for v in meta["vars"]}
+        except Exception as e:
+            print(f"    ⚠️ Caché de trabajo inválida para {os.path.basename(source)}: {e}")
+            return None
+        ds = xr.Dataset(data, coords=coords)
+        _open[d] = ds
+        _users.setdefault(d, set()).add(run_scope.current())
+        return ds
+
+
+def _remove(dirs):
+    """
+    Deletes entry directories. meta.json goes first, so a half-deleted entry is never served;
+    directories still locked by a live memmap (Windows) are kept in _pending and retried.
+    """
+    gc.collect()
+    removed, failed = 0, []
+    for d in dirs:
+        try:
+            meta = os.path.join(d, "meta.json")
+            if os.path.exists(meta):
+                os.remove(meta)
+            shutil.rmtree(d)
+            removed += 1
+        except FileNotFoundError:
+            removed += 1
+        except OSError:
+            failed.append(d)
+    with _lock:
+        _pending.difference_update(dirs)
+        _pending.update(failed)
+    if removed:
+        print(f"Removed {removed} working-cache entr{'y' if removed == 1 else 'ies'}")
+    if failed:
+        print(f"⚠️ {len(failed)} entrada(s) de la caché de trabajo siguen en uso; se reintentará: {root()}")
+
+
+def release(run_id):
+    """Deletes the entries used by run_id (see run_scope) that no other active run is using."""
+    with _lock:
+        drop = list(_pending)
+        for d in [d for d, users in _users.items() if run_id in users]:
+            _users[d].discard(run_id)
+            if not run_scope.in_use(_users[d], run_id, unscoped=False):
+                del _users[d]
+                _open.pop(d, None)
+                drop.append(d)
+    if drop:
+        _remove(drop)
+
+
+def clear():
+    """Drops the memmaps and deletes every entry written or used by this process."""
+    with _lock:
+        _open.clear()
+        dirs = list(set(_users) | _pending)
+        _users.clear()
+    if dirs:
+        _remove(dirs)
+
+
+atexit.register(clear)
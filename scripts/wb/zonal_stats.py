@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Zonal statistics over a polygon layer (parishes, cantons, ...).
+
+A sparse (polygon x cell) weight matrix -- area fraction of each grid cell inside each polygon
+times cos(lat) -- is built once per layer and grid and cached under the region outputs. Every
+reduction is then a single sparse mat-mul over the flattened grid (all polygons, all years),
+with missing cells dropped through a second mat-mul of the validity mask.
+"""
+import argparse
+import hashlib
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import shapely
+from scipy import sparse
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
+from organized.config import settings
+from organized.scripts.wb import aggregation, datasets, geometry, kernels, storage
+from organized.scripts.wb.map_render import grid_edges
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+HIST = "historical_ecuador"
+DRY_THRESH_MM = 1.0
+CDD_BLOCK_YEARS = 10
+ANNUAL_VARS = {"P_mm": "p_ann", "PET_mm": "pet_ann", "WB_mm": "wb_ann"}
+DELTA_COLS = ("P_mm", "PET_mm", "WB_mm", "AI", "CDD_days")
+
+_weights = {}
+
+
+def _stamp(path):
+    st = os.stat(path)
+    return f"{os.path.abspath(path)}:{st.st_size}:{st.st_mtime_ns}"
+
+
+def build_weights(gdf, lat, lon):
+    """CSR (n_polygons, n_lat * n_lon) matrix of cell area fraction x cos(lat), cells in (lat, lon) order."""
+    ey, ex = grid_edges(lat, lon)
+    y0, y1 = np.minimum(ey[:-1], ey[1:]), np.maximum(ey[:-1], ey[1:])
+    x0, x1 = np.minimum(ex[:-1], ex[1:]), np.maximum(ex[:-1], ex[1:])
+    X0, Y0 = np.meshgrid(x0, y0)
+    X1, Y1 = np.meshgrid(x1, y1)
+    cells = shapely.box(X0.ravel(), Y0.ravel(), X1.ravel(), Y1.ravel())
+    cell_area = shapely.area(cells)
+    coslat = np.repeat(np.cos(np.deg2rad(np.asarray(lat, dtype=float))), len(lon))
+    tree = shapely.STRtree(cells)
+    rows, cols, vals = [np.zeros(0, int)], [np.zeros(0, int)], [np.zeros(0)]
+    for i, geom in enumerate(gdf.geometry):
+        idx = tree.query(geom, predicate="intersects")
+        if idx.size == 0:
+            continue
+        frac = shapely.area(shapely.intersection(cells[idx], geom)) / cell_area[idx]
+        keep = frac > 0
+        rows.append(np.full(int(keep.sum()), i))
+        cols.append(idx[keep])
+        vals.append(frac[keep] * coslat[idx[keep]])
+    return sparse.csr_matrix((np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))),
+                             shape=(len(gdf), cells.size))
+
+
+def weights(layer_path, lat, lon, cache_dir=None):
+    """Weight matrix for layer_path on the (lat, lon) grid, cached in memory and as .npz in cache_dir."""
+    lat, lon = np.asarray(lat, dtype=float), np.asarray(lon, dtype=float)
+    key = hashlib.sha1((_stamp(layer_path) + "|").encode() + lat.tobytes() + lon.tobytes()).hexdigest()[:16]
+    if key in _weights:
+        return _weights[key]
+    cache = os.path.join(cache_dir, f"zonal_weights_{key}.npz") if cache_dir else None
+    if cache and os.path.exists(cache):
+        W = sparse.load_npz(cache).tocsr()
+    else:
+        W = build_weights(geometry.features(layer_path), lat, lon)
+        if cache:
+            os.makedirs(cache_dir, exist_ok=True)
+            sparse.save_npz(cache, W)
+    _weights[key] = W
+    return W
+
+
+def zonal_mean(W, X):
+    """Weighted polygon means of X (n_steps, n_cells) ignoring NaN cells -> (n_steps, n_polygons)."""
+    valid = np.isfinite(X)
+    num = W @ np.where(valid, X, 0.0).T
+    den = W @ valid.T.astype(float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(den > 0, num / den, np.nan).T
+
+
+def _flat(da):
+    da = da.transpose("time", "lat", "lon")
+    return np.asarray(da.values, dtype=float).reshape(da.sizes["time"], -1)
+
+
+def cell_cdd(p_daily):
+    """Longest run of days with P < DRY_THRESH_MM per year and cell -> (years, (n_years, n_cells))."""
+    p_daily = p_daily.transpose("time", "lat", "lon")
+    index = aggregation.time_index(p_daily["time"])
+    starts, _ = index.segments("YS")
+    ends = np.r_[starts[1:], len(index)]
+    out = np.full((starts.size, p_daily.sizes["lat"] * p_daily.sizes["lon"]), np.nan)
+    for k0 in range(0, starts.size, CDD_BLOCK_YEARS):
+        k1 = min(k0 + CDD_BLOCK_YEARS, starts.size)
+        v = _flat(p_daily.isel(time=slice(starts[k0], ends[k1 - 1])))
+        local = starts[k0:k1] - starts[k0]
+        runs = kernels.max_runs(v < DRY_THRESH_MM, local)
+        out[k0:k1] = np.where(np.add.reduceat(np.isfinite(v), local, axis=0) > 0, runs, np.nan)
+    return index.year[starts], out
+
+
+def domain_table(output_dir, dom, W, lat, lon):
+    """Annual P, PET, WB, AI and CDD per polygon for one scenario (long format)."""
+    p_agg = storage.agg_path(output_dir, dom)
+    if p_agg is None:
+        return None
+    agg = datasets.open_dataset(p_agg)
+    if agg.sizes.get("lat") != len(lat) or agg.sizes.get("lon") != len(lon):
+        print(f"  ⚠️ {dom}: malla distinta a la de los pesos (omitido)")
+        return None
+    years = agg["p_ann"]["time"].dt.year.values
+    cols = {c: zonal_mean(W, _flat(agg[v])) for c, v in ANNUAL_VARS.items() if v in agg}
+    if "P_mm" in cols and "PET_mm" in cols:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            cols["AI"] = np.where(cols["PET_mm"] > 0, cols["P_mm"] / cols["PET_mm"], np.nan)
+    wb = datasets.open_wb_domain(output_dir, dom)
+    if wb is not None and "p_mmday" in wb:
+        cy, cdd = cell_cdd(wb["p_mmday"])
+        z = zonal_mean(W, cdd)
+        cols["CDD_days"] = np.full((years.size, W.shape[0]), np.nan)
+        pos = np.searchsorted(years, cy)
+        ok = (pos < years.size) & (years[np.minimum(pos, years.size - 1)] == cy)
+        cols["CDD_days"][pos[ok]] = z[ok]
+
+    npoly = W.shape[0]
+    df = pd.DataFrame({
+        "polygon": np.tile(np.arange(npoly), years.size),
+        "scenario": dom.replace("_ecuador", ""),
+        "year": np.repeat(years, npoly),
+    })
+    for c, a in cols.items():
+        df[c] = a.ravel()
+    return df
+
+
+def window_table(annual):
+    """Window means per polygon and scenario, with deltas against the historical base window."""
+    rows = []
+    for name, (t0, t1) in settings.WINDOWS.items():
+        sel = annual[(annual["year"] >= t0) & (annual["year"] <= t1)]
+        if sel.empty:
+            continue
+        m = sel.groupby(["scenario", "polygon"], as_index=False).mean(numeric_only=True).drop(columns="year")
+        m.insert(1, "window", name)
+        m.insert(2, "period", f"{t0}-{t1}")
+        rows.append(m)
+    if not rows:
+        return None
+    win = pd.concat(rows, ignore_index=True)
+    base = win[(win["scenario"] == HIST.replace("_ecuador", "")) & (win["window"] == "base")]
+    base = base.set_index("polygon")[[c for c in DELTA_COLS if c in win]]
+    for c in base.columns:
+        win[f"d{c}"] = win[c] - win["polygon"].map(base[c])
+    return win
+
+
+def write_table(df, path_stem):
+    """Parquet when pyarrow is available, CSV otherwise. Returns the written path."""
+    if pyarrow is not None:
+        out = path_stem + ".parquet"
+        df.to_parquet(out, index=False)
+    else:
+        out = path_stem + ".csv"
+        df.to_csv(out, index=False)
+    return out
+
+
+def _labels(gdf, id_field=None):
+    if id_field is None:
+        text = [c for c in gdf.columns if c != gdf.geometry.name and gdf[c].dtype == object]
+        id_field = text[0] if text else None
+    if id_field is None or id_field not in gdf.columns:
+        return pd.Series(np.arange(len(gdf)).astype(str))
+    return gdf[id_field].astype(str).reset_index(drop=True)
+
+
+def region_tables(output_dir, layer_path, id_field=None):
+    """(annual, windows) zonal tables for every polygon of layer_path on the region grid."""
+    grid = None
+    for dom in settings.DOMAINS:
+        p = os.path.join(output_dir, dom, f"wb_agg_{dom}.nc")
+        if os.path.exists(p):
+            ds = datasets.open_dataset(p)
+            grid = (ds["lat"].values, ds["lon"].values)
+            break
+    if grid is None:
+        return None, None
+    gdf = geometry.features(layer_path)
+    if gdf is None or gdf.empty:
+        return None, None
+    W = weights(layer_path, *grid, cache_dir=os.path.join(output_dir, "zonal_cache"))
+    parts = [t for t in (domain_table(output_dir, dom, W, *grid) for dom in settings.DOMAINS) if t is not None]
+    if not parts:
+        return None, None
+    annual = pd.concat(parts, ignore_index=True)
+    windows = window_table(annual)
+    labels = _labels(gdf, id_field)
+    for df in (annual, windows):
+        if df is not None:
+            df.insert(1, "polygon_name", df["polygon"].map(labels))
+    return annual, windows
+
+
+def run(region_codes=None, layer_path=None, id_field=None):
+    print("\n" + "="*60)
+    print("ZONAL STATISTICS TABLES")
+    print("="*60)
+    layer_path = layer_path or settings.ZONAL_POLYGONS
+    id_field = id_field or settings.ZONAL_ID_FIELD or None
+
+    for region_code, region_info in settings.iter_regions(region_codes):
+        output_dir = settings.get_region_output_dir(region_code)
+        layer = layer_path or region_info.get("shapefile")
+        if not layer or not os.path.exists(layer):
+            print(f"  ⚠️ Sin capa de polígonos para {region_info['name']}"); continue
+        print(f"Processing region: {region_info['name']} ({os.path.basename(layer)})")
+        annual, windows = region_tables(output_dir, layer, id_field)
+        if annual is None:
+            print(f"  ⚠️ Sin wb_agg para {region_info['name']}"); continue
+        out_dir = os.path.join(output_dir, settings.OUT_CAT_RESUMEN)
+        os.makedirs(out_dir, exist_ok=True)
+        print(f"  ✅ Wrote {os.path.basename(write_table(annual, os.path.join(out_dir, 'zonal_annual')))} "
+              f"({annual['polygon'].nunique()} polígonos)")
+        if windows is not None:
+            print(f"  ✅ Wrote {os.path.basename(write_table(windows, os.path.join(out_dir, 'zonal_windows')))}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Zonal P/PET/WB/AI/CDD tables for a polygon layer")
+    parser.add_argument("layer", nargs="?", default=None, help="Polygon layer (default: each region's shapefile)")
+    parser.add_argument("--id-field", default=None, help="Attribute used as polygon name")
+    args = parser.parse_args()
+    run(layer_path=args.layer, id_field=args.id_field)